@@ -8,15 +8,19 @@
 import token as token
 
 class ASTNode(object):
-    """The base class for the abstract syntax tree."""
+    """The base class for the abstract syntax tree. Every node class
+    lists its fields in __slots__ (no per-node __dict__)."""
+    __slots__ = ()
     def accept(self, visitor): pass
 
 class Stmt(ASTNode):
     """The base class for all statement nodes."""
+    __slots__ = ()
     def accept(self, visitor): pass
 
 class StmtList(ASTNode):
     """A statement list consists of a list of statements."""
+    __slots__ = ('stmts',)
     def __init__(self):
         self.stmts = []     # list of Stmt
     def accept(self, visitor):
@@ -24,10 +28,12 @@ class StmtList(ASTNode):
 
 class Expr(ASTNode):
     """The base class for all expression nodes."""
+    __slots__ = ()
     def accept(self, visitor): pass
     
 class ExprStmt(Stmt):
     """A simple statement that is just an expression."""
+    __slots__ = ('expr',)
     def __init__(self):
         self.expr = None        # Expr node
     def accept(self, visitor):
@@ -37,16 +43,20 @@ class VarDeclStmt(Stmt):
     """A variable declaration statement consists of a variable identifier,
     an (optional) type, and an initial value.
     """
+    __slots__ = ('var_id', 'var_type', 'var_expr', 'depth', 'slot')
     def __init__(self):
         self.var_id = None      # Token (ID)
         self.var_type = None    # Token (STRINGTYPE, ..., ID)
         self.var_expr = None    # Expr node
+        self.depth = None       # frame of the variable (set by resolver.py)
+        self.slot = None        # index in the frame (set by resolver.py)
     def accept(self, visitor):
         visitor.visit_var_decl_stmt(self)
         
 class AssignStmt(Stmt):
     """An assignment statement consists of an identifier and an expression.
     """
+    __slots__ = ('lhs', 'rhs')
     def __init__(self):
         self.lhs = None     # LValue node
         self.rhs = None     # Expr node
@@ -57,6 +67,7 @@ class StructDeclStmt(Stmt):
     """A struct declaration statement consists of an identifier, and a
     list of variable declarations.
     """
+    __slots__ = ('struct_id', 'var_decls')
     def __init__(self):
         self.struct_id = None   # Token (id)
         self.var_decls = []     # [VarDeclStmt]
@@ -68,11 +79,13 @@ class FunDeclStmt(Stmt):
     of parameters (identifiers with types), a return type, and a list
     of function body statements.
     """
-    def __init(self):
+    __slots__ = ('fun_name', 'params', 'return_type', 'stmt_list', 'frame_size')
+    def __init__(self):
         self.fun_name = None            # Token (id)
         self.params = []                # List of FunParam
         self.return_type = None         # Token
         self.stmt_list = StmtList()     # StmtList
+        self.frame_size = None          # slots of a call's frame (set by resolver.py)
     def accept(self, visitor):
         visitor.visit_fun_decl_stmt(self)
 
@@ -80,6 +93,7 @@ class ReturnStmt(Stmt):
     """A return statement consist of a return expression and the
     corresponding return token (for printing line and column numbers).
     """
+    __slots__ = ('return_expr', 'return_token')
     def __init__(self):
         self.return_expr = None         # Expr
         self.return_token = None     # to keep track of location (e.g., return;)
@@ -90,6 +104,7 @@ class WhileStmt(Stmt):
     """A while statement consists of a condition (Boolean expression) and
     a statement list (the body of the while).
     """
+    __slots__ = ('bool_expr', 'stmt_list')
     def __init__(self):
         self.bool_expr = None         # a BoolExpr node
         self.stmt_list = StmtList()
@@ -100,6 +115,7 @@ class IfStmt(Stmt):
     """An if stmt consists of a basic if part, a (possibly empty) list of
     else ifs, and an optional else part (represented as a statementlist).
     """
+    __slots__ = ('if_part', 'elseifs', 'has_else', 'else_stmts')
     def __init__(self):
         self.if_part = BasicIf()
         self.elseifs = []
@@ -111,6 +127,7 @@ class IfStmt(Stmt):
 class SimpleExpr(Expr):
     """A simple expression consists of an RValue.
     """
+    __slots__ = ('term',)
     def __init__(self):
         self.term = None            # RValue
     def accept(self, visitor):
@@ -119,8 +136,10 @@ class SimpleExpr(Expr):
 class ComplexExpr(Expr):
     """A complex expression consist of an expression, followed by a
     mathematical operator (+, -, *, etc.), followed by another
-    (possibly complex) expression.
+    expression. Either operand may itself be complex; the parser nests
+    them by operator precedence (left associative).
     """
+    __slots__ = ('first_operand', 'math_rel', 'rest')
     def __init__(self):
         self.first_operand = None   # Expr node
         self.math_rel = None        # Token (+, -, *, etc.)
@@ -128,6 +147,18 @@ class ComplexExpr(Expr):
     def accept(self, visitor):
         visitor.visit_complex_expr(self)    
 
+class NaryExpr(Expr):
+    """An n-ary expression is a chain of three or more operands joined by
+    mathematical operators of the same precedence, evaluated left to
+    right (so a - b + c is (a - b) + c).
+    """
+    __slots__ = ('operands', 'math_rels')
+    def __init__(self):
+        self.operands = []          # [Expr node]
+        self.math_rels = []         # [Token] joining operands[i] and operands[i+1]
+    def accept(self, visitor):
+        visitor.visit_nary_expr(self)
+
 class BoolExpr(ASTNode):
     """A boolean expression consists of an expression, a Boolean relation
     (==, <=, !=, etc.), another expression, and possibly an 'and' or
@@ -135,6 +166,7 @@ class BoolExpr(ASTNode):
     expression can also be negated. Note that only the first_expr is
     required.
     """
+    __slots__ = ('first_expr', 'bool_rel', 'second_expr', 'bool_connector', 'rest', 'negated')
     def __init__(self):
         self.first_expr = None      # Expr node
         self.bool_rel = None        # Token (==, <=, !=, etc.)
@@ -148,14 +180,19 @@ class BoolExpr(ASTNode):
 class LValue(ASTNode):
     """A lvalue consist of a simple id or a path expression.
     """
+    __slots__ = ('path', 'depth', 'slot', 'fields')
     def __init__(self):
         self.path = []          # [Token (ID)] ... one implies simple var
+        self.depth = None       # frame of path[0] (set by resolver.py)
+        self.slot = None        # index in the frame (set by resolver.py)
+        self.fields = None      # loads path[1:-1] of path[0] (set by resolver.py)
     def accept(self, visitor):
         visitor.visit_lvalue(self)
 
 class FunParam(Stmt):
     """A function declaration parameter consists of a variable name (id)
     and a type."""
+    __slots__ = ('param_name', 'param_type')
     def __init__(self):
         self.param_name = None  # Token (id)
         self.param_type = None  # Token (id)
@@ -166,25 +203,41 @@ class BasicIf(object):
     """A basic if holds a condition (Boolean expression) and a list of
     statements (the body of the if).
     """
+    __slots__ = ('bool_expr', 'stmt_list')
     def __init__(self):
         self.bool_expr = None       # BoolExpr node
         self.stmt_list = StmtList()
 
 class RValue(ASTNode):
     """The base class for rvalue nodes."""
+    __slots__ = ()
     def accept(self, visitor): pass
 
 class SimpleRValue(RValue):
     """A simple rvalue consists of a single primitive value.
     """
+    __slots__ = ('val',)
     def __init__(self):
         self.val = None   # Token
     def accept(self, visitor):
         visitor.visit_simple_rvalue(self)
     
+class ConstRValue(SimpleRValue):
+    """A simple rvalue whose value is already decoded (made by the
+    optimizer, for literals and folded constant expressions). The token
+    locates it in the source.
+    """
+    __slots__ = ('value',)
+    def __init__(self):
+        SimpleRValue.__init__(self)
+        self.value = None       # int, float, bool, str or None (nil)
+    def accept(self, visitor):
+        visitor.visit_const_rvalue(self)
+
 class NewRValue(RValue):
     """A new rvalue consists of a struct name (id)
     """
+    __slots__ = ('struct_type',)
     def __init__(self):
         self.struct_type = None # Token (id)
     def accept(self, visitor):
@@ -194,17 +247,25 @@ class CallRValue(RValue):
     """A function call rvalue consists of a function name (id) and a list
     of arguments (expressions)
     """
+    __slots__ = ('fun', 'args', 'tail', 'builtin', 'text')
     def __init__(self):
         self.fun = None         # Token (id)
         self.args = []          # list of Expr
+        self.tail = False       # a self tail call (set by resolver.py)
+        self.builtin = None     # the called Builtin (set by resolver.py)
+        self.text = None        # the output of print("...") (set by resolver.py)
     def accept(self, visitor):
         visitor.visit_call_rvalue(self)
 
 class IDRvalue(RValue):
     """An identifier rvalue consists of a path of one or more identifiers.
     """
+    __slots__ = ('path', 'depth', 'slot', 'fields')
     def __init__(self):
         self.path = []          # List of Token (id)
+        self.depth = None       # frame of path[0] (set by resolver.py)
+        self.slot = None        # index in the frame (set by resolver.py)
+        self.fields = None      # loads path[1:] of path[0] (set by resolver.py)
     def accept(self, visitor):
         visitor.visit_id_rvalue(self)
 
@@ -222,11 +283,37 @@ class Visitor(object):
     def visit_if_stmt(self, if_stmt): pass
     def visit_simple_expr(self, simple_expr): pass
     def visit_complex_expr(self, complex_expr): pass
+    def visit_nary_expr(self, nary_expr): pass
     def visit_bool_expr(self, bool_expr): pass
     def visit_lvalue(self, lval): pass
     def visit_fun_param(self, fun_param): pass
     def visit_simple_rvalue(self, simple_rvalue): pass
+    def visit_const_rvalue(self, const_rvalue):
+        # visitors that don't know constants see the literal token
+        self.visit_simple_rvalue(const_rvalue)
     def visit_new_rvalue(self, new_rvalue): pass
     def visit_call_rvalue(self, call_rvalue): pass
     def visit_id_rvalue(self, id_rvalue): pass
-    
+
+
+def first_token(node):
+    """Returns the first token of an expression (to locate errors)"""
+    while True:
+        if isinstance(node, SimpleExpr):
+            node = node.term
+        elif isinstance(node, ComplexExpr):
+            node = node.first_operand
+        elif isinstance(node, NaryExpr):
+            node = node.operands[0]
+        elif isinstance(node, BoolExpr):
+            node = node.first_expr
+        elif isinstance(node, SimpleRValue):
+            return node.val
+        elif isinstance(node, NewRValue):
+            return node.struct_type
+        elif isinstance(node, CallRValue):
+            return node.fun
+        elif isinstance(node, IDRvalue):
+            return node.path[0]
+        else:
+            return None
@@ -0,0 +1,968 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   Benchmarks for the MyPL implementation. Programs are generated by
+#   repeating the programs in tests/. Usage: benchmark.py [name ...]
+#----------------------------------------------------------------------
+import collections
+import io
+import os
+import pickle
+import sys
+import time
+import tempfile
+import subprocess
+import shutil
+import ast
+import builtin_registry
+import cache
+import error
+import flat_ast
+import interpreter
+import lexer
+import mypl
+import optimizer
+import output
+import loop_optimizer
+import memo
+import parser
+import reader
+import regex_lexer
+import rope
+import symbol_table
+import token
+import type_checker
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests')
+
+
+def test_sources():
+    """Returns the source of every program in tests/"""
+    sources = []
+    for name in sorted(os.listdir(TESTS_DIR)):
+        if name.endswith('.mypl'):
+            with open(os.path.join(TESTS_DIR, name)) as f:
+                sources.append(f.read() + '\n')
+    return sources
+
+
+def generated_source(size):
+    """Returns a source of at least size characters built from tests/"""
+    chunk = ''.join(test_sources())
+    return chunk * (size // len(chunk) + 1)
+
+
+def best_time(fun, repeat=3):
+    """Returns the best wall time of repeat calls and the last result"""
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = fun()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def object_size(root):
+    """Returns the total size in bytes of root and of every object
+    reachable from it through containers, __dict__ and __slots__
+    (shared objects are counted once)
+    """
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or obj is None or isinstance(obj, (bool, type)):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                for slot in cls.__dict__.get('__slots__', ()):
+                    stack.append(getattr(obj, slot, None))
+    return total
+
+
+def count_tokens(the_lexer):
+    count = 0
+    while the_lexer.next_token().tokentype != token.EOS:
+        count += 1
+    return count
+
+
+def report(name, seconds, tokens, size):
+    print('  %-24s %8.3fs %12.0f tokens/s %8.2f MB/s' %
+          (name, seconds, tokens / seconds, size / seconds / 1e6))
+
+
+def bench_lexer():
+    """Token throughput of the lexer implementations"""
+    source = generated_source(500000)
+    with tempfile.NamedTemporaryFile('w', suffix='.mypl', delete=False) as f:
+        f.write(source)
+    lexers = [
+        ('stream', lambda stream: lexer.Lexer(stream, buffered=False)),
+        ('buffered', lexer.Lexer),
+        ('regex', regex_lexer.RegexLexer),
+    ]
+    try:
+        def run(make_lexer):
+            with open(f.name) as stream:
+                return count_tokens(make_lexer(stream))
+        for name, make_lexer in lexers:
+            seconds, tokens = best_time(lambda: run(make_lexer))
+            report(name, seconds, tokens, len(source))
+    finally:
+        os.remove(f.name)
+
+
+class DictToken(object):
+    """The original token layout: a per-instance __dict__, no interning"""
+    def __init__(self, tokentype, lexeme, line, column):
+        self.tokentype = tokentype
+        self.lexeme = lexeme
+        self.line = line
+        self.column = column
+
+
+def bench_tokens():
+    """Memory held by dict-based, slotted and columnar token streams"""
+    source = generated_source(1000000)
+    tokens = []
+    the_lexer = lexer.Lexer(io.StringIO(source))
+    while True:
+        the_token = the_lexer.next_token()
+        tokens.append(the_token)
+        if the_token.tokentype == token.EOS:
+            break
+    # copy each lexeme so the dict-based tokens share nothing, as before
+    dict_tokens = [DictToken(t.tokentype, (t.lexeme + ' ')[:-1], t.line, t.column)
+                   for t in tokens]
+    stream = token.TokenStream()
+    for the_token in tokens:
+        stream.append(the_token)
+    print('  %d tokens from %d bytes of source' % (len(tokens), len(source)))
+    for name, root in [('dict tokens', dict_tokens), ('slotted + interned', tokens),
+                       ('columnar stream', stream)]:
+        size = object_size(root)
+        print('  %-24s %12d bytes %8.1f bytes/token' % (name, size, size / len(tokens)))
+
+
+def parse_source(source):
+    return parser.Parser(lexer.Lexer(io.StringIO(source))).parse()
+
+
+def bench_parser():
+    """Parse 100k generated statements without raising the recursion limit"""
+    limit = sys.getrecursionlimit()
+    lines = ['var x = 0;', 'set x = x + 1;', 'print(itos(x));']
+    programs = [
+        ('100k top-level stmts', '\n'.join(lines[i % 3] for i in range(100000))),
+        ('100k stmts in a while', 'var x = 0;\nwhile x < 1 do\n' +
+         '\n'.join(lines[1 + i % 2] for i in range(100000)) + '\nend\n'),
+        ('10k elifs', 'var x = 0;\nif x == 0 then x;\n' +
+         ''.join('elif x == %d then x;\n' % i for i in range(10000)) + 'end\n'),
+    ]
+    for name, source in programs:
+        seconds, stmt_list = best_time(lambda: parse_source(source), 1)
+        assert sys.getrecursionlimit() == limit
+        print('  %-24s %8.3fs %10d top-level stmts' % (name, seconds, len(stmt_list.stmts)))
+
+
+def node_items(node):
+    """Returns the (field, value) pairs of an AST node (or BasicIf)"""
+    if hasattr(node, '__dict__'):
+        return list(node.__dict__.items())
+    return [(slot, getattr(node, slot, None)) for cls in type(node).__mro__
+            for slot in cls.__dict__.get('__slots__', ())]
+
+
+def node_fields(node):
+    """Returns the attribute values of an AST node (or BasicIf)"""
+    return [value for field, value in node_items(node)]
+
+
+class DictNode(object):
+    """A node with the original layout (fields in a per-instance __dict__)"""
+
+
+def ast_nodes(root):
+    """Returns every node (AST node, BasicIf or DictNode) under root"""
+    nodes = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        for value in node_fields(node):
+            for child in (value if isinstance(value, list) else [value]):
+                if isinstance(child, (ast.ASTNode, ast.BasicIf, DictNode)):
+                    stack.append(child)
+    return nodes
+
+
+def tree_depth(root):
+    """Returns the depth of the deepest node under root"""
+    depth = 0
+    stack = [(root, 1)]
+    while stack:
+        node, node_depth = stack.pop()
+        depth = max(depth, node_depth)
+        for value in node_fields(node):
+            children = value if isinstance(value, list) else [value]
+            for child in children:
+                if isinstance(child, (ast.ASTNode, ast.BasicIf, DictNode)):
+                    stack.append((child, node_depth + 1))
+    return depth
+
+
+def bench_expr():
+    """Parse and evaluate long generated arithmetic expressions"""
+    terms = 500
+    programs = [
+        ('500-term sum', ' + '.join(str(i) for i in range(terms))),
+        ('500-term mixed', ' + '.join('%d * 2 - 1' % i for i in range(terms // 2))),
+    ]
+    for name, expr in programs:
+        source = 'var x = 0;\n' + ('set x = %s;\n' % expr) * 200
+        seconds, stmt_list = best_time(lambda: parse_source(source), 1)
+        depth = tree_depth(stmt_list)
+        run_seconds, result = best_time(lambda: stmt_list.accept(interpreter.Interpreter()), 1)
+        print('  %-24s parse %7.3fs  run %7.3fs  tree depth %d' % (name, seconds, run_seconds, depth))
+
+
+MYPL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mypl.py')
+
+
+def run_mypl(args, stdin=subprocess.DEVNULL):
+    """Runs mypl.py in a child process, returns (seconds, max rss in KB)"""
+    start = time.perf_counter()
+    child = subprocess.Popen([sys.executable, MYPL] + args, stdin=stdin,
+                             stdout=subprocess.DEVNULL)
+    pid, status, usage = os.wait4(child.pid, 0)
+    child.returncode = os.waitstatus_to_exitcode(status)
+    assert child.returncode == 0, 'mypl.py %s failed' % ' '.join(args)
+    return time.perf_counter() - start, usage.ru_maxrss
+
+
+def bench_stream():
+    """Peak memory of batch vs streaming execution of a long driver script"""
+    source = ''.join('var x%d = %d;\nset x%d = x%d + 1;\nprint(itos(x%d));\n' % (i, i, i, i, i)
+                     for i in range(100000))
+    with tempfile.NamedTemporaryFile('w', suffix='.mypl', delete=False) as f:
+        f.write(source)
+    try:
+        print('  %d statements, %d bytes of source' % (300000, len(source)))
+        for name, args in [('batch', [f.name]), ('stream', ['--stream', f.name])]:
+            seconds, rss = run_mypl(args)
+            print('  %-24s %8.3fs %10d KB max rss' % (name, seconds, rss))
+    finally:
+        os.remove(f.name)
+
+
+def bench_cache():
+    """Cold (lex + parse + cache write) vs warm (cache load) start-up"""
+    source = ''.join('var x%d = %d;\nset x%d = x%d * 2 + 1;\n' % (i, i, i, i)
+                     for i in range(20000))
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'driver.mypl')
+    with open(filename, 'w') as f:
+        f.write(source)
+    try:
+        print('  %d statements, %d bytes of source' % (40000, len(source)))
+        seconds, rss = run_mypl(['--no-cache', filename])
+        print('  %-24s %8.3fs' % ('no cache', seconds))
+        seconds, rss = run_mypl([filename])
+        print('  %-24s %8.3fs' % ('cold', seconds))
+        seconds, rss = run_mypl([filename])
+        print('  %-24s %8.3fs' % ('warm', seconds))
+        size = os.path.getsize(cache.cache_path(filename))
+        print('  %-24s %8d bytes' % ('cached program', size))
+    finally:
+        shutil.rmtree(directory)
+
+
+def dict_tree(root):
+    """Returns a copy of an AST made of DictNodes"""
+    nodes = ast_nodes(root)
+    copies = {id(node): DictNode() for node in nodes}
+    def copy(value):
+        if isinstance(value, list):
+            return [copy(item) for item in value]
+        return copies.get(id(value), value)
+    for node in nodes:
+        for field, value in node_items(node):
+            setattr(copies[id(node)], field, copy(value))
+    return copies[id(root)]
+
+
+def nodes_size(nodes):
+    """Bytes held by the nodes themselves (and their lists and dicts)"""
+    size = 0
+    for node in nodes:
+        size += sys.getsizeof(node)
+        if hasattr(node, '__dict__'):
+            size += sys.getsizeof(node.__dict__)
+        for value in node_fields(node):
+            if isinstance(value, list):
+                size += sys.getsizeof(value)
+    return size
+
+
+def check_same(what, outputs):
+    """Exits with an error unless the outputs (of one program) are equal"""
+    outputs = list(outputs)
+    if len(set(outputs)) > 1:
+        sys.exit('%s: outputs differ' % what)
+
+
+def check_visitors():
+    """Runs the interpreter and the type checker over every program in
+    tests/, to catch visitors touching fields a node does not have (or
+    recursing without end): anything but a MyPLError fails"""
+    for name, source in zip(sorted(n for n in os.listdir(TESTS_DIR) if n.endswith('.mypl')),
+                            test_sources()):
+        results = []
+        # the interpreter resolves the program before running it
+        for check in [lambda stmt_list: interpreter.Interpreter().run(stmt_list),
+                      lambda stmt_list: stmt_list.accept(type_checker.TypeChecker())]:
+            previous_input = reader.use(reader.from_text('abc\n2.5\n' * 4))
+            previous = output.use(output.Output(output.MemorySink()))
+            try:
+                check(parse_source(source))
+                results.append('ok')
+            except error.MyPLError as e:
+                # an error in the program (a visitor bug raises anything else)
+                results.append(type(e).__name__)
+            finally:
+                reader.use(previous_input)
+                output.use(previous)
+        print('  %-24s interpreter: %-16s type checker: %s' % (name, results[0], results[1]))
+
+
+def bench_ast():
+    """Bytes per node and total AST size, dict-based vs slotted nodes"""
+    source = generated_source(1000000)
+    stmt_list = parse_source(source)
+    nodes = ast_nodes(stmt_list)
+    dict_list = dict_tree(stmt_list)
+    print('  %d nodes from %d bytes of source' % (len(nodes), len(source)))
+    for name, root in [('dict nodes', dict_list), ('slotted nodes', stmt_list)]:
+        node_bytes = nodes_size(ast_nodes(root))
+        print('  %-24s %6.1f bytes/node %12d bytes of nodes %12d bytes with tokens' %
+              (name, node_bytes / len(nodes), node_bytes, object_size(root)))
+    check_visitors()
+
+
+def bench_flat():
+    """Object tree vs flat (array-backed) AST: build, size, pickle, walk"""
+    source = generated_source(1000000)
+    seconds, stmt_list = best_time(lambda: parse_source(source))
+    print('  %-24s %8.3fs' % ('parse', seconds))
+    seconds, flat = best_time(lambda: parser.Parser(lexer.Lexer(io.StringIO(source))).parse_flat())
+    print('  %-24s %8.3fs' % ('parse_flat', seconds))
+    seconds, tree = best_time(flat.to_ast)
+    print('  %-24s %8.3fs' % ('to_ast', seconds))
+    print('  %d nodes (%d with list nodes)' % (len(ast_nodes(stmt_list)), len(flat)))
+    for name, program in [('object tree', stmt_list), ('flat ast', flat)]:
+        data = pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+        dump_seconds, data = best_time(lambda: pickle.dumps(program, pickle.HIGHEST_PROTOCOL))
+        load_seconds, loaded = best_time(lambda: pickle.loads(data))
+        print('  %-24s %12d bytes %12d pickled %8.3fs dump %8.3fs load' %
+              (name, object_size(program), len(data), dump_seconds, load_seconds))
+    seconds, kinds = best_time(lambda: collections.Counter(type(node) for node in ast_nodes(stmt_list)))
+    print('  %-24s %8.3fs' % ('count kinds (objects)', seconds))
+    seconds, flat_kinds = best_time(lambda: collections.Counter(flat.kinds))
+    print('  %-24s %8.3fs' % ('count kinds (flat)', seconds))
+    assert all(kinds[flat_ast.KINDS[code]] == count for code, count in flat_kinds.items()
+               if flat_ast.KINDS[code] is not flat_ast.List)
+
+
+# loop-heavy programs (the nested loops of tests/myt1.mypl, scaled up)
+LOOP_PROGRAMS = {
+    'nested loops': """
+var total = 0;
+var i = 0;
+while i < 300 do
+    var j = 0;
+    while j < 300 do
+        set total = total + i * j % 7;
+        set j = j + 1;
+    end
+    set i = i + 1;
+end
+print(itos(total) + "\\n");
+""",
+    'diagonal string': """
+var x = "This is a diagnol string, repeated for a while";
+var n = 0;
+while n < 40 do
+    var i = 1;
+    var y = 0;
+    while i < length(x) do
+        set y = 0;
+        while y < i do
+            print(" ");
+            set y = y + 1;
+        end
+        print(get(i, x));
+        print("\\n");
+        set i = i + 1;
+    end
+    set n = n + 1;
+end
+""",
+    'branches': """
+var count = 0;
+var i = 0;
+while i < 100000 do
+    if i % 15 == 0 then
+        set count = count + 15;
+    elif i % 5 == 0 then
+        set count = count + 5;
+    elif i % 3 == 0 and i > 10 then
+        set count = count + 3;
+    else
+        set count = count - 1;
+    end
+    set i = i + 1;
+end
+print(itos(count) + "\\n");
+""",
+}
+
+
+def run_engine(engine, stmt_list, stdin_text=''):
+    """Runs a program with an engine class, returns its output"""
+    previous_input = reader.use(reader.from_text(stdin_text))
+    sink = output.MemorySink()
+    previous = output.use(output.Output(sink))
+    try:
+        engine().run(stmt_list)
+        output.flush()
+        return sink.getvalue()
+    finally:
+        reader.use(previous_input)
+        output.use(previous)
+
+
+def bench_engines(engines=None, programs=LOOP_PROGRAMS):
+    """Loop-heavy programs on each execution engine"""
+    engines = engines or mypl.ENGINES
+    for program, source in sorted(programs.items()):
+        stmt_list = parse_source(source)
+        outputs = {}
+        for name in sorted(engines):
+            seconds, outputs[name] = best_time(lambda: run_engine(engines[name], stmt_list))
+            print('  %-24s %-12s %8.3fs' % (program, name, seconds))
+        check_same(program, outputs.values())
+
+
+# loop programs with literals, constant subexpressions and dead branches
+CONSTANT_PROGRAMS = {
+    'constants': """
+var total = 0.0;
+var i = 0;
+while i < 100000 do
+    set total = total + 2.5 * 4 - 60 / (3 * 4) + i % (2 + 5);
+    if 1 > 2 then
+        print("never\\n");
+    elif i % 1000 == 0 then
+        set total = total - 1.0;
+    end
+    set i = i + 1;
+end
+print(ftos(total) + "\\n");
+""",
+    'debug flag': """
+var debug = false;
+var count = 0;
+var i = 0;
+while i < 100000 do
+    if false and debug then
+        print("i = " + itos(i) + "\\n");
+    end
+    while 1 == 0 do
+        print("never\\n");
+    end
+    set count = count + 60 * 60 * 24 % 7;
+    set i = i + 1;
+end
+print(itos(count) + "\\n");
+""",
+}
+
+def bench_optimizer(engines=None):
+    """Each engine with and without the AST optimizer on loop programs"""
+    engines = engines or mypl.ENGINES
+    programs = dict(LOOP_PROGRAMS, **CONSTANT_PROGRAMS)
+    for program, source in sorted(programs.items()):
+        stmt_list = parse_source(source)
+        seconds, optimized = best_time(lambda: optimizer.Optimizer().optimize(parse_source(source)))
+        print('  %-24s %-12s %8.3fs (parse and optimize)' % (program, '', seconds))
+        for name in sorted(engines):
+            plain_seconds, plain_output = best_time(lambda: run_engine(engines[name], stmt_list))
+            seconds, output = best_time(lambda: run_engine(engines[name], optimized))
+            print('  %-24s %-12s %8.3fs -> %8.3fs (%.2fx)' % (
+                program, name, plain_seconds, seconds, plain_seconds / seconds))
+            check_same('%s %s' % (program, name), [output, plain_output])
+
+
+# loops with invariant builtin calls and induction variable products
+INVARIANT_PROGRAMS = {
+    'invariant calls': """
+var x = "This is a diagnol string, repeated for a while";
+var count = 0;
+var n = 0;
+while n < 2000 do
+    var i = 0;
+    while i < length(x) - 1 do
+        var limit = length(x) / 2;
+        if i < limit then
+            set count = count + 1;
+        end
+        set i = i + 1;
+    end
+    set n = n + 1;
+end
+print(itos(count) + "\\n");
+""",
+    'induction products': """
+var total = 0;
+var i = 0;
+while i < 100000 do
+    set total = total + i * 12 % 7 + i * 12 % 5;
+    set i = i + 1;
+end
+print(itos(total) + "\\n");
+""",
+}
+
+def bench_loops(engines=None):
+    """Each engine after constant folding, then with the loop optimizer"""
+    engines = engines or mypl.ENGINES
+    programs = dict(INVARIANT_PROGRAMS, **{'diagonal string': LOOP_PROGRAMS['diagonal string']})
+    for program, source in sorted(programs.items()):
+        folded = optimizer.Optimizer().optimize(parse_source(source))
+        the_optimizer = loop_optimizer.LoopOptimizer()
+        optimized = the_optimizer.optimize(optimizer.Optimizer().optimize(parse_source(source)))
+        print('  %-24s %s' % (program, the_optimizer.summary()))
+        for name in sorted(engines):
+            folded_seconds, folded_output = best_time(lambda: run_engine(engines[name], folded))
+            seconds, output = best_time(lambda: run_engine(engines[name], optimized))
+            print('  %-24s %-12s %8.3fs -> %8.3fs (%.2fx)' % (
+                program, name, folded_seconds, seconds, folded_seconds / seconds))
+            check_same('%s %s' % (program, name), [output, folded_output])
+
+
+def bench_symbols():
+    """Symbol table operations at increasing nesting depths, and the
+    interpreter on a tight loop nested in blocks"""
+    lookups = 100000
+    for depth in (1, 10, 100):
+        table = symbol_table.SymbolTable()
+        for i in range(depth):
+            table.push_environment()
+            table.add_id('x%d' % i)
+            table.set_info('x%d' % i, i)
+        inner, outer = 'x%d' % (depth - 1), 'x0'
+        def get(name):
+            for i in range(lookups):
+                table.get_info(name)
+        def set_(name):
+            for i in range(lookups):
+                table.set_info(name, i)
+        def push_pop():
+            for i in range(lookups):
+                table.push_environment()
+                table.add_id('y')
+                table.pop_environment()
+        for what, fun in [('get innermost', lambda: get(inner)), ('get outermost', lambda: get(outer)),
+                          ('set outermost', lambda: set_(outer)), ('push/add/pop', push_pop)]:
+            seconds, result = best_time(fun)
+            print('  depth %-4d %-16s %8.1f ns/op' % (depth, what, seconds / lookups * 1e9))
+    for depth in (0, 5, 20):
+        # the loop counter is declared outside the blocks around the loop
+        source = ('var total = 0;\nvar i = 0;\n' + 'if true then\n' * depth +
+                  'while i < 50000 do\n    set total = total + i;\n    set i = i + 1;\nend\n' +
+                  'end\n' * depth)
+        stmt_list = parse_source(source)
+        seconds, output = best_time(lambda: run_engine(interpreter.Interpreter, stmt_list))
+        print('  tight loop in %2d blocks  %8.3fs' % (depth, seconds))
+
+
+# recursive functions: fib's call tree, a BST built by tail recursive
+# inserts, and a self tail call 100000 deep
+FUNCTION_PROGRAMS = {
+    'recursive fib': """
+fun int fib(n: int)
+    if n < 2 then
+        return n;
+    end
+    return fib(n - 1) + fib(n - 2);
+end
+print(itos(fib(24)) + "\\n");
+""",
+    'bst': """
+struct Node
+    var value = 0;
+    var left: Node = nil;
+    var right: Node = nil;
+end
+fun nil insert(tree: Node, val: int)
+    if val <= tree.value then
+        if tree.left == nil then
+            set tree.left = new Node;
+            set tree.left.value = val;
+        else
+            insert(tree.left, val);
+        end
+    else
+        if tree.right == nil then
+            set tree.right = new Node;
+            set tree.right.value = val;
+        else
+            insert(tree.right, val);
+        end
+    end
+end
+fun int height(tree: Node)
+    if tree == nil then
+        return 0;
+    end
+    var lh = height(tree.left);
+    var rh = height(tree.right);
+    if lh >= rh then
+        return 1 + lh;
+    end
+    return 1 + rh;
+end
+var tree = new Node;
+set tree.value = 50000;
+var seed = 12345;
+var i = 0;
+while i < 5000 do
+    set seed = (seed * 1103515245 + 12345) % 2147483648;
+    insert(tree, seed % 100000);
+    set i = i + 1;
+end
+print(itos(height(tree)) + "\\n");
+""",
+    'tail calls': """
+fun int count(n: int, total: int)
+    if n == 0 then
+        return total;
+    end
+    return count(n - 1, total + n % 7);
+end
+print(itos(count(100000, 0)) + "\\n");
+""",
+}
+
+def bench_functions(engines=None):
+    """Recursive and tail recursive programs on each execution engine"""
+    engines = engines or mypl.ENGINES
+    for program, source in sorted(FUNCTION_PROGRAMS.items()):
+        stmt_list = parse_source(source)
+        outputs = {}
+        for name in sorted(engines):
+            try:
+                seconds, outputs[name] = best_time(lambda: run_engine(engines[name], stmt_list))
+            except (error.MyPLError, RecursionError) as e:
+                print('  %-24s %-12s failed: %s' % (program, name, str(e).splitlines()[0]))
+                continue
+            print('  %-24s %-12s %8.3fs' % (program, name, seconds))
+        check_same(program, outputs.values())
+
+
+# struct allocation and multi-hop paths in a loop
+STRUCT_PROGRAMS = {
+    'struct paths': """
+struct Point
+    var x = 0;
+    var y = 0;
+end
+struct Segment
+    var start = new Point;
+    var end_: Point = new Point;
+end
+var segment = new Segment;
+var total = 0;
+var i = 0;
+while i < 50000 do
+    set segment.start.x = i;
+    set segment.end_.y = segment.start.x + 1;
+    set total = total + segment.end_.y - segment.start.y;
+    if i % 10 == 0 then
+        set segment = new Segment;
+    end
+    set i = i + 1;
+end
+print(itos(total) + "\\n");
+""",
+}
+
+def bench_structs(engines=None):
+    """Struct allocations and path loads and stores on each execution engine"""
+    bench_engines(engines, STRUCT_PROGRAMS)
+
+
+# a builtin-heavy loop, and a helper written in MyPL or registered as
+# a native builtin (see bench_builtins)
+BUILTIN_PROGRAMS = {
+    'builtin calls': """
+var x = "abcdefghij";
+var total = 0;
+var i = 0;
+while i < 30000 do
+    set total = total + length(x) + stoi(itos(i % 10)) + length(get(i % 10, x));
+    set i = i + 1;
+end
+print(itos(total) + "\\n");
+""",
+}
+
+DIGITS_HELPER = """
+fun int digits(n: int)
+    var count = 1;
+    while n >= 10 do
+        set n = n / 10;
+        set count = count + 1;
+    end
+    return count;
+end
+"""
+
+DIGITS_LOOP = """
+var total = 0;
+var i = 0;
+while i < 30000 do
+    set total = total + digits(i * 37);
+    set i = i + 1;
+end
+print(itos(total) + "\\n");
+"""
+
+def bench_builtins(engines=None):
+    """Builtin calls on each execution engine, and a MyPL helper against
+    the same helper registered as a native builtin"""
+    engines = engines or mypl.ENGINES
+    bench_engines(engines, BUILTIN_PROGRAMS)
+    mypl_helper = parse_source(DIGITS_HELPER + DIGITS_LOOP)
+    native_helper = parse_source(DIGITS_LOOP)
+    builtin_registry.register('digits', lambda n: len(str(abs(n))), [token.INTTYPE], token.INTTYPE, pure=True)
+    try:
+        for name in sorted(engines):
+            mypl_seconds, mypl_output = best_time(lambda: run_engine(engines[name], mypl_helper))
+            seconds, output = best_time(lambda: run_engine(engines[name], native_helper))
+            print('  %-24s %-12s %8.3fs -> %8.3fs (%.2fx)' % (
+                'digits helper', name, mypl_seconds, seconds, mypl_seconds / seconds))
+            check_same('digits helper ' + name, [output, mypl_output])
+    finally:
+        del builtin_registry.BUILTINS['digits']
+
+
+def bench_output():
+    """Programs printing many small fragments, flushing the output at
+    each print vs buffered (child processes writing to /dev/null)"""
+    source = """
+var x = "This is a diagnol string, repeated for a while";
+var n = 0;
+while n < 100 do
+    var i = 1;
+    while i < length(x) do
+        var y = 0;
+        while y < i do
+            print(" ");
+            set y = y + 1;
+        end
+        print(get(i, x));
+        print("\\n");
+        set i = i + 1;
+    end
+    set n = n + 1;
+end
+"""
+    with tempfile.NamedTemporaryFile('w', suffix='.mypl', delete=False) as f:
+        f.write(source)
+    try:
+        for name in sorted(mypl.ENGINES):
+            unbuffered, rss = run_mypl(['--no-cache', '--engine', name, '--buffer-size', '1', f.name])
+            buffered, rss = run_mypl(['--no-cache', '--engine', name, f.name])
+            print('  %-24s %-12s %8.3fs -> %8.3fs (%.2fx)' % (
+                'diagonal fragments', name, unbuffered, buffered, unbuffered / buffered))
+    finally:
+        os.remove(f.name)
+
+
+def bench_input():
+    """Reading 1M integers: input() against the buffered reader, then
+    MyPL programs summing them (a line or a token per readi, child
+    processes reading a file on stdin)"""
+    count = 1000000
+    lines = ''.join('%d\n' % (i * 7919 % 100003) for i in range(count))
+    rows = ''.join(' '.join(str(j * 7919 % 100003) for j in range(i, i + 10)) + '\n'
+                   for i in range(0, count, 10))
+    def python_input():
+        stdin = sys.stdin
+        sys.stdin = io.StringIO(lines)
+        try:
+            return sum(int(input()) for i in range(count))
+        finally:
+            sys.stdin = stdin
+    def reader_read(text, mode):
+        the_input = reader.from_text(text, mode)
+        return sum(int(the_input.read()) for i in range(count))
+    for name, fun in [('input()', python_input),
+                      ('reader lines', lambda: reader_read(lines, reader.LINES)),
+                      ('reader tokens', lambda: reader_read(rows, reader.TOKENS))]:
+        seconds, total = best_time(fun)
+        print('  %-24s %8.3fs (%d)' % (name, seconds, total))
+    source = """
+var total = 0;
+var i = 0;
+while i < %d do
+    set total = total + readi();
+    set i = i + 1;
+end
+print(itos(total) + "\\n");
+""" % count
+    directory = tempfile.mkdtemp()
+    try:
+        program = os.path.join(directory, 'sum.mypl')
+        with open(program, 'w') as f:
+            f.write(source)
+        for data, text, args in [('lines', lines, []), ('rows of 10', rows, ['--read-tokens'])]:
+            data_file = os.path.join(directory, 'data')
+            with open(data_file, 'w') as f:
+                f.write(text)
+            for name in sorted(mypl.ENGINES):
+                with open(data_file) as stdin:
+                    seconds, rss = run_mypl(['--engine', name] + args + [program], stdin)
+                print('  %-24s %-12s %8.3fs' % ('sum of ' + data, name, seconds))
+    finally:
+        shutil.rmtree(directory)
+
+
+# pure functions called again with the same arguments
+MEMO_PROGRAMS = {
+    'recursive fib': FUNCTION_PROGRAMS['recursive fib'],
+    'constant lookups': """
+var digits = "3141592653589793238462643383279502884197169399375105820974944592";
+fun int digit_sum(n: int)
+    var total = 0;
+    var i = 0;
+    while i < n do
+        set total = total + stoi(get(i, digits));
+        set i = i + 1;
+    end
+    return total;
+end
+var total = 0;
+var i = 0;
+while i < 20000 do
+    set total = total + digit_sum(i % 64);
+    set i = i + 1;
+end
+print(itos(total) + "\\n");
+""",
+    'bst': FUNCTION_PROGRAMS['bst'],
+}
+
+def bench_memo():
+    """The interpreter with and without memoized pure functions, and
+    with a memo cache too small for the arguments"""
+    for program, source in sorted(MEMO_PROGRAMS.items()):
+        stmt_list = parse_source(source)
+        plain_seconds, plain_output = best_time(lambda: run_engine(interpreter.Interpreter, stmt_list))
+        for memo_size in (memo.MEMO_SIZE, 16):
+            engines = []
+            def run():
+                engines.append(interpreter.Interpreter(memo_size))
+                return run_engine(lambda: engines[-1], stmt_list)
+            seconds, output = best_time(run)
+            counts = engines[-1].stats().values()
+            print('  %-24s memo %-6d %8.3fs -> %8.3fs (%.2fx) %d hits %d misses %d evictions' % (
+                program, memo_size, plain_seconds, seconds, plain_seconds / seconds,
+                sum(c[0] for c in counts), sum(c[1] for c in counts), sum(c[2] for c in counts)))
+            check_same('%s memo %d' % (program, memo_size), [output, plain_output])
+
+
+APPEND_LOOP = """
+var s = "";
+var i = 0;
+var mismatches = 0;
+while i < %d do
+    set s = s + "ab";
+    if get(2 * i + 1, s) != "b" then
+        set mismatches = mismatches + 1;
+    end
+    set i = i + 1;
+end
+print(itos(length(s)) + " " + itos(mismatches) + "\\n");
+"""
+
+def bench_ropes():
+    """An append loop (with a get per append) in the interpreter, + on
+    flat strings vs ropes, up to 1M appends (flat strings stop at 300K,
+    being quadratic)"""
+    rope_min = rope.ROPE_MIN
+    for appends in (10000, 100000, 300000, 1000000):
+        stmt_list = parse_source(APPEND_LOOP % appends)
+        seconds, output = best_time(lambda: run_engine(interpreter.Interpreter, stmt_list), repeat=1)
+        if appends > 300000:
+            print('  %-24s %8s -> %8.3fs' % ('%d appends' % appends, 'skipped', seconds))
+            continue
+        try:
+            # results shorter than ROPE_MIN stay flat: no rope is built
+            rope.ROPE_MIN = sys.maxsize
+            flat_seconds, flat_output = best_time(lambda: run_engine(interpreter.Interpreter, stmt_list),
+                                                  repeat=1)
+        finally:
+            rope.ROPE_MIN = rope_min
+        print('  %-24s %8.3fs -> %8.3fs (%.2fx)' % (
+            '%d appends' % appends, flat_seconds, seconds, flat_seconds / seconds))
+        check_same('%d appends' % appends, [output, flat_output])
+
+
+BENCHMARKS = {
+    'lexer': bench_lexer,
+    'tokens': bench_tokens,
+    'parser': bench_parser,
+    'expr': bench_expr,
+    'stream': bench_stream,
+    'cache': bench_cache,
+    'ast': bench_ast,
+    'flat': bench_flat,
+    'engines': bench_engines,
+    'optimizer': bench_optimizer,
+    'loops': bench_loops,
+    'symbols': bench_symbols,
+    'functions': bench_functions,
+    'structs': bench_structs,
+    'builtins': bench_builtins,
+    'output': bench_output,
+    'input': bench_input,
+    'memo': bench_memo,
+    'ropes': bench_ropes,
+}
+
+
+def main(names):
+    for name in names or sorted(BENCHMARKS):
+        if name not in BENCHMARKS:
+            sys.exit('unknown benchmark %s' % name)
+        print('%s: %s' % (name, BENCHMARKS[name].__doc__))
+        BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   The MyPL builtin functions. Each name maps to a Builtin holding
+#   its Python implementation and its signature (parameter and return
+#   types, as token types), which the engines bind once per call site
+#   and the type checker loads. register() (or the @native decorator)
+#   adds Python functions to the table, so a hot helper can run as
+#   native code instead of interpreted MyPL.
+#----------------------------------------------------------------------
+import ast
+import token
+import runtime
+import output
+import reader
+
+class Builtin(object):
+    """A builtin function. The engines call function with the values of
+    the arguments, none of them nil; it reports a bad argument by
+    raising runtime.BuiltinError. A pure builtin has no side effects
+    (the same arguments give the same value or the same error), so the
+    optimizer may move or reuse its calls. The interpreter passes the
+    strings it built with + to a builtin taking ropes as rope.Rope
+    values, and to the others as str."""
+    __slots__ = ('name', 'function', 'param_types', 'return_type', 'arity', 'pure', 'ropes')
+
+    def __init__(self, name, function, param_types, return_type, pure=False, ropes=False):
+        self.name = name
+        self.function = function
+        self.param_types = tuple(param_types)   # token types
+        self.return_type = return_type          # token type
+        self.arity = len(self.param_types)
+        self.pure = pure
+        self.ropes = ropes
+
+# {name:Builtin}
+BUILTINS = {}
+
+def register(name, function, param_types, return_type, pure=False, ropes=False):
+    """Makes a Python function callable from MyPL programs, returns its
+    Builtin. A MyPL function of the same name takes precedence; a
+    registered name replaces the builtin of that name."""
+    builtin = Builtin(name, function, param_types, return_type, pure, ropes)
+    BUILTINS[name] = builtin
+    return builtin
+
+def native(name, param_types, return_type, pure=False, ropes=False):
+    """Decorator registering a Python function as a builtin"""
+    def decorate(function):
+        register(name, function, param_types, return_type, pure, ropes)
+        return function
+    return decorate
+
+def lookup(name):
+    """Returns the Builtin of a name, or None"""
+    return BUILTINS.get(name)
+
+def check_arity(builtin, call_rvalue):
+    """Reports a call with the wrong number of arguments"""
+    if len(call_rvalue.args) != builtin.arity:
+        runtime.raise_error('expecting %d arguments, found %d' % (builtin.arity, len(call_rvalue.args)),
+                            call_rvalue.fun)
+
+
+def print_literal(builtin, call_rvalue):
+    """Returns the text written by a call of the print builtin with a
+    string literal (its escapes resolved), or None"""
+    if builtin.function is not _print or len(call_rvalue.args) != 1:
+        return None
+    expr = call_rvalue.args[0]
+    if type(expr) is not ast.SimpleExpr:
+        return None
+    term = expr.term
+    if type(term) in (ast.SimpleRValue, ast.ConstRValue) and term.val.tokentype == token.STRINGVAL:
+        return output.escape(term.val.lexeme)
+    return None
+
+
+def _print(value):
+    output.write(output.escape(str(value)))
+
+def _get(index, string):
+    if 0 <= index < len(string):
+        return string[index]
+    raise runtime.BuiltinError('Index of range')
+
+def _convert(convert, msg):
+    def builtin(value):
+        try:
+            return convert(value)
+        except ValueError:
+            raise runtime.BuiltinError(msg)
+    return builtin
+
+def _read(convert, msg):
+    def builtin():
+        output.reading()
+        try:
+            return convert(reader.read())
+        except ValueError:
+            raise runtime.BuiltinError(msg)
+    return builtin
+
+register('print', _print, [token.STRINGTYPE], token.NIL, ropes=True)
+register('length', len, [token.STRINGTYPE], token.INTTYPE, pure=True, ropes=True)
+register('get', _get, [token.INTTYPE, token.STRINGTYPE], token.STRINGTYPE, pure=True, ropes=True)
+register('reads', _read(str, 'bad string'), [], token.STRINGTYPE)
+register('readi', _read(int, 'bad int value'), [], token.INTTYPE)
+register('readf', _read(float, 'bad float value'), [], token.FLOATTYPE)
+register('itof', _convert(float, 'bad argument: should be an int'), [token.INTTYPE], token.FLOATTYPE, pure=True)
+register('itos', _convert(str, 'bad argument: should be an int'), [token.INTTYPE], token.STRINGTYPE, pure=True)
+register('ftos', _convert(str, 'bad argument: should be a float'), [token.FLOATTYPE], token.STRINGTYPE, pure=True)
+register('stoi', _convert(int, 'bad argument: should be a string'), [token.STRINGTYPE], token.INTTYPE, pure=True)
+register('stof', _convert(float, 'bad argument: should be a string'), [token.STRINGTYPE], token.FLOATTYPE, pure=True)
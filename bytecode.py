@@ -0,0 +1,378 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   MyPL bytecode compiler. Lowers the AST to a linear instruction
+#   stream for the stack machine in vm.py. Each instruction is an
+#   opcode and one integer argument (a constant pool index, a local
+#   slot or a jump target).
+#----------------------------------------------------------------------
+import functools
+import ast
+import token
+import error
+import runtime
+import builtin_registry
+import output
+
+# opcodes
+LOAD_CONST = 0          # push consts[arg]
+LOAD_LOCAL = 1          # push locals[arg]
+STORE_LOCAL = 2         # locals[arg] = pop
+LOAD_GLOBAL = 3         # push globals[arg] (from a function)
+STORE_GLOBAL = 4        # globals[arg] = pop
+LOAD_FIELD = 5          # push getattr(pop, consts[arg])
+STORE_FIELD = 6         # obj = pop, setattr(obj, consts[arg], pop)
+INIT_FIELD = 7          # setattr(top, consts[arg], pop), keeps the object
+NEW = 8                 # push a new instance of the class consts[arg]
+ADD = 9
+SUB = 10
+MUL = 11
+DIV = 12
+MOD = 13
+EQ = 14
+NE = 15
+LT = 16
+LE = 17
+GT = 18
+GE = 19
+NOT = 20
+JUMP = 21               # pc = arg
+JUMP_IF_FALSE = 22      # pc = arg if not pop
+JUMP_IF_FALSE_OR_POP = 23   # and: keep a false top and jump, else pop
+JUMP_IF_TRUE_OR_POP = 24    # or: keep a true top and jump, else pop
+CALL = 25               # call the Function consts[arg] (its arguments are on the stack)
+CALL_BUILTIN = 26       # consts[arg] is (builtin, argument count)
+RETURN = 27             # return pop to the caller
+POP = 28
+DECLARE = 29            # the declaration of the Function consts[arg] ran
+CHECK_CALL = 30         # consts[arg] is (Function, argument count): check a call
+                        # compiled before the function's declaration
+
+# opcodes whose argument indexes the constant pool
+CONST_OPS = frozenset([LOAD_CONST, LOAD_FIELD, STORE_FIELD, INIT_FIELD, NEW, CALL, CALL_BUILTIN,
+                       DECLARE, CHECK_CALL])
+
+OPCODE_NAMES = {
+    value: name for name, value in list(globals().items())
+    if name.isupper() and isinstance(value, int)
+}
+
+# the opcode of each binary operator token
+BINARY_OPS = {
+    token.PLUS: ADD, token.MINUS: SUB, token.MULTIPLY: MUL,
+    token.DIVIDE: DIV, token.MODULO: MOD, token.EQUAL: EQ,
+    token.NOT_EQUAL: NE, token.LESS_THAN: LT, token.LESS_THAN_EQUAL: LE,
+    token.GREATER_THAN: GT, token.GREATER_THAN_EQUAL: GE,
+}
+
+
+class Code(object):
+    """A compiled function (or the top-level program)"""
+    def __init__(self, name):
+        self.name = name
+        self.ops = []           # opcode, argument, opcode, argument, ...
+        self.consts = []        # constant pool
+        self.const_index = {}   # {(type, value):index into consts}
+        self.nlocals = 0        # local slots (parameters first)
+        self.nparams = 0
+        self.tokens = {}        # {pc:Token} of instructions that can fail
+
+    def emit(self, opcode, arg=0, the_token=None):
+        """Appends an instruction, returns its pc"""
+        pc = len(self.ops)
+        self.ops.append(opcode)
+        self.ops.append(arg)
+        if the_token is not None:
+            self.tokens[pc] = the_token
+        return pc
+
+    def const(self, value):
+        """Returns the constant pool index of value"""
+        # equal floats may differ (0.0 and -0.0): key them by repr
+        key = (float, repr(value)) if type(value) is float else (type(value), value)
+        index = self.const_index.get(key)
+        if index is None:
+            index = self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return index
+
+    def patch(self, pc, target=None):
+        """Sets the target of the jump at pc (by default, the next pc)"""
+        self.ops[pc + 1] = len(self.ops) if target is None else target
+
+    def disassemble(self):
+        """Returns a readable listing of the instructions"""
+        lines = ['%s (%d locals, %d params)' % (self.name, self.nlocals, self.nparams)]
+        for pc in range(0, len(self.ops), 2):
+            opcode, arg = self.ops[pc], self.ops[pc + 1]
+            detail = ''
+            if opcode in CONST_OPS:
+                detail = ' (%r)' % (self.consts[arg],)
+            lines.append('%6d %-22s %d%s' % (pc, OPCODE_NAMES[opcode], arg, detail))
+        return '\n'.join(lines)
+
+
+class Function(object):
+    """A user-defined function: its name and code"""
+    __slots__ = ('name', 'code', 'arity', 'declared')
+    def __init__(self, name, arity=None):
+        self.name = name
+        self.code = Code(name)
+        self.arity = arity      # parameter count (None until declared)
+        self.declared = False   # its declaration ran (see DECLARE)
+    def __repr__(self):
+        return '<fun %s>' % self.name
+
+
+class Compiler(ast.Visitor):
+    """Compiles a MyPL AST into Code objects. The top-level program runs
+    with the globals as its locals."""
+
+    def __init__(self):
+        self.code = Code('<program>')
+        self.program = self.code
+        # compile-time scopes {name:slot}, innermost last; the ones
+        # below scope_base hold globals
+        self.scopes = [{}]
+        self.scope_base = 0
+        self.functions = {}     # {name:Function} declared so far
+        self.forward = {}       # {name:Function} not declared yet
+        self.structs = {}       # {name:(class, [(field, init ops)])}
+
+    def __error(self, msg, the_token):
+        raise error.MyPLError(msg, the_token.line, the_token.column, the_token.snippet())
+
+    def compile(self, stmt_list):
+        """Compiles a program, returns its Code"""
+        # calls of a function declared later (mutual recursion) are
+        # checked against its declaration too
+        for stmt in stmt_list.stmts:
+            if type(stmt) is ast.FunDeclStmt and stmt.fun_name.lexeme not in self.forward:
+                self.forward[stmt.fun_name.lexeme] = Function(stmt.fun_name.lexeme, len(stmt.params))
+        stmt_list.accept(self)
+        self.__end_program()
+        return self.program
+
+    def compile_stmt(self, stmt):
+        """Appends a top-level statement to the program, returns the pc
+        of its first instruction (the program keeps ending in a return)"""
+        program = self.program
+        if program.ops:
+            del program.ops[-4:]
+        start = len(program.ops)
+        stmt.accept(self)
+        self.__end_program()
+        return start
+
+    def __end_program(self):
+        self.program.emit(LOAD_CONST, self.program.const(None))
+        self.program.emit(RETURN)
+
+    # variables
+
+    def __declare(self, the_token):
+        slot = self.code.nlocals
+        self.code.nlocals += 1
+        self.scopes[-1][the_token.lexeme] = slot
+        return slot
+
+    def __lookup(self, the_token):
+        """Returns the slot of a variable and whether it is a global
+        (accessed from a function)"""
+        name = the_token.lexeme
+        for i in range(len(self.scopes) - 1, -1, -1):
+            if name in self.scopes[i]:
+                return self.scopes[i][name], i < self.scope_base
+        self.__error('undefined variable "%s"' % name, the_token)
+
+    def __load(self, the_token):
+        slot, is_global = self.__lookup(the_token)
+        self.code.emit(LOAD_GLOBAL if is_global else LOAD_LOCAL, slot)
+
+    def __block(self, stmt_list):
+        self.scopes.append({})
+        for stmt in stmt_list.stmts:
+            stmt.accept(self)
+        self.scopes.pop()
+
+    # statements
+
+    def visit_stmt_list(self, stmt_list):
+        self.__block(stmt_list)
+
+    def visit_expr_stmt(self, expr_stmt):
+        expr_stmt.expr.accept(self)
+        self.code.emit(POP)
+
+    def visit_var_decl_stmt(self, var_decl):
+        var_decl.var_expr.accept(self)
+        self.code.emit(STORE_LOCAL, self.__declare(var_decl.var_id))
+
+    def visit_assign_stmt(self, assign_stmt):
+        assign_stmt.rhs.accept(self)
+        path = assign_stmt.lhs.path
+        if len(path) == 1:
+            slot, is_global = self.__lookup(path[0])
+            self.code.emit(STORE_GLOBAL if is_global else STORE_LOCAL, slot)
+            return
+        self.__load(path[0])
+        for field in path[1:-1]:
+            self.code.emit(LOAD_FIELD, self.code.const(runtime.field_name(field.lexeme)), path[0])
+        self.code.emit(STORE_FIELD, self.code.const(runtime.field_name(path[-1].lexeme)), path[0])
+
+    def visit_struct_decl_stmt(self, struct_decl):
+        fields = [runtime.field_name(var_decl.var_id.lexeme) for var_decl in struct_decl.var_decls]
+        cls = type(struct_decl.struct_id.lexeme, (object,), {'__slots__': tuple(fields)})
+        # the field initializers are compiled (against the globals) once
+        # and copied into each 'new' of the struct
+        code, scope_base = self.code, self.scope_base
+        self.scope_base = 0
+        inits = []
+        for var_decl in struct_decl.var_decls:
+            self.code = Code(cls.__name__)
+            var_decl.var_expr.accept(self)
+            inits.append((runtime.field_name(var_decl.var_id.lexeme), self.code))
+        self.code, self.scope_base = code, scope_base
+        self.structs[cls.__name__] = (cls, inits)
+
+    def visit_fun_decl_stmt(self, fun_decl):
+        function = self.forward.pop(fun_decl.fun_name.lexeme, None) or Function(fun_decl.fun_name.lexeme)
+        function.arity = len(fun_decl.params)
+        self.functions[function.name] = function
+        outer = self.code, self.scope_base
+        self.code, self.scope_base = function.code, len(self.scopes)
+        self.scopes.append({})
+        for param in fun_decl.params:
+            self.__declare(param.param_name)
+        function.code.nparams = len(fun_decl.params)
+        self.__block(fun_decl.stmt_list)
+        # falling off the end returns nil
+        self.code.emit(LOAD_CONST, self.code.const(None))
+        self.code.emit(RETURN)
+        self.scopes.pop()
+        self.code, self.scope_base = outer
+        self.code.emit(DECLARE, self.code.const(function))
+
+    def visit_return_stmt(self, return_stmt):
+        if return_stmt.return_expr is None:
+            self.code.emit(LOAD_CONST, self.code.const(None))
+        else:
+            return_stmt.return_expr.accept(self)
+        self.code.emit(RETURN)
+
+    def visit_while_stmt(self, while_stmt):
+        start = len(self.code.ops)
+        while_stmt.bool_expr.accept(self)
+        exit_jump = self.code.emit(JUMP_IF_FALSE)
+        self.__block(while_stmt.stmt_list)
+        self.code.emit(JUMP, start)
+        self.code.patch(exit_jump)
+
+    def visit_if_stmt(self, if_stmt):
+        end_jumps = []
+        arms = [if_stmt.if_part] + if_stmt.elseifs
+        for basic_if in arms:
+            basic_if.bool_expr.accept(self)
+            next_jump = self.code.emit(JUMP_IF_FALSE)
+            self.__block(basic_if.stmt_list)
+            # the last arm falls through when there is no else
+            if basic_if is not arms[-1] or if_stmt.has_else:
+                end_jumps.append(self.code.emit(JUMP))
+            self.code.patch(next_jump)
+        if if_stmt.has_else:
+            self.__block(if_stmt.else_stmts)
+        for end_jump in end_jumps:
+            self.code.patch(end_jump)
+
+    # expressions
+
+    def visit_simple_expr(self, simple_expr):
+        simple_expr.term.accept(self)
+
+    def visit_complex_expr(self, complex_expr):
+        complex_expr.first_operand.accept(self)
+        complex_expr.rest.accept(self)
+        self.code.emit(BINARY_OPS[complex_expr.math_rel.tokentype], the_token=complex_expr.math_rel)
+
+    def visit_nary_expr(self, nary_expr):
+        nary_expr.operands[0].accept(self)
+        for math_rel, operand in zip(nary_expr.math_rels, nary_expr.operands[1:]):
+            operand.accept(self)
+            self.code.emit(BINARY_OPS[math_rel.tokentype], the_token=math_rel)
+
+    def visit_bool_expr(self, bool_expr):
+        bool_expr.first_expr.accept(self)
+        if bool_expr.negated:
+            self.code.emit(NOT)
+        if bool_expr.bool_rel is not None:
+            bool_expr.second_expr.accept(self)
+            self.code.emit(BINARY_OPS[bool_expr.bool_rel.tokentype])
+        if bool_expr.bool_connector is not None:
+            if bool_expr.bool_connector.tokentype == token.AND:
+                jump = self.code.emit(JUMP_IF_FALSE_OR_POP)
+            else:
+                jump = self.code.emit(JUMP_IF_TRUE_OR_POP)
+            bool_expr.rest.accept(self)
+            self.code.patch(jump)
+
+    def visit_simple_rvalue(self, simple_rvalue):
+        value = runtime.literal_value(simple_rvalue.val)
+        self.code.emit(LOAD_CONST, self.code.const(value))
+
+    def visit_const_rvalue(self, const_rvalue):
+        self.code.emit(LOAD_CONST, self.code.const(const_rvalue.value))
+
+    def visit_new_rvalue(self, new_rvalue):
+        name = new_rvalue.struct_type.lexeme
+        if name not in self.structs:
+            self.__error('undefined struct "%s"' % name, new_rvalue.struct_type)
+        cls, inits = self.structs[name]
+        self.code.emit(NEW, self.code.const(cls))
+        for field, init in inits:
+            # relocate the initializer's constants into this code
+            for pc in range(0, len(init.ops), 2):
+                opcode, arg = init.ops[pc], init.ops[pc + 1]
+                if opcode in CONST_OPS:
+                    arg = self.code.const(init.consts[arg])
+                elif opcode == LOAD_LOCAL and self.code is not self.program:
+                    opcode = LOAD_GLOBAL
+                self.code.emit(opcode, arg, init.tokens.get(pc))
+            self.code.emit(INIT_FIELD, self.code.const(field))
+
+    def visit_call_rvalue(self, call_rvalue):
+        fun_token = call_rvalue.fun
+        name = fun_token.lexeme
+        builtin = builtin_registry.lookup(name)
+        function = self.functions.get(name)
+        if function is None and builtin is None and self.scope_base:
+            # in a function, a function declared later (or never) is
+            # checked when the call runs, as in the interpreter
+            function = self.forward.get(name)
+            if function is None:
+                function = self.forward[name] = Function(name)
+            self.code.emit(CHECK_CALL, self.code.const((function, len(call_rvalue.args))), fun_token)
+        if function is None and builtin is not None:
+            text = builtin_registry.print_literal(builtin, call_rvalue)
+            if text is not None:
+                # print of a literal, escapes already resolved
+                write = functools.partial(output.write, text)
+                self.code.emit(CALL_BUILTIN, self.code.const((write, 0)), fun_token)
+                return
+        for arg in call_rvalue.args:
+            arg.accept(self)
+        if function is not None:
+            if function.arity is not None and len(call_rvalue.args) != function.arity:
+                self.__error('wrong number of arguments', fun_token)
+            self.code.emit(CALL, self.code.const(function), fun_token)
+        elif builtin is not None:
+            builtin_registry.check_arity(builtin, call_rvalue)
+            self.code.emit(CALL_BUILTIN, self.code.const((builtin.function, builtin.arity)), fun_token)
+        else:
+            self.__error('undefined function "%s"' % name, fun_token)
+
+    def visit_id_rvalue(self, id_rvalue):
+        self.__load(id_rvalue.path[0])
+        # a bad path is reported at its variable, as in the interpreter
+        for field in id_rvalue.path[1:]:
+            self.code.emit(LOAD_FIELD, self.code.const(runtime.field_name(field.lexeme)), id_rvalue.path[0])
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   On-disk cache of parsed MyPL programs (.myplc files). A cached
+#   program is keyed by the hash of its source and the interpreter
+#   version, so it is only used while both are unchanged. The source
+#   map the tokens share is stored as a reference (SOURCE_MAP_ID), and
+#   rebuilt from the source when the program is loaded.
+#----------------------------------------------------------------------
+import gc
+import hashlib
+import io
+import os
+import pickle
+import interpreter
+import lexer
+
+# cached programs live in this directory next to their source
+CACHE_DIR = '__myplcache__'
+MAGIC = b'MYPLC\x00'
+
+# the persistent id of the source map in cached programs
+SOURCE_MAP_ID = 'source_map'
+
+
+class Pickler(pickle.Pickler):
+    """Pickles a program without the text of its source map"""
+
+    def persistent_id(self, obj):
+        if type(obj) is lexer.SourceMap:
+            return SOURCE_MAP_ID
+        return None
+
+
+class Unpickler(pickle.Unpickler):
+    """Loads a program, its tokens sharing source_map"""
+
+    def __init__(self, file, source_map):
+        super().__init__(file)
+        self.source_map = source_map
+
+    def persistent_load(self, pid):
+        if pid == SOURCE_MAP_ID:
+            return self.source_map
+        raise pickle.UnpicklingError('unknown persistent id %r' % (pid,))
+
+
+def cache_path(filename):
+    """Returns the path of the cached program for a source file"""
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, CACHE_DIR, name + 'c')
+
+def program_key(source):
+    """Returns the cache key (bytes) of a source (bytes)"""
+    digest = hashlib.sha256(interpreter.VERSION.encode())
+    digest.update(source)
+    return digest.digest()
+
+def read(path, key, source_map=None):
+    """Returns the cached StmtList at path, or None if there is no valid
+    cached program for key. Its tokens get source_map."""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC or f.read(len(key)) != key:
+                return None
+            # the collector would rescan the growing tree over and over
+            gc.disable()
+            try:
+                return Unpickler(f, source_map).load()
+            finally:
+                gc.enable()
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+def write(path, key, stmt_list):
+    """Caches a StmtList at path. Failures (e.g., a read-only source
+    directory) are ignored, the program just isn't cached."""
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(key)
+            Pickler(f, pickle.HIGHEST_PROTOCOL).dump(stmt_list)
+        os.replace(tmp_path, path)
+    except (OSError, pickle.PicklingError, RecursionError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def load_program(filename, parse):
+    """Returns the StmtList of a source file, from the cache if it holds
+    a valid program for the current source, otherwise by calling
+    parse(file_stream) and caching the result.
+    """
+    with open(filename, 'rb') as f:
+        source = f.read()
+    key = program_key(source)
+    path = cache_path(filename)
+    # the lexer finds the source file by the stream's name
+    buffer = io.BytesIO(source)
+    buffer.name = filename
+    file_stream = io.TextIOWrapper(buffer)
+    stmt_list = read(path, key, lexer.SourceMap.from_text(file_stream.read(), filename))
+    if stmt_list is None:
+        file_stream.seek(0)
+        stmt_list = parse(file_stream)
+        write(path, key, stmt_list)
+    return stmt_list
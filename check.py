@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   Checks the MyPL implementation against its reference, the
+#   interpreter: runs every program in tests/ (with the same input) in
+#   each configuration (engine, optimizer, streaming, memoization,
+#   lexer) and compares what it prints, and the error it ends with,
+#   with the interpreter's. Usage: check.py; exits non-zero if a
+#   configuration differs or crashes.
+#----------------------------------------------------------------------
+import os
+import sys
+import error
+import mypl
+import output
+import reader
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests')
+
+# the input of the programs
+INPUT = 'abc\n2.5\n' * 4
+
+# the reference configuration, then the ones checked against it (the
+# options of mypl.run)
+REFERENCE = ('interpreter', {})
+CONFIGURATIONS = [
+    ('interpreter --stream', {'stream': True}),
+    ('interpreter -O', {'use_optimizer': True}),
+    ('interpreter --memo', {'memo_size': 1024}),
+    ('--lexer stream', {'lexer_name': 'stream'}),
+    ('--lexer regex', {'lexer_name': 'regex'}),
+] + [
+    ('%s%s' % (engine_name, label), dict(options, engine_name=engine_name))
+    for engine_name in sorted(mypl.ENGINES) if engine_name != 'interpreter'
+    for label, options in [('', {}), (' -O', {'use_optimizer': True}), (' --stream', {'stream': True})]
+]
+
+
+def run_program(path, options):
+    """Runs a program file, returns what it printed followed by the
+    error it ended with, and whether it crashed (a Python exception
+    other than a MyPL error)"""
+    previous_input = reader.use(reader.from_text(INPUT))
+    sink = output.MemorySink()
+    previous = output.use(output.Output(sink))
+    crashed = False
+    failure = ''
+    try:
+        with open(path) as file_stream:
+            mypl.run(file_stream, **options)
+    except error.MyPLError as e:
+        failure = '%s\n' % e
+    except Exception as e:
+        crashed = True
+        failure = 'crash: %s: %s\n' % (type(e).__name__, e)
+    finally:
+        reader.use(previous_input)
+        # flushes the program's output into the sink
+        output.use(previous)
+    return sink.getvalue() + failure, crashed
+
+
+def first_difference(expected, actual):
+    """Returns the first line where two results differ"""
+    expected_lines = expected.splitlines()
+    actual_lines = actual.splitlines()
+    for i in range(max(len(expected_lines), len(actual_lines))):
+        expected_line = expected_lines[i] if i < len(expected_lines) else '<end>'
+        actual_line = actual_lines[i] if i < len(actual_lines) else '<end>'
+        if expected_line != actual_line:
+            return 'line %d: expected %r, found %r' % (i + 1, expected_line, actual_line)
+    return ''
+
+
+def check():
+    """Returns the number of failed checks"""
+    failures = 0
+    for name in sorted(n for n in os.listdir(TESTS_DIR) if n.endswith('.mypl')):
+        path = os.path.join(TESTS_DIR, name)
+        expected, crashed = run_program(path, REFERENCE[1])
+        if crashed:
+            failures += 1
+            print('%-12s %-24s crashed: %s' % (name, REFERENCE[0], expected.splitlines()[-1]))
+            continue
+        for label, options in CONFIGURATIONS:
+            actual, crashed = run_program(path, options)
+            if crashed or actual != expected:
+                failures += 1
+                print('%-12s %-24s differs, %s' % (name, label, first_difference(expected, actual)))
+        print('%-12s checked in %d configurations' % (name, len(CONFIGURATIONS) + 1))
+    return failures
+
+
+if __name__ == '__main__':
+    failures = check()
+    if failures:
+        sys.exit('%d checks failed' % failures)
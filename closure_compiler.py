@@ -0,0 +1,462 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   MyPL closure compiler. Walks the AST once and turns every node into
+#   a Python closure with its operator, operands and variable slots
+#   already chosen, so running a program is just calling closures (no
+#   visitor dispatch or token type tests at run time).
+#----------------------------------------------------------------------
+import operator
+import ast
+import token
+import runtime
+import builtin_registry
+import output
+
+# Every closure takes the current frame: a list holding the variables
+# of the running function (or the globals, at the top level). Slot 0 of
+# a function frame holds its return value. Statement closures return
+# True when a return statement ran (and None otherwise).
+
+class Function(object):
+    """A compiled user-defined function"""
+    __slots__ = ('name', 'arity', 'size', 'body')
+    def __init__(self, name, arity=None):
+        self.name = name
+        self.arity = arity  # parameter count (None until declared)
+        self.size = 1       # frame slots: return value, params, locals
+        self.body = None    # block closure, once the declaration ran
+
+def _plus(first, rest):
+    # strings absorb the other operand (as in the interpreter)
+    def plus(f):
+        x = first(f)
+        y = rest(f)
+        if type(x) is str or type(y) is str:
+            return str(x) + str(y)
+        return x + y
+    return plus
+
+MATH_OPS = {
+    token.PLUS: _plus,
+    token.MINUS: lambda a, b: lambda f: a(f) - b(f),
+    token.MULTIPLY: lambda a, b: lambda f: a(f) * b(f),
+}
+
+# operators reporting a zero divisor at their token (see __math)
+CHECKED_OPS = {
+    token.DIVIDE: runtime.divide,
+    token.MODULO: runtime.modulo,
+}
+
+BOOL_RELS = {
+    token.EQUAL: lambda a, b: lambda f: a(f) == b(f),
+    token.NOT_EQUAL: lambda a, b: lambda f: a(f) != b(f),
+    token.LESS_THAN: lambda a, b: lambda f: a(f) < b(f),
+    token.LESS_THAN_EQUAL: lambda a, b: lambda f: a(f) <= b(f),
+    token.GREATER_THAN: lambda a, b: lambda f: a(f) > b(f),
+    token.GREATER_THAN_EQUAL: lambda a, b: lambda f: a(f) >= b(f),
+}
+
+# comparisons of a variable (slot) with a constant, the common loop test
+SLOT_CONST_RELS = {
+    token.EQUAL: lambda s, c: lambda f: f[s] == c,
+    token.NOT_EQUAL: lambda s, c: lambda f: f[s] != c,
+    token.LESS_THAN: lambda s, c: lambda f: f[s] < c,
+    token.LESS_THAN_EQUAL: lambda s, c: lambda f: f[s] <= c,
+    token.GREATER_THAN: lambda s, c: lambda f: f[s] > c,
+    token.GREATER_THAN_EQUAL: lambda s, c: lambda f: f[s] >= c,
+}
+
+
+class ClosureCompiler(ast.Visitor):
+    """Compiles a MyPL AST into closures. Each visit_* method leaves the
+    closure of the visited node in current_closure."""
+
+    def __init__(self):
+        self.current_closure = None
+        # the global frame (grows as global variables are declared)
+        self.globals = []
+        # compile-time scopes {name:slot}, innermost last; the ones
+        # below scope_base belong to the global frame
+        self.scopes = [{}]
+        self.scope_base = 0
+        self.function = None    # the Function being compiled
+        self.functions = {}     # {name:Function} declared so far
+        self.forward = {}       # {name:Function} not declared yet
+        self.structs = {}       # {name:(class, [(field, init closure)])}
+
+    def __error(self, msg, the_token):
+        runtime.raise_error(msg, the_token)
+
+    def compile(self, node):
+        """Returns the closure of an AST node"""
+        node.accept(self)
+        return self.current_closure
+
+    def run(self, stmt_list):
+        """Compiles and runs a program"""
+        # calls of a function declared later (mutual recursion) are
+        # checked against its declaration too
+        for stmt in stmt_list.stmts:
+            if type(stmt) is ast.FunDeclStmt and stmt.fun_name.lexeme not in self.forward:
+                self.forward[stmt.fun_name.lexeme] = Function(stmt.fun_name.lexeme, len(stmt.params))
+        program = self.compile(stmt_list)
+        program(self.globals)
+
+    def run_stream(self, stmts):
+        """Compiles and runs top-level statements as they arrive (see
+        Interpreter.run_stream)"""
+        for stmt in stmts:
+            if self.compile(stmt)(self.globals):
+                return
+
+    # variables
+
+    def __declare(self, the_token):
+        """Gives a variable a slot in the current scope"""
+        if self.function is not None:
+            slot = self.function.size
+            self.function.size += 1
+        else:
+            slot = len(self.globals)
+            self.globals.append(None)
+        self.scopes[-1][the_token.lexeme] = slot
+        return slot
+
+    def __lookup(self, the_token):
+        """Returns the slot of a variable and whether it is global (and
+        accessed from a function)"""
+        name = the_token.lexeme
+        for i in range(len(self.scopes) - 1, -1, -1):
+            if name in self.scopes[i]:
+                return self.scopes[i][name], i < self.scope_base
+        self.__error('undefined variable "%s"' % name, the_token)
+
+    def __load(self, the_token):
+        slot, is_global = self.__lookup(the_token)
+        if is_global:
+            g = self.globals
+            return lambda f: g[slot]
+        return lambda f: f[slot]
+
+    def __block(self, stmt_list):
+        """Returns the closure of a statement list run in a new scope"""
+        self.scopes.append({})
+        stmts = [self.compile(stmt) for stmt in stmt_list.stmts]
+        self.scopes.pop()
+        if len(stmts) == 1:
+            return stmts[0]
+        def block(f):
+            for stmt in stmts:
+                if stmt(f):
+                    return True
+        return block
+
+    # statements
+
+    def visit_stmt_list(self, stmt_list):
+        self.current_closure = self.__block(stmt_list)
+
+    def visit_expr_stmt(self, expr_stmt):
+        expr = self.compile(expr_stmt.expr)
+        def stmt(f):
+            expr(f)
+        self.current_closure = stmt
+
+    def visit_var_decl_stmt(self, var_decl):
+        expr = self.compile(var_decl.var_expr)
+        slot = self.__declare(var_decl.var_id)
+        def var_decl(f):
+            f[slot] = expr(f)
+        self.current_closure = var_decl
+
+    def visit_assign_stmt(self, assign_stmt):
+        rhs = self.compile(assign_stmt.rhs)
+        path = assign_stmt.lhs.path
+        slot, is_global = self.__lookup(path[0])
+        if len(path) == 1:
+            if is_global:
+                g = self.globals
+                def assign(f):
+                    g[slot] = rhs(f)
+            else:
+                def assign(f):
+                    f[slot] = rhs(f)
+            self.current_closure = assign
+            return
+        base = self.__load(path[0])
+        if len(path) > 2:
+            get = operator.attrgetter('.'.join(runtime.field_name(t.lexeme) for t in path[1:-1]))
+            target = lambda f: get(base(f))
+        else:
+            target = base
+        field = runtime.field_name(path[-1].lexeme)
+        first = path[0]
+        def assign_field(f):
+            value = rhs(f)
+            try:
+                setattr(target(f), field, value)
+            except AttributeError:
+                runtime.raise_error('bad path: nil value or unknown field', first)
+        self.current_closure = assign_field
+
+    def visit_struct_decl_stmt(self, struct_decl):
+        fields = [runtime.field_name(var_decl.var_id.lexeme) for var_decl in struct_decl.var_decls]
+        cls = type(struct_decl.struct_id.lexeme, (object,), {'__slots__': tuple(fields)})
+        # field initializers are evaluated in the global frame
+        function, scope_base = self.function, self.scope_base
+        self.function, self.scope_base = None, 0
+        inits = [(field, self.compile(var_decl.var_expr))
+                 for field, var_decl in zip(fields, struct_decl.var_decls)]
+        self.function, self.scope_base = function, scope_base
+        self.structs[struct_decl.struct_id.lexeme] = (cls, inits)
+        self.current_closure = lambda f: None
+
+    def visit_fun_decl_stmt(self, fun_decl):
+        function = self.forward.pop(fun_decl.fun_name.lexeme, None) or Function(fun_decl.fun_name.lexeme)
+        function.arity = len(fun_decl.params)
+        # registered first, so the body can call it recursively
+        self.functions[function.name] = function
+        outer = self.function, self.scope_base
+        self.function, self.scope_base = function, len(self.scopes)
+        self.scopes.append({})
+        for param in fun_decl.params:
+            self.__declare(param.param_name)
+        body = self.__block(fun_decl.stmt_list)
+        self.scopes.pop()
+        self.function, self.scope_base = outer
+        def declare(f):
+            function.body = body
+        self.current_closure = declare
+
+    def visit_return_stmt(self, return_stmt):
+        if return_stmt.return_expr is None:
+            expr = lambda f: None
+        else:
+            expr = self.compile(return_stmt.return_expr)
+        if self.function is None:
+            # a top-level return ends the program
+            def return_(f):
+                expr(f)
+                return True
+        else:
+            def return_(f):
+                f[0] = expr(f)
+                return True
+        self.current_closure = return_
+
+    def visit_while_stmt(self, while_stmt):
+        cond = self.compile(while_stmt.bool_expr)
+        body = self.__block(while_stmt.stmt_list)
+        def while_(f):
+            while cond(f):
+                if body(f):
+                    return True
+        self.current_closure = while_
+
+    def visit_if_stmt(self, if_stmt):
+        arms = [(self.compile(basic_if.bool_expr), self.__block(basic_if.stmt_list))
+                for basic_if in [if_stmt.if_part] + if_stmt.elseifs]
+        else_block = self.__block(if_stmt.else_stmts) if if_stmt.has_else else None
+        if len(arms) == 1:
+            cond, block = arms[0]
+            if else_block is None:
+                def if_(f):
+                    if cond(f):
+                        return block(f)
+            else:
+                def if_(f):
+                    if cond(f):
+                        return block(f)
+                    return else_block(f)
+        else:
+            def if_(f):
+                for cond, block in arms:
+                    if cond(f):
+                        return block(f)
+                if else_block is not None:
+                    return else_block(f)
+        self.current_closure = if_
+
+    # expressions
+
+    def visit_simple_expr(self, simple_expr):
+        simple_expr.term.accept(self)
+
+    def visit_complex_expr(self, complex_expr):
+        first = self.compile(complex_expr.first_operand)
+        rest = self.compile(complex_expr.rest)
+        self.current_closure = self.__math(complex_expr.math_rel, first, rest)
+
+    def visit_nary_expr(self, nary_expr):
+        value = self.compile(nary_expr.operands[0])
+        for math_rel, operand in zip(nary_expr.math_rels, nary_expr.operands[1:]):
+            value = self.__math(math_rel, value, self.compile(operand))
+        self.current_closure = value
+
+    def __math(self, math_rel, first, rest):
+        """Returns the closure applying a math operator to two closures"""
+        checked = CHECKED_OPS.get(math_rel.tokentype)
+        if checked is None:
+            return MATH_OPS[math_rel.tokentype](first, rest)
+        def math(f):
+            x = first(f)
+            y = rest(f)
+            try:
+                return checked(x, y)
+            except runtime.BuiltinError as e:
+                runtime.raise_error(str(e), math_rel)
+        return math
+
+    def visit_bool_expr(self, bool_expr):
+        first = self.compile(bool_expr.first_expr)
+        if bool_expr.negated:
+            negated = first
+            first = lambda f: not negated(f)
+        if bool_expr.bool_rel is not None:
+            tokentype = bool_expr.bool_rel.tokentype
+            slot = self.__local_slot(bool_expr.first_expr)
+            is_const, value = self.__constant(bool_expr.second_expr)
+            if slot is not None and is_const and not bool_expr.negated:
+                first = SLOT_CONST_RELS[tokentype](slot, value)
+            else:
+                first = BOOL_RELS[tokentype](first, self.compile(bool_expr.second_expr))
+        if bool_expr.bool_connector is not None:
+            left = first
+            rest = self.compile(bool_expr.rest)
+            if bool_expr.bool_connector.tokentype == token.AND:
+                first = lambda f: left(f) and rest(f)
+            else:
+                first = lambda f: left(f) or rest(f)
+        self.current_closure = first
+
+    def __local_slot(self, expr):
+        """Returns the frame slot of a simple (non-global) variable
+        expression, or None"""
+        if isinstance(expr, ast.SimpleExpr) and isinstance(expr.term, ast.IDRvalue):
+            if len(expr.term.path) == 1:
+                slot, is_global = self.__lookup(expr.term.path[0])
+                if not is_global:
+                    return slot
+        return None
+
+    def __constant(self, expr):
+        """Returns (True, value) for a literal expression"""
+        if isinstance(expr, ast.SimpleExpr) and isinstance(expr.term, ast.ConstRValue):
+            return True, expr.term.value
+        if isinstance(expr, ast.SimpleExpr) and isinstance(expr.term, ast.SimpleRValue):
+            return True, runtime.literal_value(expr.term.val)
+        return False, None
+
+    def visit_simple_rvalue(self, simple_rvalue):
+        value = runtime.literal_value(simple_rvalue.val)
+        self.current_closure = lambda f: value
+
+    def visit_const_rvalue(self, const_rvalue):
+        value = const_rvalue.value
+        self.current_closure = lambda f: value
+
+    def visit_new_rvalue(self, new_rvalue):
+        name = new_rvalue.struct_type.lexeme
+        if name not in self.structs:
+            self.__error('undefined struct "%s"' % name, new_rvalue.struct_type)
+        cls, inits = self.structs[name]
+        g = self.globals
+        def new(f):
+            obj = cls()
+            for field, init in inits:
+                setattr(obj, field, init(g))
+            return obj
+        self.current_closure = new
+
+    def visit_call_rvalue(self, call_rvalue):
+        fun_token = call_rvalue.fun
+        name = fun_token.lexeme
+        args = [self.compile(arg) for arg in call_rvalue.args]
+        if name in self.functions:
+            self.current_closure = self.__user_call(self.functions[name], args, fun_token)
+        elif name not in builtin_registry.BUILTINS and self.function is not None:
+            # a function declared later (or never) is looked up when the
+            # call runs, as in the interpreter
+            function = self.forward.get(name)
+            if function is None:
+                function = self.forward[name] = Function(name)
+            self.current_closure = self.__forward_call(function, args, fun_token)
+        elif name in builtin_registry.BUILTINS:
+            builtin = builtin_registry.BUILTINS[fun_token.lexeme]
+            builtin_registry.check_arity(builtin, call_rvalue)
+            text = builtin_registry.print_literal(builtin, call_rvalue)
+            if text is not None:
+                write = output.write
+                self.current_closure = lambda f: write(text)
+            else:
+                self.current_closure = self.__builtin_call(builtin.function, args, fun_token)
+        else:
+            self.__error('undefined function "%s"' % fun_token.lexeme, fun_token)
+
+    def __user_call(self, function, args, fun_token):
+        count = len(args)
+        if function.arity is not None and count != function.arity:
+            self.__error('wrong number of arguments', fun_token)
+        def call(f):
+            frame = [None] * function.size
+            for i in range(count):
+                frame[i + 1] = args[i](f)
+            try:
+                function.body(frame)
+            except RecursionError:
+                runtime.raise_error('stack overflow', fun_token)
+            return frame[0]
+        return call
+
+    def __forward_call(self, function, args, fun_token):
+        """Returns the closure of a call compiled before the declaration
+        of the function, which checks it when it runs"""
+        call = self.__user_call(function, args, fun_token)
+        count = len(args)
+        def forward_call(f):
+            if function.body is None:
+                runtime.raise_error('undefined function "%s"' % function.name, fun_token)
+            if count != function.arity:
+                runtime.raise_error('wrong number of arguments', fun_token)
+            return call(f)
+        return forward_call
+
+    def __builtin_call(self, builtin, args, fun_token):
+        if len(args) == 1:
+            arg = args[0]
+            def call(f):
+                value = arg(f)
+                if value is None:
+                    runtime.raise_error('bad value: should not be nil', fun_token)
+                try:
+                    return builtin(value)
+                except runtime.BuiltinError as e:
+                    runtime.raise_error(str(e), fun_token)
+            return call
+        def call(f):
+            values = [arg(f) for arg in args]
+            if None in values:
+                runtime.raise_error('bad value: should not be nil', fun_token)
+            try:
+                return builtin(*values)
+            except runtime.BuiltinError as e:
+                runtime.raise_error(str(e), fun_token)
+        return call
+
+    def visit_id_rvalue(self, id_rvalue):
+        path = id_rvalue.path
+        base = self.__load(path[0])
+        if len(path) == 1:
+            self.current_closure = base
+            return
+        get = operator.attrgetter('.'.join(runtime.field_name(t.lexeme) for t in path[1:]))
+        first = path[0]
+        def load_path(f):
+            try:
+                return get(base(f))
+            except AttributeError:
+                runtime.raise_error('bad path: nil value or unknown field', first)
+        self.current_closure = load_path
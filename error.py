@@ -5,13 +5,17 @@
 #   This is an error handling class for MyPL
 class MyPLError(Exception):
 
-    def __init__(self, message, line, column):
+    def __init__(self, message, line, column, snippet=None):
         self.message = message
         self.line = line
         self.column = column
+        self.snippet = snippet      # source line with a caret, if known
 
     def __str__(self):
         msg = self.message
         line = self.line
         column = self.column
-        return 'error: %s at line %i column %i' % (msg, line, column)
+        s = 'error: %s at line %i column %i' % (msg, line, column)
+        if self.snippet:
+            s += '\n' + self.snippet
+        return s
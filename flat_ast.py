@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   A flat, array-backed representation of a MyPL program. Every node
+#   is an index into a few parallel arrays (kind, main token, flags and
+#   child offsets) and every token is an index into a columnar
+#   token.TokenStream, so a whole program is a handful of buffers that
+#   can be walked by integer index, pickled or shared cheaply.
+#----------------------------------------------------------------------
+from array import array
+import ast
+import runtime
+import token
+
+# field layouts: a node field, a token field, a list (of nodes or
+# tokens, stored as a LIST node) and a boolean flag
+NODE, TOKEN, ITEMS, FLAG = 'node', 'token', 'items', 'flag'
+
+# a list field is stored as a node of this kind, one child per item
+class List(object):
+    """A list field of a node (the elements are its children)"""
+
+# every node class with its fields (in child order)
+LAYOUTS = [
+    (ast.StmtList, [('stmts', ITEMS)]),
+    (ast.ExprStmt, [('expr', NODE)]),
+    (ast.VarDeclStmt, [('var_id', TOKEN), ('var_type', TOKEN), ('var_expr', NODE)]),
+    (ast.AssignStmt, [('lhs', NODE), ('rhs', NODE)]),
+    (ast.StructDeclStmt, [('struct_id', TOKEN), ('var_decls', ITEMS)]),
+    (ast.FunDeclStmt, [('fun_name', TOKEN), ('params', ITEMS), ('return_type', TOKEN), ('stmt_list', NODE)]),
+    (ast.ReturnStmt, [('return_token', TOKEN), ('return_expr', NODE)]),
+    (ast.WhileStmt, [('bool_expr', NODE), ('stmt_list', NODE)]),
+    (ast.IfStmt, [('if_part', NODE), ('elseifs', ITEMS), ('has_else', FLAG), ('else_stmts', NODE)]),
+    (ast.BasicIf, [('bool_expr', NODE), ('stmt_list', NODE)]),
+    (ast.SimpleExpr, [('term', NODE)]),
+    (ast.ComplexExpr, [('first_operand', NODE), ('math_rel', TOKEN), ('rest', NODE)]),
+    (ast.NaryExpr, [('operands', ITEMS), ('math_rels', ITEMS)]),
+    (ast.BoolExpr, [('first_expr', NODE), ('bool_rel', TOKEN), ('second_expr', NODE),
+                    ('bool_connector', TOKEN), ('rest', NODE), ('negated', FLAG)]),
+    (ast.LValue, [('path', ITEMS)]),
+    (ast.FunParam, [('param_name', TOKEN), ('param_type', TOKEN)]),
+    (ast.SimpleRValue, [('val', TOKEN)]),
+    (ast.ConstRValue, [('val', TOKEN)]),
+    (ast.NewRValue, [('struct_type', TOKEN)]),
+    (ast.CallRValue, [('fun', TOKEN), ('args', ITEMS)]),
+    (ast.IDRvalue, [('path', ITEMS)]),
+    (List, []),
+]
+
+# node classes indexed by their (one byte) kind code
+KINDS = [node_class for node_class, fields in LAYOUTS]
+KIND_CODES = {node_class: code for code, node_class in enumerate(KINDS)}
+LAYOUT_OF = {node_class: fields for node_class, fields in LAYOUTS}
+LIST_KIND = KIND_CODES[List]
+
+# a child reference is a node index (>= 0), NONE, or an encoded token index
+NONE = -1
+
+def token_ref(token_index):
+    """Returns the child reference of a token index"""
+    return -2 - token_index
+
+def ref_token_index(ref):
+    """Returns the token index of a token child reference"""
+    return -2 - ref
+
+
+class FlatAST(object):
+    """A program as parallel arrays. Nodes are stored in post-order
+    (children before their parent), so node i's subtree occupies the
+    indexes just before i and the program's StmtList is the last node.
+    The children of node i are children[child_offsets[i]:child_offsets[i+1]],
+    one per non-flag field (or per item for a list node).
+    """
+    def __init__(self, source_map=None):
+        self.kinds = array('B')             # KIND_CODES value per node
+        self.tokens_of = array('i')         # main token index per node (or NONE)
+        self.flags = array('B')             # FLAG fields per node (bit i = i-th flag)
+        self.child_offsets = array('i', [0])  # start of each node's children
+        self.children = array('i')          # child references
+        self.tokens = token.TokenStream(source_map)
+        self.root = NONE
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def kind(self, i):
+        """Returns the node class of node i"""
+        return KINDS[self.kinds[i]]
+
+    def child_refs(self, i):
+        """Returns the child references of node i"""
+        return self.children[self.child_offsets[i]:self.child_offsets[i + 1]]
+
+    def token(self, i):
+        """Returns the main token of node i (for error locations), or None"""
+        index = self.tokens_of[i]
+        return None if index == NONE else self.tokens[index]
+
+    def field(self, i, name):
+        """Returns a field of node i: a node index, a token, a list of
+        node indexes or tokens, a bool, or None"""
+        refs = self.child_refs(i)
+        child = flag = 0
+        for field_name, layout in LAYOUTS[self.kinds[i]][1]:
+            if layout == FLAG:
+                if field_name == name:
+                    return bool(self.flags[i] >> flag & 1)
+                flag += 1
+                continue
+            if field_name == name:
+                return self.__value(refs[child])
+            child += 1
+        raise KeyError(name)
+
+    def __value(self, ref):
+        if ref == NONE:
+            return None
+        if ref < NONE:
+            return self.tokens[ref_token_index(ref)]
+        if self.kinds[ref] == LIST_KIND:
+            return [self.__value(item) for item in self.child_refs(ref)]
+        return ref
+
+    def add_token(self, the_token):
+        """Appends a token, returns its child reference"""
+        if self.tokens.source_map is None:
+            self.tokens.source_map = the_token.source_map
+        self.tokens.append(the_token)
+        return token_ref(len(self.tokens) - 1)
+
+    def add_node(self, node_class, refs, flags=0):
+        """Appends a node (after its children), returns its index"""
+        self.kinds.append(KIND_CODES[node_class])
+        main_token = NONE
+        for ref in refs:
+            if ref < NONE:
+                main_token = ref_token_index(ref)
+                break
+        self.tokens_of.append(main_token)
+        self.flags.append(flags)
+        self.children.extend(refs)
+        self.child_offsets.append(len(self.children))
+        return len(self.kinds) - 1
+
+    def add(self, root):
+        """Appends an ast.py tree (a node or BasicIf), returns the index
+        of its root"""
+        # a pre-order walk that visits children right to left, reversed,
+        # gives the post-order (and needs no recursion on deep trees)
+        order = []
+        stack = [root]
+        while stack:
+            value = stack.pop()
+            order.append(value)
+            if type(value) is list:
+                stack.extend(item for item in value if type(item) is not token.Token)
+                continue
+            for name, layout in LAYOUT_OF[type(value)]:
+                if layout == NODE or layout == ITEMS:
+                    child = getattr(value, name)
+                    if child is not None:
+                        stack.append(child)
+        index_of = {}
+        for value in reversed(order):
+            refs = []
+            flags = 0
+            if type(value) is list:
+                node_class = List
+                for item in value:
+                    if type(item) is token.Token:
+                        refs.append(self.add_token(item))
+                    else:
+                        refs.append(index_of[id(item)])
+            else:
+                node_class = type(value)
+                flag = 0
+                for name, layout in LAYOUT_OF[node_class]:
+                    child = getattr(value, name)
+                    if layout == FLAG:
+                        flags |= child << flag
+                        flag += 1
+                    elif child is None:
+                        refs.append(NONE)
+                    elif layout == TOKEN:
+                        refs.append(self.add_token(child))
+                    else:
+                        refs.append(index_of[id(child)])
+            index_of[id(value)] = self.add_node(node_class, refs, flags)
+        return index_of[id(root)]
+
+    def to_ast(self, root=None):
+        """Returns the ast.py tree of node root (by default, the program)"""
+        if root is None:
+            root = self.root
+        # post-order: every child is built before its parent
+        start = root
+        stack = [root]
+        while stack:
+            for ref in self.child_refs(stack.pop()):
+                if ref >= 0:
+                    start = min(start, ref)
+                    stack.append(ref)
+        objects = {}
+        for i in range(start, root + 1):
+            values = []
+            for ref in self.child_refs(i):
+                if ref == NONE:
+                    values.append(None)
+                elif ref < NONE:
+                    values.append(self.tokens[ref_token_index(ref)])
+                else:
+                    values.append(objects.pop(ref))
+            node_class = KINDS[self.kinds[i]]
+            if node_class is List:
+                objects[i] = values
+                continue
+            node = node_class()
+            flag = 0
+            values.reverse()
+            for name, layout in LAYOUTS[self.kinds[i]][1]:
+                if layout == FLAG:
+                    setattr(node, name, bool(self.flags[i] >> flag & 1))
+                    flag += 1
+                else:
+                    setattr(node, name, values.pop())
+            if node_class is ast.ConstRValue:
+                # the token of a constant spells its value
+                node.value = runtime.literal_value(node.val)
+            objects[i] = node
+        return objects[root]
+
+
+def from_ast(stmt_list):
+    """Returns the FlatAST of an ast.StmtList"""
+    flat = FlatAST()
+    flat.root = flat.add(stmt_list)
+    return flat
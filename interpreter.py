@@ -2,163 +2,237 @@
 #
 # Author: Luke Hartman
 # Description:
-#   MyPL interpreter without funcitons, structs, and type checking.
+#   MyPL interpreter without type checking. A call runs the
+#   function's body with a new frame as the LOCAL frame; return sets a
+#   flag that the statement loops check (no exceptions), and self tail
+#   calls rebind the frame and run the body again. Each struct is a
+#   class with __slots__ (one per field), so a path is a chain of slot
+#   loads (see Resolver.visit_id_rvalue). With a memo size, the calls
+#   of pure functions are memoized (see memo.py). + on strings builds
+#   ropes (see rope.py), joined when a builtin needs a flat string.
 #----------------------------------------------------------------------
+import sys
 import ast
 import token as token
 import error as error
-import symbol_table as sym_tbl
+import resolver
+import runtime
+import output
+import memo
+import rope
+
+# interpreter version (part of the key of cached programs, see cache.py)
+VERSION = '0.18'
+
+# call depth allowed to MyPL programs (each call is a few Python calls)
+RECURSION_LIMIT = 100000
+
+# a result not in a memo cache
+MISSING = object()
 
 class Interpreter(ast.Visitor):
     """A MyPL interpreter visitor implementation"""
 
-    def __init__(self):
-        # initialize the symbol table (for ids -> values)
-        self.sym_table = sym_tbl.SymbolTable()
+    def __init__(self, memo_size=0):
+        # binds variables to frame slots before they run
+        self.resolver = resolver.Resolver()
+        # the frames by resolver depth: the globals and the running
+        # function's variables (None outside calls), lists indexed by slot
+        self.frames = [[], None]
+        # the declared functions {name:FunDeclStmt} and the running one
+        self.functions = {}
+        self.function = None
+        # set by return until the call ends, and by a tail call until
+        # the body starts over
+        self.returning = False
+        self.tail_call = False
+        # the memo caches of the pure functions {FunDeclStmt:MemoCache}
+        # (none when memo_size is 0)
+        self.memo_size = memo_size
+        self.purity = memo.Purity()
+        self.memos = {}
         # holds the type of last expression type
         self.current_value = None
-        # the heap {oid:struct_obj}
-        self.heap = {}
+        # the declared structs {name:(class, [(field, default expr)])}
+        self.structs = {}
 
     def __error(self, msg, the_token):
-        raise error.MyPLError(msg, the_token.line, the_token.column)
+        raise error.MyPLError(msg, the_token.line, the_token.column, the_token.snippet())
 
     def visit_stmt_list(self, stmt_list):
-        self.sym_table.push_environment()
+        # the block's variables have their slots in the current frame
         for stmt in stmt_list.stmts:
             stmt.accept(self)
-        self.sym_table.pop_environment()
+            if self.returning:
+                return
+
+    def __grow_globals(self):
+        globals_ = self.frames[resolver.GLOBAL]
+        globals_.extend([None] * (self.resolver.global_size() - len(globals_)))
+
+    def run(self, stmt_list):
+        """Executes a program"""
+        self.resolver.resolve(stmt_list)
+        self.__grow_globals()
+        if self.memo_size:
+            self.purity.analyze(stmt_list)
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+        try:
+            stmt_list.accept(self)
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def run_stream(self, stmts):
+        """Executes top-level statements as they arrive (for example from
+        Parser.parse_stream()) in a single global environment. Statements
+        are dropped once run; declarations keep what they need.
+        """
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+        try:
+            for stmt in stmts:
+                self.resolver.resolve_stmt(stmt)
+                self.__grow_globals()
+                if self.memo_size and isinstance(stmt, ast.FunDeclStmt):
+                    self.purity.analyze_function(stmt)
+                stmt.accept(self)
+                # a top-level return ends the program
+                if self.returning:
+                    return
+        finally:
+            sys.setrecursionlimit(limit)
 
     def visit_id_rvalue(self, id_rvalue):
-        var_name = id_rvalue.path[0].lexeme
-        var_val = self.sym_table.get_info(var_name)
-        for path_id in id_rvalue.path[1:]:
-            print(path_id) # hw7
-            #... handle path expressions ...
+        var_val = self.frames[id_rvalue.depth][id_rvalue.slot]
+        if id_rvalue.fields is not None:
+            try:
+                var_val = id_rvalue.fields(var_val)
+            except AttributeError:
+                self.__error('bad path: nil value or unknown field', id_rvalue.path[0])
         self.current_value = var_val
 
     def visit_lvalue(self, lval):
-        identifier = lval.path[0].lexeme
         if len(lval.path) == 1:
-            self.sym_table.set_info(identifier, self.current_value)
-        else:
-            pass # hw7
+            self.frames[lval.depth][lval.slot] = self.current_value
+            return
+        obj = self.frames[lval.depth][lval.slot]
+        try:
+            if lval.fields is not None:
+                obj = lval.fields(obj)
+            setattr(obj, runtime.field_name(lval.path[-1].lexeme), self.current_value)
+        except AttributeError:
+            self.__error('bad path: nil value or unknown field', lval.path[0])
 
     def visit_var_decl_stmt(self, var_decl):
         var_decl.var_expr.accept(self)
-        exp_value = self.current_value
-        var_name = var_decl.var_id.lexeme
-        self.sym_table.add_id(var_name)
-        self.sym_table.set_info(var_name, exp_value)
+        self.frames[var_decl.depth][var_decl.slot] = self.current_value
 
     def visit_call_rvalue(self, call_rvalue):
-        # handle built in functions first
-        built_ins = ['print', 'length', 'get', 'readi', 'reads',
-                     'readf', 'itof', 'itos', 'ftos', 'stoi', 'stof']
-        if call_rvalue.fun.lexeme in built_ins:
-            self.__built_in_fun_helper(call_rvalue)
-        else:
-            # user-defined fxn calls
-            pass
+        builtin = call_rvalue.builtin
+        if builtin is None:
+            self.__user_fun_call(call_rvalue)
+            return
+        if call_rvalue.text is not None:
+            # print of a literal, escapes already resolved
+            output.write(call_rvalue.text)
+            self.current_value = None
+            return
+        arg_vals = []
+        for arg in call_rvalue.args:
+            arg.accept(self)
+            value = self.current_value
+            if type(value) is rope.Rope and not builtin.ropes:
+                value = str(value)
+            arg_vals.append(value)
+        if None in arg_vals:
+            self.__error('bad value: should not be nil', call_rvalue.fun)
+        try:
+            self.current_value = builtin.function(*arg_vals)
+        except runtime.BuiltinError as e:
+            self.__error(str(e), call_rvalue.fun)
 
-    # Basic structure of the built-in function call helper
-    def __built_in_fun_helper(self, call_rvalue):
-        fun_name = call_rvalue.fun.lexeme
+    def __user_fun_call(self, call_rvalue):
+        fun_decl = self.functions.get(call_rvalue.fun.lexeme)
+        if fun_decl is None:
+            self.__error('undefined function "%s"' % call_rvalue.fun.lexeme, call_rvalue.fun)
+        if len(call_rvalue.args) != len(fun_decl.params):
+            self.__error('wrong number of arguments', call_rvalue.fun)
         arg_vals = []
         for arg in call_rvalue.args:
             arg.accept(self)
             arg_vals.append(self.current_value)
+        frames = self.frames
+        if call_rvalue.tail and fun_decl is self.function:
+            # reuse the frame: the arguments become the parameters and
+            # the statements unwind to the body's loop in the call
+            frames[resolver.LOCAL][:len(arg_vals)] = arg_vals
+            self.tail_call = self.returning = True
+            return
+        memo_cache = self.memos.get(fun_decl)
+        if memo_cache is not None:
+            key = memo.memo_key(arg_vals)
+            value = memo_cache.get(key, MISSING)
+            if value is not MISSING:
+                self.current_value = value
+                return
+        # the parameters are the first slots of the new frame
+        arg_vals.extend([None] * (fun_decl.frame_size - len(arg_vals)))
+        caller_frame = frames[resolver.LOCAL]
+        caller = self.function
+        frames[resolver.LOCAL] = arg_vals
+        self.function = fun_decl
+        try:
+            fun_decl.stmt_list.accept(self)
+            while self.tail_call:
+                self.tail_call = self.returning = False
+                fun_decl.stmt_list.accept(self)
+        except RecursionError:
+            self.__error('stack overflow', call_rvalue.fun)
+        if self.returning:
+            self.returning = False
+        else:
+            # the body ended without a return
+            self.current_value = None
+        frames[resolver.LOCAL] = caller_frame
+        self.function = caller
+        if memo_cache is not None:
+            memo_cache.put(key, self.current_value)
 
-        #... evaluate each call argument and store in arg_vals ...
-        # check for nil values
-        for arg in enumerate(arg_vals):
-            if arg is None:
-                # ... report a nil value error ...
-                self.__error('bad value: should not be nil', call_rvalue.fun)
-
-            # perform each function
-            if fun_name == 'print':
-                arg_vals[0] = str(arg_vals[0])
-                arg_vals[0] = arg_vals[0].replace('\\n','\n')
-                print(arg_vals[0], end='')
-            elif fun_name == 'length':
-                self.current_value = len(arg_vals[0])
-            elif fun_name == 'get':
-                if 0 <= arg_vals[0] < len(arg_vals[1]):
-                    self.current_value = arg_vals[1][arg_vals[0]]
-                else:
-                    self.__error('Index of range', call_rvalue.fun)
-            elif fun_name == 'itof':
-                try:
-                    self.current_value == float(arg_vals[0])
-                except:
-                    self.__error('bad argument: should be an int', call_rvalue.fun)
-            elif fun_name == 'itos':
-                try:
-                    self.current_value == str(arg_vals[0])
-                except:
-                    self.__error('bad argument: should be an int', call_rvalue.fun)
-            elif fun_name == 'stoi':
-                try:
-                    self.current_value == int(arg_vals[0])
-                except:
-                    self.__error('bad argument: should be a string', call_rvalue.fun)
-            elif fun_name == 'stof':
-                try:
-                    self.current_value == float(arg_vals[0])
-                except:
-                    self.__error('bad argument: should be a string', call_rvalue.fun)
-        # functions without arguments    
-        if fun_name == 'reads':
-            try:
-                self.current_value = str(input())
-            except ValueError:
-                self.__error('bad string', call_rvalue.fun)
-        elif fun_name == 'readi':
-            try:
-                self.current_value = int(input())
-            except ValueError:
-                self.__error('bad int value', call_rvalue.fun)
-        elif fun_name == 'readf':
-            try:
-                self.current_value = float(input())
-            except ValueError:
-                self.__error('bad float value', call_rvalue.fun)    
+    def stats(self):
+        """Returns the memo counters of the pure functions called:
+        {name:(hits, misses, evictions)}"""
+        return {fun_decl.fun_name.lexeme: (cache.hits, cache.misses, cache.evictions)
+                for fun_decl, cache in self.memos.items() if cache.hits or cache.misses}
 
     def visit_expr_stmt(self, expr_stmt):
         expr_stmt.expr.accept(self)
 
     def visit_assign_stmt(self, assign_stmt): 
         assign_stmt.rhs.accept(self)
-        self.sym_table.set_info(assign_stmt.lhs.path[0].lexeme, self.current_value) 
+        assign_stmt.lhs.accept(self)
 
     def visit_while_stmt(self, while_stmt):
-        self.sym_table.push_environment()
         while_stmt.bool_expr.accept(self)
         while self.current_value:
             for stmt in while_stmt.stmt_list.stmts:
                 stmt.accept(self)
+                if self.returning:
+                    return
             while_stmt.bool_expr.accept(self)
-        self.sym_table.pop_environment()
 
     def visit_if_stmt(self, if_stmt):
         if_stmt.if_part.bool_expr.accept(self)
         if self.current_value:
-            self.sym_table.push_environment()
             if_stmt.if_part.stmt_list.accept(self)
-            self.sym_table.pop_environment()
             return
         for elseif in if_stmt.elseifs:
             elseif.bool_expr.accept(self)
             if self.current_value:
-                self.sym_table.push_environment()
                 elseif.stmt_list.accept(self)
-                self.sym_table.pop_environment()
                 return
         if if_stmt.has_else:
-            self.sym_table.push_environment()
             if_stmt.else_stmts.accept(self)
-            self.sym_table.pop_environment()
             return
 
 
@@ -170,27 +244,48 @@ class Interpreter(ast.Visitor):
         first_val = self.current_value
         complex_expr.rest.accept(self)
         second_val = self.current_value
-        mathrel = complex_expr.math_rel
+        self.current_value = self.__math(complex_expr.math_rel, first_val, second_val)
 
+    def visit_nary_expr(self, nary_expr):
+        operands = nary_expr.operands
+        operands[0].accept(self)
+        value = self.current_value
+        for i, mathrel in enumerate(nary_expr.math_rels):
+            operands[i + 1].accept(self)
+            value = self.__math(mathrel, value, self.current_value)
+        self.current_value = value
+
+    def __math(self, mathrel, first_val, second_val):
+        """Applies a math operator token to two values"""
         # because I don't have my type checker
-        if isinstance(first_val, str) or isinstance(second_val, str):
+        if rope.is_string(first_val) or rope.is_string(second_val):
+            if mathrel.tokentype == token.PLUS:
+                return rope.concat(first_val, second_val)
             first_val = str(first_val)
             second_val = str(second_val)
 
         # [token.PLUS, token.MINUS, token.DIVIDE, token.MULTIPLY, token.MODULO]
         if mathrel.tokentype == token.PLUS:
-            self.current_value = first_val + second_val
+            return first_val + second_val
         elif mathrel.tokentype == token.MINUS:
-            self.current_value = first_val - second_val
+            return first_val - second_val
         elif mathrel.tokentype == token.DIVIDE:
-            self.current_value = first_val / second_val
+            try:
+                return runtime.divide(first_val, second_val)
+            except runtime.BuiltinError as e:
+                self.__error(str(e), mathrel)
         elif mathrel.tokentype == token.MULTIPLY:
-            self.current_value = first_val * second_val
+            return first_val * second_val
         elif mathrel.tokentype == token.MODULO:
-            self.current_value = first_val % second_val
+            try:
+                return runtime.modulo(first_val, second_val)
+            except runtime.BuiltinError as e:
+                self.__error(str(e), mathrel)
 
     def visit_bool_expr(self, bool_expr):
         bool_expr.first_expr.accept(self)
+        if bool_expr.negated:
+            self.current_value = not self.current_value
         first_expr_val = self.current_value
         # [token.EQUAL, token.LESS_THAN, token.GREATER_THAN, token.LESS_THAN_EQUAL, token.GREATER_THAN_EQUAL, token.NOT_EQUAL]
         if bool_expr.bool_rel:
@@ -208,6 +303,12 @@ class Interpreter(ast.Visitor):
                 self.current_value = (first_expr_val >= second_expr_val)
             elif bool_expr.bool_rel.tokentype == token.NOT_EQUAL:
                 self.current_value = (first_expr_val != second_expr_val)
+        if bool_expr.bool_connector:
+            # short circuit: the rest is only evaluated when it decides
+            if bool_expr.bool_connector.tokentype == token.AND and self.current_value:
+                bool_expr.rest.accept(self)
+            elif bool_expr.bool_connector.tokentype == token.OR and not self.current_value:
+                bool_expr.rest.accept(self)
 
 
     
@@ -228,12 +329,41 @@ class Interpreter(ast.Visitor):
             self.current_value = float(rval_lexeme)
         elif rval_type == token.NIL:
             self.current_value = None
-    
-    # hw7
+
+    def visit_const_rvalue(self, const_rvalue):
+        self.current_value = const_rvalue.value
+
     def visit_struct_decl_stmt(self, struct_decl):
-        struct_decl.accept(self)
+        fields = [runtime.field_name(var_decl.var_id.lexeme) for var_decl in struct_decl.var_decls]
+        cls = type(struct_decl.struct_id.lexeme, (object,), {'__slots__': tuple(fields)})
+        defaults = [(field, var_decl.var_expr) for field, var_decl in zip(fields, struct_decl.var_decls)]
+        self.structs[struct_decl.struct_id.lexeme] = (cls, defaults)
+
+    def visit_fun_decl_stmt(self, fun_decl):
+        self.functions[fun_decl.fun_name.lexeme] = fun_decl
+        if self.memo_size:
+            # a redeclaration may make its callers impure
+            self.memos = {fun: cache for fun, cache in self.memos.items()
+                          if fun.fun_name.lexeme in self.purity.pure}
+            if fun_decl.fun_name.lexeme in self.purity.pure:
+                self.memos[fun_decl] = memo.MemoCache(self.memo_size)
+
+    def visit_return_stmt(self, return_stmt):
+        if return_stmt.return_expr is None:
+            self.current_value = None
+        else:
+            return_stmt.return_expr.accept(self)
+        self.returning = True
 
-    def visit_fun_decl_stmt(self, fun_decl): pass
-    def visit_return_stmt(self, return_stmt): pass
-    def visit_new_rvalue(self, new_rvalue): pass
+    def visit_new_rvalue(self, new_rvalue):
+        struct = self.structs.get(new_rvalue.struct_type.lexeme)
+        if struct is None:
+            self.__error('undefined struct "%s"' % new_rvalue.struct_type.lexeme, new_rvalue.struct_type)
+        cls, defaults = struct
+        obj = cls()
+        # each new evaluates the defaults (a default may be a new)
+        for field, var_expr in defaults:
+            var_expr.accept(self)
+            setattr(obj, field, self.current_value)
+        self.current_value = obj
     def visit_fun_param(self, fun_param): pass
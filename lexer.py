@@ -4,17 +4,173 @@
 #   This is a Lexer class for MyPL.
 #   The class outputs tokens one-by-one
 #   from a source file
+import bisect
+import collections
+import itertools
+import os
 import token
 import error
 
+# characters that end an identifier or keyword lexeme
+ID_DELIMITERS = frozenset([';', ':', '(', '[', ')', ']', '.', ',', '%', '+', '\n', '=', '<', '>', '!', ' '])
+
+# characters that may follow the first digit of a number
+NUMBER_FOLLOWERS = frozenset([';', ',', '%', ')', '\n', ' ', '/', '*', '+', '-', '=', '!', '.'])
+
+# characters that end a number lexeme ('' at EOF)
+NUMBER_DELIMITERS = frozenset([';', ',', '%', ')', ']', '\n', ' ', '/', '*', '+', '-', '=', '!', ''])
+
+# characters that end a string lexeme
+STRING_DELIMITERS = frozenset(['"', '\n'])
+
+# characters of the latest source kept for error snippets
+WINDOW_SIZE = 1 << 20
+
+# number of characters read from the input stream at a time
+CHUNK_SIZE = 1 << 16
+
+class SourceMap(object):
+    """Maps character offsets in a source to lines and columns. Only the
+    offsets where lines start are recorded while reading; a line and
+    column are resolved (with a bisect) when an error is reported or a
+    debugger asks for them. Only the last WINDOW_SIZE characters read
+    are kept for error snippets; an older line is read again from the
+    source file (path), or has no snippet.
+    """
+    def __init__(self, path=None):
+        self.line_starts = [0]  # offset of the first character of each line
+        self.path = path        # the source file, if any
+        self.chunks = collections.deque()   # the latest pieces of the source
+        self.window_start = 0   # offset of the first character in chunks
+        self.size = 0           # number of characters added so far
+
+    @classmethod
+    def from_text(cls, text, path=None):
+        """Returns the map of a whole source"""
+        source_map = cls(path)
+        source_map.add_text(text)
+        return source_map
+
+    def add_text(self, text):
+        """Records the next piece of the source"""
+        line_starts = self.line_starts
+        index = text.find('\n')
+        while index != -1:
+            line_starts.append(self.size + index + 1)
+            index = text.find('\n', index + 1)
+        chunks = self.chunks
+        chunks.append(text)
+        self.size += len(text)
+        # drop the pieces before the window
+        while self.size - self.window_start - len(chunks[0]) >= WINDOW_SIZE:
+            self.window_start += len(chunks.popleft())
+
+    def position(self, offset):
+        """Returns the (line, column) of an offset, both starting at 1"""
+        line = bisect.bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1] + 1
+
+    def line_text(self, line):
+        """Returns the text of a line (without its newline), or None if
+        it isn't available any more"""
+        start = self.line_starts[line - 1]
+        if start >= self.window_start:
+            if len(self.chunks) > 1:
+                self.chunks = collections.deque([''.join(self.chunks)])
+            text = self.chunks[0] if self.chunks else ''
+            start -= self.window_start
+            end = text.find('\n', start)
+            return text[start:] if end == -1 else text[start:end]
+        if self.path is None:
+            return None
+        try:
+            with open(self.path, 'r') as f:
+                text = next(itertools.islice(f, line - 1, None), '')
+        except (OSError, ValueError):
+            return None
+        return text[:-1] if text.endswith('\n') else text
+
+    def snippet(self, offset):
+        """Returns the source line holding offset with a caret under it,
+        or None"""
+        line, column = self.position(offset)
+        text = self.line_text(line)
+        if text is None:
+            return None
+        indent = ''.join(c if c == '\t' else ' ' for c in text[:column - 1])
+        return text + '\n' + indent + '^'
+
+
+def source_path(input_stream):
+    """Returns the path of the file a stream reads, or None"""
+    name = getattr(input_stream, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    return None
+
+class SourceBuffer(object):
+    """The lexer input layer. Reads the input stream in large chunks
+    into a lookahead buffer so that any file-like object (including
+    stdin and pipes) can be lexed without seeking.
+    """
+    def __init__(self, input_stream, source_map=None, chunk_size=CHUNK_SIZE):
+        self.input_stream = input_stream
+        self.source_map = source_map
+        self.chunk_size = chunk_size
+        self.text = ''          # buffered characters
+        self.pos = 0            # offset of the next character in text
+        self.base = 0           # source offset of text[0]
+        self.eof = False
+
+    def fill(self):
+        """Drops the consumed characters and appends the next chunk of
+        the stream to the buffer. Returns False at the end of the stream.
+        """
+        if self.eof:
+            return False
+        chunk = self.input_stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        if self.source_map is not None:
+            self.source_map.add_text(chunk)
+        self.text = self.text[self.pos:] + chunk
+        self.base += self.pos
+        self.pos = 0
+        return True
+
 class Lexer(object):
-    def __init__(self, input_stream):
-        self.line = 1
-        self.column = 0
+    def __init__(self, input_stream, buffered=True):
         self.input_stream = input_stream
+        self.source_map = SourceMap(source_path(input_stream))
+        # in buffered mode the source is read in chunks and scanned by
+        # offset, otherwise the stream is read (and seeked) per character
+        self.buffered = buffered
+        if buffered:
+            self.buffer = SourceBuffer(input_stream, self.source_map)
+        else:
+            self.offset = 0     # number of characters read
+
+    def __offset(self):
+        """Returns the source offset of the next character"""
+        if self.buffered:
+            return self.buffer.base + self.buffer.pos
+        return self.offset
+
+    def __token(self, tokentype, lexeme, offset):
+        return token.Token(tokentype, lexeme, offset, self.source_map)
+
+    def __error(self, msg, offset):
+        line, column = self.source_map.position(offset)
+        raise error.MyPLError(msg, line, column, self.source_map.snippet(offset))
 
     def __peek(self):
         """Returns the next character keeping it in the stream"""
+        if self.buffered:
+            buf = self.buffer
+            if buf.pos >= len(buf.text):
+                buf.fill()
+            return buf.text[buf.pos:buf.pos + 1]
         pos = self.input_stream.tell()
         symbol = self.input_stream.read(1)
         self.input_stream.seek(pos)
@@ -22,219 +178,183 @@ class Lexer(object):
 
     def __read(self):
         """Read 1 character from the stream"""
-        return self.input_stream.read(1)
+        if self.buffered:
+            symbol = self.__peek()
+            self.buffer.pos += len(symbol)
+            return symbol
+        symbol = self.input_stream.read(1)
+        if symbol:
+            self.offset += 1
+            self.source_map.add_text(symbol)
+        return symbol
+
+    def __read_until(self, delimiters):
+        """Read characters up to (but not including) the next delimiter or EOF"""
+        if self.buffered:
+            buf = self.buffer
+            lexeme = ''
+            while True:
+                text = buf.text
+                start = end = buf.pos
+                size = len(text)
+                while end < size and text[end] not in delimiters:
+                    end += 1
+                lexeme += text[start:end]
+                buf.pos = end
+                if end < size or not buf.fill():
+                    return lexeme
+        lexeme = ''
+        symbol = self.__peek()
+        while symbol != '' and symbol not in delimiters:
+            lexeme += self.__read()
+            symbol = self.__peek()
+        return lexeme
 
     def __parse_space(self):
         """this function uses the .isspace() function to parse space characters"""
+        if self.buffered:
+            buf = self.buffer
+            while True:
+                text = buf.text
+                pos = buf.pos
+                size = len(text)
+                while pos < size and text[pos].isspace():
+                    pos += 1
+                buf.pos = pos
+                if pos < size or not buf.fill():
+                    return
         while self.__peek().isspace():
-            if self.__peek() == '\n':
-                self.line += 1
-                self.column = 0
-            else:
-                self.column += 1
             self.__read()
 
     def __parse_line(self):
         ''' This function reads the stream until the next line'''
-        while self.__peek() != '\n':
+        if self.buffered:
+            buf = self.buffer
+            while True:
+                end = buf.text.find('\n', buf.pos)
+                if end != -1:
+                    buf.pos = end + 1
+                    return
+                buf.pos = len(buf.text)
+                if not buf.fill():
+                    return
+        while self.__peek() not in ['\n', '']:
             self.__read()
         self.__read()
 
     def next_token(self):
         """ Returns the next token to be parsed"""
         self.__parse_space()
-        curr_lexeme = ''
-        symbol = self.__read()
-
-        # handle single character and <= >= == lexeme cases
-
-        while symbol == '#' or symbol == '\n': # if next char is a comment, parse to next line
+        while self.__peek() == '#': # if next char is a comment, parse to next line
             self.__parse_line()
             self.__parse_space()
-            self.column = 0
-            self.line += 1
-            symbol = self.__read()
-        curr_lexeme += symbol
+        start = self.__offset()
+        symbol = self.__read()
+        curr_lexeme = symbol
         next_symbol = self.__peek()
-        self.column += 1
 
+        # handle single character and <= >= == lexeme cases
         if symbol == '': # if next char is EOF, return EOS token
-            self.column = 0
-            return token.Token(token.EOS, curr_lexeme, self.line + 1, self.column)
+            return self.__token(token.EOS, curr_lexeme, start)
 
         elif symbol == ';':
-            return token.Token(token.SEMICOLON, curr_lexeme, self.line, self.column)
+            return self.__token(token.SEMICOLON, curr_lexeme, start)
 
         elif symbol == '.':
             if next_symbol.isdigit():
-                raise error.MyPLError("invalid float value: must start with digit", self.line, self.column)
-            return token.Token(token.DOT, curr_lexeme, self.line, self.column)
+                self.__error("invalid float value: must start with digit", start)
+            return self.__token(token.DOT, curr_lexeme, start)
 
         elif symbol == ',':
-            return token.Token(token.COMMA, curr_lexeme, self.line, self.column)
+            return self.__token(token.COMMA, curr_lexeme, start)
 
         elif symbol == ':':
-            return token.Token(token.COLON, curr_lexeme, self.line, self.column)
+            return self.__token(token.COLON, curr_lexeme, start)
 
         elif symbol == '=':
             if next_symbol == '=': # handle '==' token
                 curr_lexeme += self.__read()
-                self.column += 1
-                return token.Token(token.EQUAL, curr_lexeme, self.line, self.column)
+                return self.__token(token.EQUAL, curr_lexeme, start)
             else:
-                return token.Token(token.ASSIGN, curr_lexeme, self.line, self.column)
+                return self.__token(token.ASSIGN, curr_lexeme, start)
 
         elif symbol == '/':
-            return token.Token(token.DIVIDE, curr_lexeme, self.line, self.column)
+            return self.__token(token.DIVIDE, curr_lexeme, start)
 
         elif symbol == '>':
             if next_symbol == '=': # handle '>=' token
                 curr_lexeme += self.__read()
-                self.column += 1
-                return token.Token(token.GREATER_THAN_EQUAL, curr_lexeme, self.line, self.column)
+                return self.__token(token.GREATER_THAN_EQUAL, curr_lexeme, start)
             else:
-                return token.Token(token.GREATER_THAN, curr_lexeme, self.line, self.column)
+                return self.__token(token.GREATER_THAN, curr_lexeme, start)
         elif symbol == '!' and next_symbol == '=':
             curr_lexeme += self.__read()
-            self.column += 1
-            return token.Token(token.NOT_EQUAL, curr_lexeme, self.line, self.column - 1)
+            return self.__token(token.NOT_EQUAL, curr_lexeme, start)
         elif symbol == '<':
             if next_symbol == '=':
                 curr_lexeme += self.__read()
-                self.column += 1
-                return token.Token(token.LESS_THAN_EQUAL, curr_lexeme, self.line, self.column)
+                return self.__token(token.LESS_THAN_EQUAL, curr_lexeme, start)
             else:
-                return token.Token(token.LESS_THAN, curr_lexeme, self.line, self.column)
+                return self.__token(token.LESS_THAN, curr_lexeme, start)
 
         elif symbol == '(':
-            return token.Token(token.LPAREN, curr_lexeme, self.line, self.column)
+            return self.__token(token.LPAREN, curr_lexeme, start)
 
         elif symbol == ')':
-            return token.Token(token.RPAREN, curr_lexeme, self.line, self.column)
+            return self.__token(token.RPAREN, curr_lexeme, start)
 
         elif symbol == '-':
-            return token.Token(token.MINUS, curr_lexeme, self.line, self.column)
+            return self.__token(token.MINUS, curr_lexeme, start)
 
         elif symbol == '%':
-            return token.Token(token.MODULO, curr_lexeme, self.line, self.column)
+            return self.__token(token.MODULO, curr_lexeme, start)
 
         elif symbol == '*':
-            return token.Token(token.MULTIPLY, curr_lexeme, self.line, self.column)
+            return self.__token(token.MULTIPLY, curr_lexeme, start)
 
         elif symbol == '+':
-            return token.Token(token.PLUS, curr_lexeme, self.line, self.column)
+            return self.__token(token.PLUS, curr_lexeme, start)
 
         # cases that start with a digit
         elif symbol.isdigit():
-            if not next_symbol.isdigit() and next_symbol not in  [';', ',', '%', ')', '\n', ' ', '/', '*', '+', '-', '=', '!', '.']:
-                raise error.MyPLError("do not mix ints/floats with other symbol types", self.line, self.column)
+            if not next_symbol.isdigit() and next_symbol not in NUMBER_FOLLOWERS:
+                self.__error("do not mix ints/floats with other symbol types", start)
             elif int(symbol) == 0 and next_symbol.isdigit():
-                raise error.MyPLError("invalid integer value: starts with 0", self.line, self.column)
+                self.__error("invalid integer value: starts with 0", start)
             else:
                 isFloat = False
                 index = 0
-                while next_symbol not in [';', ',', '%', ')', ']', '\n', ' ', '/', '*', '+', '-', '=', '!', '']:
+                while next_symbol not in NUMBER_DELIMITERS:
                     if next_symbol == '.':
                         if isFloat == True:
-                            raise error.MyPLError("invalid float: duplicate periods", self.line, self.column)
+                            self.__error("invalid float: duplicate periods", start)
                         else:
                             isFloat = True
                     curr_lexeme += self.__read()
                     next_symbol = self.__peek()
                     index += 1
                     if curr_lexeme[index] == '.' and not next_symbol.isdigit():
-                        raise error.MyPLError("invalid float: cannot end with '.'", self.line, self.column)
-                self.column += index
+                        self.__error("invalid float: cannot end with '.'", start)
                 if isFloat == True:
-                    return token.Token(token.FLOATVAL, curr_lexeme, self.line, self.column - index)
+                    return self.__token(token.FLOATVAL, curr_lexeme, start)
                 else:
-                    return token.Token(token.INTVAL, curr_lexeme, self.line, self.column - index)
+                    return self.__token(token.INTVAL, curr_lexeme, start)
         # handle cases with multiple alphanumeric characters
         elif curr_lexeme[0] != '"':
             # append to curr_lexeme till end of token
-            while next_symbol not in [';', ':', '(', '[', ')', ']', '.', ',', '%', "+", '\n', '=', '<', '>', '!', ' ', '']:
-                curr_lexeme += self.__read()
-                next_symbol = self.__peek()
-            #return token.Token(token.PLUS, curr_lexeme, self.line, self.column)
+            curr_lexeme += self.__read_until(ID_DELIMITERS)
+            #return self.__token(token.PLUS, curr_lexeme, start)
             # check the newly formed lexeme for errors
             if curr_lexeme[0] == '_':
-                raise error.MyPLError("invalid id: cannot start identifier with '_'", self.line, self.column)
-            if curr_lexeme == 'true' or curr_lexeme == "false":
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.BOOLVAL, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'int':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.INTTYPE, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'float':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.FLOATTYPE, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'struct':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.STRUCTTYPE, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'string':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.STRINGTYPE, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'or':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.OR, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'and':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.AND, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'not':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.NOT, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'while':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.WHILE, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'do':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.DO, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'if':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.IF, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'then':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.THEN, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'else':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.ELSE, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'elif':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.ELIF, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'end':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.END, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'fun':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.FUN, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'set':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.SET, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'var':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.VAR, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'return':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.RETURN, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'new':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.NEW, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'nil':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.NIL, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            if curr_lexeme == 'bool':
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.BOOLTYPE, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
-            else:
-                self.column += len(curr_lexeme) - 1
-                return token.Token(token.ID, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
+                self.__error("invalid id: cannot start identifier with '_'", start)
+            # keywords (and boolean values) map straight to their token type
+            tokentype = token.KEYWORDS.get(curr_lexeme, token.ID)
+            return self.__token(tokentype, curr_lexeme, start)
         # handle cases that appear to be string values
         elif curr_lexeme[0] == '"':
-            while next_symbol != '"':
-                curr_lexeme += self.__read()
-                next_symbol = self.__peek()
-                if next_symbol == '\n':
-                    raise error.MyPLError("invalid string val: cannot have newline in string", self.line, self.column)
+            curr_lexeme += self.__read_until(STRING_DELIMITERS)
+            if self.__peek() != '"':
+                self.__error("invalid string val: cannot have newline in string", start)
 
             curr_lexeme += self.__read()
             next_symbol = self.__peek()
@@ -242,10 +362,9 @@ class Lexer(object):
             index = 0
             for char in curr_lexeme:
                 if char == '"' and index != 0 and index != len(curr_lexeme) - 1:
-                    raise error.MyPLError("invalid string val: cannot have \" in string", self.line, self.column)
+                    self.__error("invalid string val: cannot have \" in string", start)
                 index += 1
-            self.column += len(curr_lexeme) - 1
             curr_lexeme = curr_lexeme.replace('"', '')
-            return token.Token(token.STRINGVAL, curr_lexeme, self.line, self.column - len(curr_lexeme) + 1)
+            return self.__token(token.STRINGVAL, curr_lexeme, start)
         else:
-            raise error.MyPLError("every other error I didn't explicitly hardcode :)", self.line, self.column)
+            self.__error("every other error I didn't explicitly hardcode :)", start)
@@ -0,0 +1,464 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   MyPL while loop optimizer, run after optimizer.Optimizer (it
+#   expects decoded constants). Loop-invariant expressions (built from
+#   constants, variables the loop doesn't assign and calls to pure
+#   builtins) are hoisted into temporaries declared before the loop,
+#   and induction variable products (i * 4, with set i = i + 1 in the
+#   body) are strength reduced to a temporary stepped by an addition.
+#
+#   A hoisted expression is still evaluated at its original point of
+#   the first iteration: only expressions evaluated before anything
+#   that may fail or have an effect are hoisted, and hoists from the
+#   body go in a rotated loop (if c then <hoists> while c ... end end)
+#   so they don't run when the loop doesn't, which needs a pure
+#   condition. Temporaries start with '_', which MyPL names can't.
+#----------------------------------------------------------------------
+import ast
+import token
+import builtin_registry
+import flat_ast
+import printer
+import optimizer
+
+
+def children(node):
+    """Returns the child nodes of a node (or BasicIf)"""
+    nodes = []
+    for name, layout in flat_ast.LAYOUT_OF[type(node)]:
+        if layout == flat_ast.NODE:
+            child = getattr(node, name)
+            if child is not None:
+                nodes.append(child)
+        elif layout == flat_ast.ITEMS:
+            nodes.extend(item for item in getattr(node, name) if not isinstance(item, token.Token))
+    return nodes
+
+def walk(node):
+    """Yields every node of a subtree"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(children(node))
+
+def copy_tree(node):
+    """Returns a copy of a subtree (its tokens are shared)"""
+    the_copy = type(node)()
+    for name, layout in flat_ast.LAYOUT_OF[type(node)]:
+        value = getattr(node, name)
+        if layout == flat_ast.NODE and value is not None:
+            value = copy_tree(value)
+        elif layout == flat_ast.ITEMS:
+            value = [item if isinstance(item, token.Token) else copy_tree(item) for item in value]
+        setattr(the_copy, name, value)
+    if isinstance(node, ast.ConstRValue):
+        the_copy.value = node.value
+    return the_copy
+
+def int_constant(expr):
+    """Returns the value of an int literal expression, or None"""
+    if isinstance(expr, ast.SimpleExpr) and isinstance(expr.term, ast.ConstRValue):
+        if type(expr.term.value) is int:
+            return expr.term.value
+    return None
+
+def variable(expr):
+    """Returns the name of a simple variable expression, or None"""
+    if isinstance(expr, ast.SimpleExpr) and isinstance(expr.term, ast.IDRvalue):
+        if len(expr.term.path) == 1:
+            return expr.term.path[0].lexeme
+    return None
+
+def quiet(expr):
+    """Returns True if evaluating expr can't fail or have an effect"""
+    return (variable(expr) is not None or
+            isinstance(expr, ast.SimpleExpr) and isinstance(expr.term, ast.SimpleRValue))
+
+def variable_expr(name, the_token):
+    """Returns a SimpleExpr reading a variable, located at the_token"""
+    id_rvalue = ast.IDRvalue()
+    id_rvalue.path.append(token.Token(token.ID, name, the_token.offset, the_token.source_map))
+    simple_expr = ast.SimpleExpr()
+    simple_expr.term = id_rvalue
+    return simple_expr
+
+def var_decl(name, expr):
+    """Returns the declaration of a variable initialized to expr"""
+    var_decl_stmt = ast.VarDeclStmt()
+    var_decl_stmt.var_id = variable_expr(name, ast.first_token(expr)).term.path[0]
+    var_decl_stmt.var_expr = expr
+    return var_decl_stmt
+
+
+class Loop(object):
+    """What a while loop assigns and calls"""
+
+    def __init__(self, while_stmt, functions):
+        self.assigned = {}          # {name: number of assignments and declarations}
+        self.declared = set()       # names declared in the body
+        self.user_calls = False     # True if the loop calls a MyPL function
+        for node in walk(while_stmt):
+            if isinstance(node, ast.AssignStmt) and len(node.lhs.path) == 1:
+                name = node.lhs.path[0].lexeme
+                self.assigned[name] = self.assigned.get(name, 0) + 1
+            elif isinstance(node, ast.VarDeclStmt):
+                name = node.var_id.lexeme
+                self.assigned[name] = self.assigned.get(name, 0) + 1
+                self.declared.add(name)
+            elif isinstance(node, ast.CallRValue):
+                if node.fun.lexeme in functions or node.fun.lexeme not in builtin_registry.BUILTINS:
+                    self.user_calls = True
+
+
+class LoopOptimizer(ast.Visitor):
+    """Rewrites the while loops of a program in place. Statement
+    visitors leave the statements replacing theirs in current_stmts.
+    Every transformation is described in report (see --opt-report)."""
+
+    def __init__(self):
+        self.current_stmts = []
+        self.preceding = []         # the statements before the current one in its block
+        self.scopes = None          # [set of names] in a function, None at the top level
+        self.functions = set()      # MyPL function names (they take precedence over builtins)
+        self.temps = 0
+        self.hoisted = 0
+        self.reduced = 0
+        self.report = []
+        # state of the hoisting walk over one loop
+        self.loop = None
+        self.clean = True           # nothing that may fail or have an effect evaluated yet
+        self.hoists = []            # [VarDeclStmt] of the hoisted expressions
+
+    def optimize(self, stmt_list):
+        """Optimizes a program (a StmtList), returns it"""
+        for stmt in stmt_list.stmts:
+            if isinstance(stmt, ast.FunDeclStmt):
+                self.functions.add(stmt.fun_name.lexeme)
+        stmt_list.accept(self)
+        return stmt_list
+
+    def summary(self):
+        return '%d expressions hoisted, %d products strength reduced' % (self.hoisted, self.reduced)
+
+    def __temp(self, prefix):
+        self.temps += 1
+        return '_%s%d' % (prefix, self.temps)
+
+    def __local(self, name):
+        """Returns True if name is a variable of the current function
+        (a call can't assign it)"""
+        return self.scopes is not None and any(name in scope for scope in self.scopes)
+
+    def __pure_call(self, call_rvalue):
+        name = call_rvalue.fun.lexeme
+        builtin = builtin_registry.lookup(name)
+        return builtin is not None and builtin.pure and name not in self.functions
+
+    #--------------------------------------------------------------------
+    # statements
+
+    def visit_stmt_list(self, stmt_list):
+        if self.scopes is not None:
+            self.scopes.append(set())
+        stmts = []
+        for stmt in stmt_list.stmts:
+            self.preceding = stmts
+            stmt.accept(self)
+            stmts.extend(self.current_stmts)
+            if self.scopes is not None and isinstance(stmt, ast.VarDeclStmt):
+                self.scopes[-1].add(stmt.var_id.lexeme)
+        stmt_list.stmts = stmts
+        if self.scopes is not None:
+            self.scopes.pop()
+
+    def visit_expr_stmt(self, expr_stmt):
+        self.current_stmts = [expr_stmt]
+
+    def visit_var_decl_stmt(self, var_decl):
+        self.current_stmts = [var_decl]
+
+    def visit_assign_stmt(self, assign_stmt):
+        self.current_stmts = [assign_stmt]
+
+    def visit_return_stmt(self, return_stmt):
+        self.current_stmts = [return_stmt]
+
+    def visit_struct_decl_stmt(self, struct_decl):
+        self.current_stmts = [struct_decl]
+
+    def visit_fun_decl_stmt(self, fun_decl):
+        self.functions.add(fun_decl.fun_name.lexeme)
+        self.scopes = [set(param.param_name.lexeme for param in fun_decl.params)]
+        fun_decl.stmt_list.accept(self)
+        self.scopes = None
+        self.current_stmts = [fun_decl]
+
+    def visit_if_stmt(self, if_stmt):
+        for basic_if in [if_stmt.if_part] + if_stmt.elseifs:
+            basic_if.stmt_list.accept(self)
+        if if_stmt.has_else:
+            if_stmt.else_stmts.accept(self)
+        self.current_stmts = [if_stmt]
+
+    def visit_while_stmt(self, while_stmt):
+        preceding = self.preceding
+        # inner loops first, their hoists may be invariant here too
+        while_stmt.stmt_list.accept(self)
+        before = self.__reduce(while_stmt, Loop(while_stmt, self.functions), preceding)
+        # (with the updates of the strength reduced temporaries)
+        self.loop = Loop(while_stmt, self.functions)
+        # the condition is evaluated (at least) once at the loop entry
+        self.clean = True
+        self.hoists = []
+        self.__hoist_bool(while_stmt.bool_expr)
+        self.__report_hoists(while_stmt, 'condition')
+        before.extend(self.hoists)
+        stmt = while_stmt
+        if self.__pure(while_stmt.bool_expr):
+            # then the first iteration's body (the loop test ran clean)
+            self.clean = True
+            self.hoists = []
+            for body_stmt in while_stmt.stmt_list.stmts:
+                self.__hoist_stmt(body_stmt)
+            self.__report_hoists(while_stmt, 'body')
+            if self.hoists:
+                stmt = ast.IfStmt()
+                stmt.if_part.bool_expr = copy_tree(while_stmt.bool_expr)
+                stmt.if_part.stmt_list.stmts = self.hoists + [while_stmt]
+        self.loop = None
+        self.current_stmts = before + [stmt]
+
+    def __pure(self, bool_expr):
+        """Returns True if a condition has no effects (it may be evaluated
+        twice)"""
+        for node in walk(bool_expr):
+            if isinstance(node, ast.NewRValue):
+                return False
+            if isinstance(node, ast.CallRValue) and not self.__pure_call(node):
+                return False
+        return True
+
+    #--------------------------------------------------------------------
+    # loop-invariant code motion
+
+    def __invariant(self, expr):
+        for node in walk(expr):
+            if isinstance(node, ast.IDRvalue):
+                name = node.path[0].lexeme
+                if len(node.path) > 1 or name in self.loop.assigned:
+                    return False
+                if self.loop.user_calls and not self.__local(name):
+                    return False
+            elif isinstance(node, ast.CallRValue):
+                if not self.__pure_call(node):
+                    return False
+            elif isinstance(node, ast.NewRValue):
+                return False
+        return True
+
+    def __hoist_expr(self, expr):
+        """Returns expr with its invariant parts replaced by temporaries,
+        while nothing that may fail or have an effect was evaluated"""
+        if not self.clean or quiet(expr):
+            return expr
+        if self.__invariant(expr):
+            name = self.__temp('inv')
+            self.hoists.append(var_decl(name, expr))
+            return variable_expr(name, ast.first_token(expr))
+        if isinstance(expr, ast.SimpleExpr) and isinstance(expr.term, ast.CallRValue):
+            expr.term.args = [self.__hoist_expr(arg) for arg in expr.term.args]
+        elif isinstance(expr, ast.ComplexExpr):
+            expr.first_operand = self.__hoist_expr(expr.first_operand)
+            expr.rest = self.__hoist_expr(expr.rest)
+        elif isinstance(expr, ast.NaryExpr):
+            # the first operator runs before the other operands
+            expr.operands[0] = self.__hoist_expr(expr.operands[0])
+            expr.operands[1] = self.__hoist_expr(expr.operands[1])
+        # the call, operator or path itself may fail
+        self.clean = False
+        return expr
+
+    def __hoist_bool(self, bool_expr):
+        if isinstance(bool_expr.first_expr, ast.BoolExpr):
+            self.__hoist_bool(bool_expr.first_expr)
+        else:
+            bool_expr.first_expr = self.__hoist_expr(bool_expr.first_expr)
+        if bool_expr.bool_rel is not None:
+            bool_expr.second_expr = self.__hoist_expr(bool_expr.second_expr)
+            # only equality compares any two values
+            if bool_expr.bool_rel.tokentype not in (token.EQUAL, token.NOT_EQUAL):
+                self.clean = False
+        if bool_expr.bool_connector is not None:
+            # the rest is not always evaluated
+            self.clean = False
+
+    def __hoist_stmt(self, stmt):
+        if isinstance(stmt, ast.ExprStmt):
+            stmt.expr = self.__hoist_expr(stmt.expr)
+        elif isinstance(stmt, ast.VarDeclStmt):
+            stmt.var_expr = self.__hoist_expr(stmt.var_expr)
+        elif isinstance(stmt, ast.AssignStmt):
+            stmt.rhs = self.__hoist_expr(stmt.rhs)
+            if len(stmt.lhs.path) > 1:
+                self.clean = False
+        else:
+            # nested blocks may not run, a return leaves
+            self.clean = False
+
+    def __report_hoists(self, while_stmt, part):
+        loop_line = ast.first_token(while_stmt.bool_expr).line
+        for hoist in self.hoists:
+            the_token = ast.first_token(hoist.var_expr)
+            self.report.append('%d:%d: hoisted %s out of the loop %s (line %d) as %s' % (
+                the_token.line, the_token.column, printer.source(hoist.var_expr), part,
+                loop_line, hoist.var_id.lexeme))
+        self.hoisted += len(self.hoists)
+
+    #--------------------------------------------------------------------
+    # strength reduction
+
+    def __reduce(self, while_stmt, loop, preceding):
+        """Strength reduces the products of the loop's induction
+        variables, returns the declarations to put before the loop"""
+        before = []
+        body = while_stmt.stmt_list.stmts
+        index = 0
+        while index < len(body):
+            induction = self.__induction(body[index], loop, preceding)
+            index += 1
+            if induction is None:
+                continue
+            name, math_rel, step = induction
+            products = {}       # {factor: [(parent, field, product)]}
+            for node in walk(while_stmt):
+                for field, child in self.__fields(node):
+                    factor = self.__product(child, name)
+                    if factor is not None:
+                        products.setdefault(factor, []).append((node, field, child))
+            for factor, uses in sorted(products.items()):
+                # an addition replaces a multiplication only if it is reused
+                if len(uses) < 2:
+                    continue
+                temp = self.__temp('sr')
+                the_token = ast.first_token(uses[0][2])
+                product = self.__product_expr(uses[0][2])
+                before.append(var_decl(temp, copy_tree(product)))
+                for parent, field, use in uses:
+                    self.__replace(parent, field, self.__reduced_use(use, variable_expr(temp, the_token)))
+                update = ast.AssignStmt()
+                update.lhs = ast.LValue()
+                update.lhs.path = variable_expr(temp, the_token).term.path
+                update.rhs = ast.ComplexExpr()
+                update.rhs.first_operand = variable_expr(temp, the_token)
+                update.rhs.math_rel = math_rel
+                update.rhs.rest = optimizer.const_expr(step * factor, math_rel)
+                body.insert(index, update)
+                index += 1
+                self.reduced += 1
+                self.report.append('%d:%d: strength reduced %s (%d uses) to %s, stepped by %s %d' % (
+                    the_token.line, the_token.column, printer.source(product), len(uses),
+                    temp, math_rel.lexeme, step * factor))
+        return before
+
+    def __induction(self, stmt, loop, preceding):
+        """Returns (name, operator token, step) if stmt is set i = i + c
+        (or i - c, c + i) for an int variable i the loop assigns only
+        there, otherwise None"""
+        if not isinstance(stmt, ast.AssignStmt) or len(stmt.lhs.path) != 1:
+            return None
+        name = stmt.lhs.path[0].lexeme
+        rhs = stmt.rhs
+        if not isinstance(rhs, ast.ComplexExpr) or rhs.math_rel.tokentype not in (token.PLUS, token.MINUS):
+            return None
+        if variable(rhs.first_operand) == name and int_constant(rhs.rest) is not None:
+            step = int_constant(rhs.rest)
+        elif (rhs.math_rel.tokentype == token.PLUS and variable(rhs.rest) == name and
+              int_constant(rhs.first_operand) is not None):
+            step = int_constant(rhs.first_operand)
+        else:
+            return None
+        if loop.assigned.get(name) != 1 or name in loop.declared:
+            return None
+        if loop.user_calls and not self.__local(name):
+            return None
+        if not self.__known_int(name, preceding):
+            return None
+        return name, rhs.math_rel, step
+
+    def __known_int(self, name, preceding):
+        """Returns True if the statements just before the loop set the
+        variable to an int literal (so i * c stays exact ints)"""
+        for stmt in reversed(preceding):
+            if isinstance(stmt, ast.VarDeclStmt) and stmt.var_id.lexeme == name:
+                return int_constant(stmt.var_expr) is not None
+            if isinstance(stmt, ast.AssignStmt) and [t.lexeme for t in stmt.lhs.path] == [name]:
+                return int_constant(stmt.rhs) is not None
+            for node in walk(stmt):
+                if isinstance(node, ast.AssignStmt) and node.lhs.path[0].lexeme == name:
+                    return False
+                if isinstance(node, ast.VarDeclStmt) and node.var_id.lexeme == name:
+                    return False
+                if isinstance(node, ast.CallRValue) and not self.__local(name):
+                    if node.fun.lexeme in self.functions or node.fun.lexeme not in builtin_registry.BUILTINS:
+                        return False
+        return False
+
+    def __product(self, expr, name):
+        """Returns c if expr is name * c (or c * name) for an int c, or
+        an n-ary chain starting with it"""
+        if isinstance(expr, ast.NaryExpr) and expr.math_rels[0].tokentype == token.MULTIPLY:
+            first, second = expr.operands[0], expr.operands[1]
+        elif isinstance(expr, ast.ComplexExpr) and expr.math_rel.tokentype == token.MULTIPLY:
+            first, second = expr.first_operand, expr.rest
+        else:
+            return None
+        if variable(first) == name:
+            return int_constant(second)
+        if variable(second) == name:
+            return int_constant(first)
+        return None
+
+    def __product_expr(self, use):
+        """Returns the product of a use (see __product)"""
+        if isinstance(use, ast.ComplexExpr):
+            return use
+        product = ast.ComplexExpr()
+        product.first_operand = use.operands[0]
+        product.math_rel = use.math_rels[0]
+        product.rest = use.operands[1]
+        return product
+
+    def __reduced_use(self, use, temp_expr):
+        """Returns a use with its product replaced by temp_expr"""
+        if isinstance(use, ast.ComplexExpr):
+            return temp_expr
+        use.operands[:2] = [temp_expr]
+        del use.math_rels[0]
+        if len(use.operands) > 2:
+            return use
+        complex_expr = ast.ComplexExpr()
+        complex_expr.first_operand = use.operands[0]
+        complex_expr.math_rel = use.math_rels[0]
+        complex_expr.rest = use.operands[1]
+        return complex_expr
+
+    def __fields(self, node):
+        """Yields (field, child) for the expression children of a node,
+        field is a name or (name, index) for a list item"""
+        for name, layout in flat_ast.LAYOUT_OF[type(node)]:
+            if layout == flat_ast.NODE:
+                yield name, getattr(node, name)
+            elif layout == flat_ast.ITEMS:
+                for i, item in enumerate(getattr(node, name)):
+                    yield (name, i), item
+
+    def __replace(self, parent, field, new):
+        if isinstance(field, tuple):
+            name, i = field
+            getattr(parent, name)[i] = new
+        else:
+            setattr(parent, field, new)
+
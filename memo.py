@@ -0,0 +1,243 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   Memoization of pure MyPL functions for the interpreter. Purity
+#   finds the functions whose result depends only on their arguments:
+#   no assignments to struct fields or globals, no reads of struct
+#   fields or of globals that may change, no new, and only calls to
+#   pure builtins and pure functions. A call of such a function looks
+#   its arguments up in the function's MemoCache, a bounded LRU map.
+#   It runs on resolved programs (see resolver.py).
+#----------------------------------------------------------------------
+import collections
+import ast
+import resolver
+
+# entries kept per function
+MEMO_SIZE = 1024
+
+
+class MemoCache(object):
+    """The results of a function by arguments, the least recently used
+    evicted beyond size entries"""
+
+    def __init__(self, size=MEMO_SIZE):
+        self.size = size
+        self.entries = collections.OrderedDict()   # {key:value}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        entries = self.entries
+        if key in entries:
+            entries.move_to_end(key)
+            self.hits += 1
+            return entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        entries = self.entries
+        entries[key] = value
+        if len(entries) > self.size:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+
+def memo_key(arg_vals):
+    """Returns the cache key of a call (1, 1.0 and true are different
+    arguments, and so are 0.0 and -0.0)"""
+    types = tuple(map(type, arg_vals))
+    if float in types:
+        # equal floats may differ (0.0 and -0.0): key them by repr
+        return tuple(repr(value) if type(value) is float else value for value in arg_vals) + types
+    return tuple(arg_vals) + types
+
+
+class Purity(ast.Visitor):
+    """Finds the pure functions of a program (pure holds their names).
+    Visiting a function body leaves in current_pure whether the body
+    itself is pure and in current_calls the functions it calls."""
+
+    def __init__(self):
+        self.pure = set()
+        self.declared = set()       # the functions analyzed by analyze_function
+        self.constants = set()      # global slots never assigned after their declaration
+        self.current_pure = True
+        self.current_calls = set()
+
+    def analyze(self, stmt_list):
+        """Analyzes the functions of a whole program"""
+        self.constants = self.__constant_globals(stmt_list)
+        candidates = {}
+        declared = set()
+        for stmt in stmt_list.stmts:
+            if isinstance(stmt, ast.FunDeclStmt):
+                name = stmt.fun_name.lexeme
+                if name in declared:
+                    # a redeclared function: calls may reach either
+                    candidates.pop(name, None)
+                    continue
+                declared.add(name)
+                calls = self.__body(stmt)
+                if calls is not None:
+                    candidates[name] = calls
+        # drop the functions calling a function that isn't pure, until
+        # none is left to drop (recursive calls stay pure)
+        changed = True
+        while changed:
+            changed = False
+            for name, calls in list(candidates.items()):
+                if not calls <= candidates.keys():
+                    del candidates[name]
+                    changed = True
+        self.pure = set(candidates)
+        return self.pure
+
+    def analyze_function(self, fun_decl):
+        """Analyzes a function declared after the ones already analyzed
+        (see Interpreter.run_stream): its globals may change later, and
+        it may only call itself and the functions known to be pure"""
+        self.constants = set()
+        name = fun_decl.fun_name.lexeme
+        if name in self.declared:
+            # the callers of the old declaration call this one now
+            self.pure = set()
+        self.declared.add(name)
+        calls = self.__body(fun_decl)
+        if calls is not None and calls <= self.pure | {name}:
+            self.pure.add(name)
+        return name in self.pure
+
+    def __body(self, fun_decl):
+        """Returns the functions the body calls, or None if the body
+        itself isn't pure"""
+        self.current_pure = True
+        self.current_calls = set()
+        fun_decl.stmt_list.accept(self)
+        return self.current_calls if self.current_pure else None
+
+    def __constant_globals(self, stmt_list):
+        """Returns the slots of the top-level variables that keep their
+        initial value"""
+        constants = set()
+        changed = set()
+        for stmt in stmt_list.stmts:
+            if isinstance(stmt, ast.VarDeclStmt):
+                if stmt.slot in constants:
+                    changed.add(stmt.slot)
+                constants.add(stmt.slot)
+        # block variables of the top level reuse global slots
+        for node in self.__top_level_nodes(stmt_list):
+            if isinstance(node, ast.AssignStmt) and node.lhs.depth == resolver.GLOBAL:
+                changed.add(node.lhs.slot)
+            elif isinstance(node, ast.VarDeclStmt) and node.depth == resolver.GLOBAL:
+                changed.add(node.slot)
+        return constants - changed
+
+    def __top_level_nodes(self, stmt_list):
+        """Yields the assignments anywhere and the declarations nested in
+        top-level blocks"""
+        for stmt in stmt_list.stmts:
+            if isinstance(stmt, ast.FunDeclStmt):
+                stack = [stmt.stmt_list]
+            elif isinstance(stmt, (ast.WhileStmt, ast.IfStmt)):
+                stack = [stmt]
+            elif isinstance(stmt, ast.AssignStmt):
+                yield stmt
+                continue
+            else:
+                continue
+            while stack:
+                node = stack.pop()
+                if isinstance(node, ast.StmtList):
+                    for child in node.stmts:
+                        if isinstance(child, (ast.AssignStmt, ast.VarDeclStmt)):
+                            yield child
+                        stack.append(child)
+                elif isinstance(node, ast.WhileStmt):
+                    stack.append(node.stmt_list)
+                elif isinstance(node, ast.IfStmt):
+                    stack.extend(basic_if.stmt_list for basic_if in [node.if_part] + node.elseifs)
+                    if node.has_else:
+                        stack.append(node.else_stmts)
+
+    #--------------------------------------------------------------------
+    # statements
+
+    def visit_stmt_list(self, stmt_list):
+        for stmt in stmt_list.stmts:
+            stmt.accept(self)
+
+    def visit_expr_stmt(self, expr_stmt):
+        expr_stmt.expr.accept(self)
+
+    def visit_var_decl_stmt(self, var_decl):
+        var_decl.var_expr.accept(self)
+
+    def visit_assign_stmt(self, assign_stmt):
+        assign_stmt.rhs.accept(self)
+        lhs = assign_stmt.lhs
+        if len(lhs.path) > 1 or lhs.depth == resolver.GLOBAL:
+            self.current_pure = False
+
+    def visit_return_stmt(self, return_stmt):
+        if return_stmt.return_expr is not None:
+            return_stmt.return_expr.accept(self)
+
+    def visit_while_stmt(self, while_stmt):
+        while_stmt.bool_expr.accept(self)
+        while_stmt.stmt_list.accept(self)
+
+    def visit_if_stmt(self, if_stmt):
+        for basic_if in [if_stmt.if_part] + if_stmt.elseifs:
+            basic_if.bool_expr.accept(self)
+            basic_if.stmt_list.accept(self)
+        if if_stmt.has_else:
+            if_stmt.else_stmts.accept(self)
+
+    #--------------------------------------------------------------------
+    # expressions
+
+    def visit_simple_expr(self, simple_expr):
+        simple_expr.term.accept(self)
+
+    def visit_complex_expr(self, complex_expr):
+        complex_expr.first_operand.accept(self)
+        complex_expr.rest.accept(self)
+
+    def visit_nary_expr(self, nary_expr):
+        for operand in nary_expr.operands:
+            operand.accept(self)
+
+    def visit_bool_expr(self, bool_expr):
+        bool_expr.first_expr.accept(self)
+        if bool_expr.second_expr is not None:
+            bool_expr.second_expr.accept(self)
+        if bool_expr.rest is not None:
+            bool_expr.rest.accept(self)
+
+    def visit_call_rvalue(self, call_rvalue):
+        for arg in call_rvalue.args:
+            arg.accept(self)
+        if call_rvalue.builtin is not None:
+            if not call_rvalue.builtin.pure:
+                self.current_pure = False
+        else:
+            self.current_calls.add(call_rvalue.fun.lexeme)
+
+    def visit_id_rvalue(self, id_rvalue):
+        # a struct's fields may change between calls with the same struct
+        if len(id_rvalue.path) > 1:
+            self.current_pure = False
+        elif id_rvalue.depth == resolver.GLOBAL and id_rvalue.slot not in self.constants:
+            self.current_pure = False
+
+    def visit_new_rvalue(self, new_rvalue):
+        # each call returns a new struct
+        self.current_pure = False
+
+    def visit_simple_rvalue(self, simple_rvalue): pass
+    def visit_const_rvalue(self, const_rvalue): pass
@@ -11,28 +11,219 @@ import parser
 import ast
 import type_checker
 import interpreter
+import closure_compiler
+import vm
+import transpiler
+import optimizer
+import loop_optimizer
+import printer
+import output
+import reader
+import memo
+import regex_lexer
+import cache
+import argparse
+import importlib
+import gc
 import sys
 
-def run(file_stream):
-    the_lexer = lexer.Lexer(file_stream)
+# the available lexer implementations (selected with --lexer)
+LEXERS = {
+    'buffered': lexer.Lexer,
+    'stream': lambda file_stream: lexer.Lexer(file_stream, buffered=False),
+    'regex': regex_lexer.RegexLexer,
+}
+
+def parse(file_stream, lexer_name='buffered'):
+    """Lexes and parses a program, returns its StmtList"""
+    the_lexer = LEXERS[lexer_name](file_stream)
     the_parser = parser.Parser(the_lexer)
-    stmt_list = the_parser.parse()
-    the_interpreter = interpreter.Interpreter()
-    stmt_list.accept(the_interpreter)
+    return the_parser.parse()
+
+
+# the available execution engines (selected with --engine)
+ENGINES = {
+    'interpreter': interpreter.Interpreter,
+    'closure': closure_compiler.ClosureCompiler,
+    'vm': vm.VM,
+    'python': transpiler.PythonEngine,
+}
+
+def dump_ast(stmt_list, title):
+    """Prints a program as MyPL source to stderr"""
+    sys.stderr.write('#---- %s\n' % title)
+    stmt_list.accept(printer.Printer(sys.stderr))
+
+
+def optimizer_passes():
+    """Returns the optimizers, in the order they run"""
+    return [optimizer.Optimizer(), loop_optimizer.LoopOptimizer()]
+
+
+def optimize(stmt_list, dump=False, report=False, passes=None):
+    """Optimizes a program in place (see optimizer.py and
+    loop_optimizer.py), returns it"""
+    passes = passes or optimizer_passes()
+    if dump:
+        dump_ast(stmt_list, 'before optimization')
+    for the_pass in passes:
+        the_pass.optimize(stmt_list)
+    if dump:
+        dump_ast(stmt_list, 'after optimization (%s)' % '; '.join(the_pass.summary() for the_pass in passes))
+    if report:
+        for the_pass in passes:
+            for line in the_pass.report:
+                sys.stderr.write(line + '\n')
+            del the_pass.report[:]
+    return stmt_list
+
+
+def optimize_stream(stmts, dump=False, report=False):
+    """Optimizes top-level statements as they arrive"""
+    passes = optimizer_passes()
+    for stmt in stmts:
+        stmt_list = ast.StmtList()
+        stmt_list.stmts.append(stmt)
+        yield from optimize(stmt_list, dump, report, passes).stmts
+
+
+def make_engine(engine_name='interpreter', memo_size=0):
+    """Returns an engine; a memo_size memoizes the calls of pure
+    functions (interpreter only, see memo.py)"""
+    if memo_size:
+        if engine_name != 'interpreter':
+            raise ValueError('memoization needs the interpreter engine, not %s' % engine_name)
+        return interpreter.Interpreter(memo_size)
+    return ENGINES[engine_name]()
+
 
+def print_stats(engine):
+    """Prints the memo counters of a run to stderr"""
+    for name, (hits, misses, evictions) in sorted(engine.stats().items()):
+        sys.stderr.write('%s: %d hits, %d misses, %d evictions\n' % (name, hits, misses, evictions))
 
-def main(filename):
+
+def execute(stmt_list, engine_name='interpreter', memo_size=0, stats=False):
+    engine = make_engine(engine_name, memo_size)
+    # the tree lives for the whole run, keep the collector from rescanning it
+    gc.freeze()
+    try:
+        engine.run(stmt_list)
+    finally:
+        gc.unfreeze()
+        # the program's output is buffered (see output.py)
+        output.flush()
+        if stats:
+            print_stats(engine)
+
+
+def run(file_stream, lexer_name='buffered', stream=False, engine_name='interpreter',
+        use_optimizer=False, dump=False, report=False, memo_size=0, stats=False):
+    if stream:
+        # execute each top-level statement as soon as it is parsed
+        the_parser = parser.Parser(LEXERS[lexer_name](file_stream))
+        stmts = the_parser.parse_stream()
+        if use_optimizer or dump or report:
+            stmts = optimize_stream(stmts, dump, report)
+        engine = make_engine(engine_name, memo_size)
+        try:
+            engine.run_stream(stmts)
+        finally:
+            output.flush()
+            if stats:
+                print_stats(engine)
+        return
+    stmt_list = parse(file_stream, lexer_name)
+    if use_optimizer or dump or report:
+        optimize(stmt_list, dump, report)
+    execute(stmt_list, engine_name, memo_size, stats)
+
+
+def open_source(filename):
+    """Opens the program source; '-' reads it from stdin"""
+    if filename == '-':
+        return sys.stdin
+    return open(filename, 'r')
+
+
+def main(filename, lexer_name='buffered', stream=False, use_cache=True, engine_name='interpreter',
+         use_optimizer=False, dump=False, report=False, memo_size=0, stats=False):
     try:
-        file_stream = open(filename, 'r')
-        run(file_stream)
-        file_stream.close()
+        if use_cache and not stream and filename != '-':
+            # reuse the parsed program if the source is unchanged (the
+            # cache holds the unoptimized tree)
+            stmt_list = cache.load_program(filename, lambda file_stream: parse(file_stream, lexer_name))
+            if use_optimizer or dump or report:
+                optimize(stmt_list, dump, report)
+            execute(stmt_list, engine_name, memo_size, stats)
+            return
+        file_stream = open_source(filename)
     except FileNotFoundError:
         sys.exit('invalid filename %s' % filename)
     except error.MyPLError as e:
-        file_stream.close()
         sys.exit(e)
+    try:
+        run(file_stream, lexer_name, stream, engine_name, use_optimizer, dump, report, memo_size, stats)
+    except error.MyPLError as e:
+        sys.exit(e)
+    finally:
+        if file_stream is not sys.stdin:
+            file_stream.close()
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        sys.exit('Usage: %s file' % sys.argv[0])
-    main(sys.argv[1])
+    arg_parser = argparse.ArgumentParser(description='Run a MyPL program.')
+    arg_parser.add_argument('file', help="MyPL source file ('-' for stdin)")
+    arg_parser.add_argument('--lexer', choices=sorted(LEXERS), default='buffered',
+                            help='lexer implementation (default: buffered)')
+    arg_parser.add_argument('--stream', action='store_true',
+                            help='run each top-level statement as soon as it is parsed')
+    arg_parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                            help='always parse the source (ignore and do not write %s/)' % cache.CACHE_DIR)
+    arg_parser.add_argument('--engine', choices=sorted(ENGINES), default='interpreter',
+                            help='execution engine (default: interpreter)')
+    arg_parser.add_argument('-O', '--optimize', dest='use_optimizer', action='store_true',
+                            help='fold constants and remove dead branches before running')
+    arg_parser.add_argument('--dump-ast', dest='dump', action='store_true',
+                            help='print the program before and after optimization to stderr (implies -O)')
+    arg_parser.add_argument('--opt-report', dest='report', action='store_true',
+                            help='print what the optimizer removed, hoisted and strength reduced to stderr (implies -O)')
+    arg_parser.add_argument('--flush', choices=sorted(output.POLICIES),
+                            help='flush the output only at the end and every --buffer-size characters (exit), '
+                                 'also before each read (read), or also at each newline (newline); '
+                                 'default: newline on a terminal, read otherwise')
+    arg_parser.add_argument('--buffer-size', type=int, default=output.BUFFER_SIZE,
+                            help='characters of output buffered before a flush (default: %d)' % output.BUFFER_SIZE)
+    arg_parser.add_argument('--input', metavar='FILE',
+                            help='read the input of readi/readf/reads from FILE instead of stdin')
+    arg_parser.add_argument('--read-tokens', action='store_true',
+                            help='make each read take the next whitespace separated token instead of a line')
+    arg_parser.add_argument('--memo', action='store_true',
+                            help='memoize the calls of pure functions (interpreter only)')
+    arg_parser.add_argument('--memo-size', type=int, default=memo.MEMO_SIZE,
+                            help='results kept per memoized function (default: %d)' % memo.MEMO_SIZE)
+    arg_parser.add_argument('--stats', action='store_true',
+                            help='print the memo hits, misses and evictions per function to stderr')
+    arg_parser.add_argument('--native', metavar='MODULE', action='append', default=[],
+                            help='import a Python module that registers builtins (see builtin_registry.py)')
+    args = arg_parser.parse_args()
+    if args.memo and args.engine != 'interpreter':
+        arg_parser.error('--memo needs the interpreter engine')
+    if args.memo and args.memo_size < 1:
+        arg_parser.error('--memo-size must be positive')
+    if args.stats and not args.memo:
+        arg_parser.error('--stats needs --memo')
+    for module in args.native:
+        importlib.import_module(module)
+    output.use(output.Output(policy=output.POLICIES.get(args.flush), limit=args.buffer_size))
+    mode = reader.TOKENS if args.read_tokens else reader.LINES
+    try:
+        if args.input:
+            reader.use(reader.from_path(args.input, mode))
+        else:
+            # a program read from stdin shares it with the lexer
+            reader.use(reader.Input(mode=mode, block_size=None if args.file == '-' else reader.BLOCK_SIZE))
+    except OSError:
+        sys.exit('invalid input file %s' % args.input)
+    main(args.file, lexer_name=args.lexer, stream=args.stream, use_cache=args.use_cache,
+         engine_name=args.engine, use_optimizer=args.use_optimizer, dump=args.dump,
+         report=args.report, memo_size=args.memo_size if args.memo else 0, stats=args.stats)
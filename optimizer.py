@@ -0,0 +1,320 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   MyPL AST optimizer, run between parsing and execution. Decodes
+#   every literal once (into an ast.ConstRValue), folds constant
+#   math and boolean subexpressions, and drops the if/elif arms and
+#   while loops whose conditions are constant. The tree is rewritten
+#   in place and keeps the shapes the engines expect (a condition is
+#   still a BoolExpr, an expression still an Expr).
+#----------------------------------------------------------------------
+import ast
+import token
+import runtime
+import operator
+
+# math operators that fold (strings only fold with +, see __math)
+MATH_OPS = {
+    token.PLUS: runtime.add,
+    token.MINUS: operator.sub,
+    token.MULTIPLY: operator.mul,
+    token.DIVIDE: runtime.divide,
+    token.MODULO: runtime.modulo,
+}
+
+BOOL_RELS = {
+    token.EQUAL: operator.eq,
+    token.NOT_EQUAL: operator.ne,
+    token.LESS_THAN: operator.lt,
+    token.LESS_THAN_EQUAL: operator.le,
+    token.GREATER_THAN: operator.gt,
+    token.GREATER_THAN_EQUAL: operator.ge,
+}
+
+# marks a value that can't be folded (None is nil)
+NOT_CONSTANT = object()
+
+
+def const_token(value, the_token):
+    """Returns a literal token spelling value, located at the_token"""
+    if value is None:
+        tokentype, lexeme = token.NIL, 'nil'
+    elif type(value) is bool:
+        tokentype, lexeme = token.BOOLVAL, 'true' if value else 'false'
+    elif type(value) is int:
+        tokentype, lexeme = token.INTVAL, str(value)
+    elif type(value) is float:
+        tokentype, lexeme = token.FLOATVAL, repr(value)
+    else:
+        tokentype, lexeme = token.STRINGVAL, value
+    return token.Token(tokentype, lexeme, the_token.offset, the_token.source_map)
+
+def const_expr(value, the_token):
+    """Returns a SimpleExpr holding a constant"""
+    const_rvalue = ast.ConstRValue()
+    const_rvalue.val = const_token(value, the_token)
+    const_rvalue.value = value
+    simple_expr = ast.SimpleExpr()
+    simple_expr.term = const_rvalue
+    return simple_expr
+
+def const_bool_expr(value, the_token):
+    """Returns a BoolExpr that is just a constant"""
+    bool_expr = ast.BoolExpr()
+    bool_expr.first_expr = const_expr(value, the_token)
+    return bool_expr
+
+def constant(expr):
+    """Returns the value of a constant expression (or condition), or
+    NOT_CONSTANT"""
+    # a condition without a relation or connector is its first expression
+    while (isinstance(expr, ast.BoolExpr) and not expr.negated and
+           expr.bool_rel is None and expr.bool_connector is None):
+        expr = expr.first_expr
+    if isinstance(expr, ast.SimpleExpr) and isinstance(expr.term, ast.ConstRValue):
+        return expr.term.value
+    return NOT_CONSTANT
+
+
+class Optimizer(ast.Visitor):
+    """Rewrites a program in place. Expression visitors leave the
+    replacement node in current_expr and statement visitors leave the
+    statements replacing theirs in current_stmts. The counts are
+    summarized by --dump-ast, report lists the removed branches
+    (see --opt-report)."""
+
+    def __init__(self):
+        self.current_expr = None
+        self.current_stmts = []
+        self.decoded = 0            # literals decoded
+        self.folded = 0             # operators evaluated at compile time
+        self.removed = 0            # if arms and loops removed
+        self.report = []            # a line per removed branch
+
+    def optimize(self, stmt_list):
+        """Optimizes a program (a StmtList), returns it"""
+        stmt_list.accept(self)
+        return stmt_list
+
+    def summary(self):
+        return '%d literals decoded, %d operators folded, %d branches removed' % (
+            self.decoded, self.folded, self.removed)
+
+    def __expr(self, expr):
+        expr.accept(self)
+        return self.current_expr
+
+    def __report(self, bool_expr, what):
+        the_token = ast.first_token(bool_expr)
+        self.report.append('%d:%d: %s' % (the_token.line, the_token.column, what))
+
+    def __math(self, math_rel, first_val, second_val):
+        """Returns the value of a constant operation, or NOT_CONSTANT if
+        it should be left for run time (nil, errors, non-numbers)"""
+        if first_val is None or second_val is None:
+            return NOT_CONSTANT
+        if type(first_val) is str or type(second_val) is str:
+            # the engines only define + on strings (concatenation)
+            if math_rel.tokentype != token.PLUS:
+                return NOT_CONSTANT
+        elif type(first_val) not in (int, float) or type(second_val) not in (int, float):
+            return NOT_CONSTANT
+        try:
+            value = MATH_OPS[math_rel.tokentype](first_val, second_val)
+        except (ArithmeticError, TypeError, ValueError, runtime.BuiltinError):
+            # e.g., a division by zero is reported when it runs
+            return NOT_CONSTANT
+        self.folded += 1
+        return value
+
+    #--------------------------------------------------------------------
+    # statements
+
+    def visit_stmt_list(self, stmt_list):
+        stmts = []
+        for stmt in stmt_list.stmts:
+            stmt.accept(self)
+            stmts.extend(self.current_stmts)
+        stmt_list.stmts = stmts
+
+    def visit_expr_stmt(self, expr_stmt):
+        expr_stmt.expr = self.__expr(expr_stmt.expr)
+        self.current_stmts = [expr_stmt]
+
+    def visit_var_decl_stmt(self, var_decl):
+        var_decl.var_expr = self.__expr(var_decl.var_expr)
+        self.current_stmts = [var_decl]
+
+    def visit_assign_stmt(self, assign_stmt):
+        assign_stmt.rhs = self.__expr(assign_stmt.rhs)
+        self.current_stmts = [assign_stmt]
+
+    def visit_struct_decl_stmt(self, struct_decl):
+        for var_decl in struct_decl.var_decls:
+            var_decl.accept(self)
+        self.current_stmts = [struct_decl]
+
+    def visit_fun_decl_stmt(self, fun_decl):
+        fun_decl.stmt_list.accept(self)
+        self.current_stmts = [fun_decl]
+
+    def visit_return_stmt(self, return_stmt):
+        if return_stmt.return_expr is not None:
+            return_stmt.return_expr = self.__expr(return_stmt.return_expr)
+        self.current_stmts = [return_stmt]
+
+    def visit_while_stmt(self, while_stmt):
+        while_stmt.bool_expr = self.__expr(while_stmt.bool_expr)
+        value = constant(while_stmt.bool_expr)
+        if value is not NOT_CONSTANT and not value:
+            self.removed += 1
+            self.__report(while_stmt.bool_expr, 'removed the loop (its condition is false)')
+            self.current_stmts = []
+            return
+        while_stmt.stmt_list.accept(self)
+        self.current_stmts = [while_stmt]
+
+    def visit_if_stmt(self, if_stmt):
+        basic_ifs = []
+        arms = [if_stmt.if_part] + if_stmt.elseifs
+        for i, basic_if in enumerate(arms):
+            basic_if.bool_expr = self.__expr(basic_if.bool_expr)
+            value = constant(basic_if.bool_expr)
+            if value is NOT_CONSTANT:
+                basic_if.stmt_list.accept(self)
+                basic_ifs.append(basic_if)
+            elif value:
+                # an arm that always runs ends the chain, as its else
+                self.removed += len(arms) - i - 1 + if_stmt.has_else
+                self.__report(basic_if.bool_expr, 'made the arm the else (its condition is true)')
+                basic_if.stmt_list.accept(self)
+                if_stmt.has_else = True
+                if_stmt.else_stmts = basic_if.stmt_list
+                break
+            else:
+                self.removed += 1
+                self.__report(basic_if.bool_expr, 'removed the arm (its condition is false)')
+        else:
+            if if_stmt.has_else:
+                if_stmt.else_stmts.accept(self)
+        if basic_ifs:
+            if_stmt.if_part = basic_ifs[0]
+            if_stmt.elseifs = basic_ifs[1:]
+            self.current_stmts = [if_stmt]
+        elif not if_stmt.has_else:
+            self.current_stmts = []
+        elif any(isinstance(stmt, ast.VarDeclStmt) for stmt in if_stmt.else_stmts.stmts):
+            # the block's variables must stay in their own scope
+            if_stmt.if_part = ast.BasicIf()
+            if_stmt.if_part.bool_expr = const_bool_expr(True, self.__first_token(if_stmt.else_stmts))
+            if_stmt.if_part.stmt_list = if_stmt.else_stmts
+            if_stmt.elseifs = []
+            if_stmt.has_else = False
+            if_stmt.else_stmts = ast.StmtList()
+            self.current_stmts = [if_stmt]
+        else:
+            self.current_stmts = if_stmt.else_stmts.stmts
+
+    def __first_token(self, stmt_list):
+        """Returns the var_id of the block's first declaration (to locate
+        a synthesized condition)"""
+        for stmt in stmt_list.stmts:
+            if isinstance(stmt, ast.VarDeclStmt):
+                return stmt.var_id
+
+    #--------------------------------------------------------------------
+    # expressions
+
+    def visit_simple_expr(self, simple_expr):
+        term = simple_expr.term
+        if type(term) is ast.SimpleRValue:
+            # decode the literal once
+            const_rvalue = ast.ConstRValue()
+            const_rvalue.val = term.val
+            const_rvalue.value = runtime.literal_value(term.val)
+            simple_expr.term = const_rvalue
+            self.decoded += 1
+        else:
+            term.accept(self)
+        self.current_expr = simple_expr
+
+    def visit_call_rvalue(self, call_rvalue):
+        call_rvalue.args = [self.__expr(arg) for arg in call_rvalue.args]
+
+    def visit_complex_expr(self, complex_expr):
+        complex_expr.first_operand = self.__expr(complex_expr.first_operand)
+        complex_expr.rest = self.__expr(complex_expr.rest)
+        self.current_expr = complex_expr
+        first_val = constant(complex_expr.first_operand)
+        second_val = constant(complex_expr.rest)
+        if first_val is NOT_CONSTANT or second_val is NOT_CONSTANT:
+            return
+        value = self.__math(complex_expr.math_rel, first_val, second_val)
+        if value is not NOT_CONSTANT:
+            self.current_expr = const_expr(value, complex_expr.first_operand.term.val)
+
+    def visit_nary_expr(self, nary_expr):
+        operands = [self.__expr(operand) for operand in nary_expr.operands]
+        math_rels = list(nary_expr.math_rels)
+        # only a leading run folds: the chain is left associative, so
+        # a + 1 + 2 is not a + 3 (a may be a string)
+        while len(operands) > 1:
+            first_val = constant(operands[0])
+            second_val = constant(operands[1])
+            if first_val is NOT_CONSTANT or second_val is NOT_CONSTANT:
+                break
+            value = self.__math(math_rels[0], first_val, second_val)
+            if value is NOT_CONSTANT:
+                break
+            operands[:2] = [const_expr(value, operands[0].term.val)]
+            del math_rels[0]
+        if len(operands) == 1:
+            self.current_expr = operands[0]
+        elif len(operands) == 2:
+            complex_expr = ast.ComplexExpr()
+            complex_expr.first_operand = operands[0]
+            complex_expr.math_rel = math_rels[0]
+            complex_expr.rest = operands[1]
+            self.current_expr = complex_expr
+        else:
+            nary_expr.operands = operands
+            nary_expr.math_rels = math_rels
+            self.current_expr = nary_expr
+
+    def visit_bool_expr(self, bool_expr):
+        bool_expr.first_expr = self.__expr(bool_expr.first_expr)
+        if bool_expr.bool_rel is not None:
+            bool_expr.second_expr = self.__expr(bool_expr.second_expr)
+        if bool_expr.bool_connector is not None:
+            bool_expr.rest = self.__expr(bool_expr.rest)
+        self.current_expr = bool_expr
+        # evaluate as the engines do: negate, then relate, then connect
+        value = constant(bool_expr.first_expr)
+        if value is NOT_CONSTANT:
+            return
+        if bool_expr.negated:
+            value = not value
+        if bool_expr.bool_rel is not None:
+            second_val = constant(bool_expr.second_expr)
+            if second_val is NOT_CONSTANT:
+                return
+            try:
+                value = BOOL_RELS[bool_expr.bool_rel.tokentype](value, second_val)
+            except TypeError:
+                return
+        self.folded += bool_expr.negated + (bool_expr.bool_rel is not None)
+        the_token = self.__const_token(bool_expr.first_expr)
+        if bool_expr.bool_connector is not None:
+            self.folded += 1
+            # the rest decides unless the left side short circuits
+            if (bool_expr.bool_connector.tokentype == token.AND) == bool(value):
+                self.current_expr = bool_expr.rest
+                return
+        self.current_expr = const_bool_expr(value, the_token)
+
+    def __const_token(self, expr):
+        """Returns the token of a constant expression or condition"""
+        while isinstance(expr, ast.BoolExpr):
+            expr = expr.first_expr
+        return expr.term.val
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   MyPL program output. print writes into the current Output, which
+#   buffers the text and hands it to a sink in large writes: by
+#   default the binary buffer under sys.stdout, or a MemorySink for an
+#   embedder capturing the output. The buffer is flushed when it holds
+#   limit characters, at the end of the program, and depending on the
+#   policy at each newline and before each read. The escapes (\n) of
+#   a literal printed are resolved when the call is compiled (see
+#   builtin_registry.print_literal).
+#----------------------------------------------------------------------
+import atexit
+import sys
+
+# flush policies (flags, the end of the program always flushes)
+ON_EXIT = 0
+ON_NEWLINE = 1
+ON_READ = 2
+
+POLICIES = {
+    'exit': ON_EXIT,
+    'newline': ON_NEWLINE | ON_READ,
+    'read': ON_READ,
+}
+
+# characters buffered before a flush
+BUFFER_SIZE = 1 << 16
+
+
+def escape(text):
+    """Returns the text print writes for a string"""
+    return text.replace('\\n', '\n')
+
+
+class StdoutSink(object):
+    """Writes to the sys.stdout of the time of the write, through its
+    binary buffer when it has one"""
+
+    def write(self, text):
+        stream = sys.stdout
+        buffer = getattr(stream, 'buffer', None)
+        if buffer is None:
+            stream.write(text)
+            return
+        # what was written to the text layer goes first
+        stream.flush()
+        buffer.write(text.encode(stream.encoding or 'utf-8', stream.errors or 'strict'))
+
+    def flush(self):
+        sys.stdout.flush()
+
+
+class MemorySink(object):
+    """Keeps the output in memory (see getvalue)"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def flush(self): pass
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+
+class Output(object):
+    """A buffered output channel. policy combines ON_NEWLINE and ON_READ
+    (by default, both when stdout is a terminal, ON_READ otherwise)."""
+
+    def __init__(self, sink=None, policy=None, limit=BUFFER_SIZE):
+        self.sink = sink if sink is not None else StdoutSink()
+        if policy is None:
+            policy = POLICIES['newline'] if sys.stdout.isatty() else ON_READ
+        self.on_newline = bool(policy & ON_NEWLINE)
+        self.on_read = bool(policy & ON_READ)
+        self.limit = limit
+        self.parts = []         # the buffered text
+        self.size = 0           # its length
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.limit or (self.on_newline and '\n' in text):
+            self.flush()
+
+    def reading(self):
+        """Called before the program reads input"""
+        if self.on_read:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            text = ''.join(self.parts)
+            self.parts = []
+            self.size = 0
+            self.sink.write(text)
+        self.sink.flush()
+
+
+# the output of the running program
+_current = None
+
+def current():
+    """Returns the current Output (created on first use)"""
+    global _current
+    if _current is None:
+        _current = Output()
+    return _current
+
+def use(channel):
+    """Makes channel (an Output, or None for a default one) the current
+    output after flushing the previous one, returns the previous"""
+    global _current
+    previous = _current
+    if previous is not None:
+        previous.flush()
+    _current = channel
+    return previous
+
+def write(text):
+    current().write(text)
+
+def reading():
+    if _current is not None:
+        _current.reading()
+
+def flush():
+    if _current is not None:
+        _current.flush()
+
+atexit.register(flush)
+
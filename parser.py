@@ -8,6 +8,19 @@ import error
 import lexer
 import token
 import ast
+import flat_ast
+
+# token types that can start a <bstmt>
+BSTMT_FIRST = frozenset([token.VAR, token.SET, token.IF, token.WHILE, token.RETURN, token.STRINGVAL, token.INTVAL, token.BOOLVAL, token.FLOATVAL, token.NIL, token.NEW, token.ID, token.LPAREN])
+# token types that can start an <expr>
+EXPR_FIRST = frozenset([token.STRINGVAL, token.INTVAL, token.BOOLVAL, token.FLOATVAL, token.NIL, token.NEW, token.ID, token.LPAREN])
+# token types of simple rvalues (new and id rvalues are parsed separately)
+SIMPLE_RVALS = frozenset([token.STRINGVAL, token.INTVAL, token.BOOLVAL, token.FLOATVAL, token.NIL])
+TYPES = [token.ID, token.INTTYPE, token.FLOATTYPE, token.BOOLTYPE, token.STRINGTYPE]
+# binding strength of each math operator
+PRECEDENCE = {token.PLUS: 1, token.MINUS: 1, token.MULTIPLY: 2, token.DIVIDE: 2, token.MODULO: 2}
+BOOLRELS = frozenset([token.EQUAL, token.LESS_THAN, token.GREATER_THAN, token.LESS_THAN_EQUAL, token.GREATER_THAN_EQUAL, token.NOT_EQUAL])
+BOOL_CONNECTORS = frozenset([token.AND, token.OR])
 
 # This class pulls tokens from the lexer class one-by-one and checks
 # each token against MyPL grammer while created an AST.
@@ -23,6 +36,26 @@ class Parser(object):
         self.__eat(token.EOS)
         return stmt_list_node
 
+    def parse_stream(self):
+        """Yields each top-level statement as soon as it is parsed, so a
+        program can be run without building its whole StmtList. A syntax
+        error is raised when the generator reaches it.
+        """
+        self.__advance()
+        while not self.__check_tokentype(token.EOS):
+            yield self.__stmt()
+        self.__eat(token.EOS)
+
+    def parse_flat(self):
+        """Parses the program into a flat_ast.FlatAST. Each top-level
+        statement is flattened as soon as it is parsed, so only one
+        statement's node objects are alive at a time.
+        """
+        flat = flat_ast.FlatAST(self.lexer.source_map)
+        stmts = [flat.add(stmt) for stmt in self.parse_stream()]
+        flat.root = flat.add_node(ast.StmtList, [flat.add_node(flat_ast.List, stmts)])
+        return flat
+
     def __advance(self):
         """grab the next token from the lexer"""    
         self.current_token = self.lexer.next_token()
@@ -39,7 +72,7 @@ class Parser(object):
         s = "expecting " + " or ".join(expected_tokens) + ', found "' + self.current_token.lexeme + '" in parser'
         l = self.current_token.line
         c = self.current_token.column
-        raise error.MyPLError(s, l, c)
+        raise error.MyPLError(s, l, c, self.current_token.snippet())
 
     def __check_tokentype(self, token):
         """a function to compare the current token with a token argument"""
@@ -51,16 +84,13 @@ class Parser(object):
     # Beginning of recursive descent functions
     def __stmts(self, stmt_list_node):
         """<stmts> ::= <stmt> <stmts> | e"""
-        if not self.__check_tokentype(token.EOS):
+        while not self.__check_tokentype(token.EOS):
             stmt_list_node.stmts.append(self.__stmt())
-            self.__stmts(stmt_list_node)
         return stmt_list_node
 
     def __bstmts(self, stmt_list_node):
-        possible_tokens = [token.VAR, token.SET, token.IF, token.WHILE, token.RETURN, token.STRINGVAL, token.INTVAL, token.BOOLVAL, token.FLOATVAL, token.NIL, token.NEW, token.ID, token.LPAREN]
-        if self.current_token.tokentype in possible_tokens:
+        while self.current_token.tokentype in BSTMT_FIRST:
             stmt_list_node.stmts.append(self.__bstmt())
-            stmt_list_node = self.__bstmts(stmt_list_node)
         return stmt_list_node
 
     def __stmt(self):
@@ -99,9 +129,8 @@ class Parser(object):
         return sdecl_stmt_node
 
     def __vdecls(self, vdecl_list):
-        if self.__check_tokentype(token.VAR):
+        while self.__check_tokentype(token.VAR):
             vdecl_list.append(self.__vdecl())
-            self.__vdecls(vdecl_list)
         return vdecl_list
 
     def __fdecl(self):
@@ -122,7 +151,7 @@ class Parser(object):
         return fdecl_stmt_node
 
     def __params(self):
-        # todo: make this function return param list
+        """<params> ::= ID COLON <type> ( COMMA ID COLON <type> )* | e"""
         params = []
         if self.__check_tokentype(token.ID):
             param = ast.FunParam()
@@ -138,24 +167,22 @@ class Parser(object):
                 self.__eat(token.ID)
                 self.__eat(token.COLON)
                 param.param_type = self.__type()
+                params.append(param)
         return params
 
     def __type(self):
         curr_token = self.current_token 
-        types = [token.ID, token.INTTYPE, token.FLOATTYPE, token.BOOLTYPE, token.STRINGTYPE]
-        if curr_token.tokentype in types:
+        if curr_token.tokentype in TYPES:
             self.__advance()
             return curr_token 
         else:
-            self.__error(types)
+            self.__error(TYPES)
 
     def __exit(self):
         return_stmt_node = ast.ReturnStmt()
         return_stmt_node.return_token = self.current_token
         self.__advance()
-        possible_tokens = [token.STRINGVAL, token.INTVAL, token.BOOLVAL, token.FLOATVAL, token.NIL, token.NEW, token.ID, token.LPAREN]
-        curr_token = self.current_token.tokentype
-        if curr_token in possible_tokens:
+        if self.current_token.tokentype in EXPR_FIRST:
             return_stmt_node.return_expr = self.__expr()
         # return; ???
         self.__eat(token.SEMICOLON)
@@ -208,15 +235,14 @@ class Parser(object):
         return if_stmt_node
 
     def __condt(self, if_stmt_node):
-        if self.__check_tokentype(token.ELIF):
+        while self.__check_tokentype(token.ELIF):
             self.__advance()
             elif_stmt_node = ast.BasicIf()
             elif_stmt_node.bool_expr = self.__bexpr()
             self.__eat(token.THEN)
             elif_stmt_node.stmt_list = self.__bstmts(ast.StmtList())
             if_stmt_node.elseifs.append(elif_stmt_node)
-            return self.__condt(if_stmt_node)
-        elif self.__check_tokentype(token.ELSE):
+        if self.__check_tokentype(token.ELSE):
             self.__advance()
             if_stmt_node.has_else = True
             if_stmt_node.else_stmts = self.__bstmts(ast.StmtList())
@@ -231,32 +257,55 @@ class Parser(object):
         self.__eat(token.END)
         return while_stmt_node
 
-    def __expr(self):
-        expr_node = None
+    def __expr(self, min_precedence=1):
+        """<expr> ::= <operand> ( <mathrel> <operand> )*, parsed by
+        precedence climbing: * / % bind tighter than + - and both are
+        left associative.
+        """
+        expr_node = self.__operand()
+        precedence = PRECEDENCE.get(self.current_token.tokentype)
+        while precedence is not None and precedence >= min_precedence:
+            math_rel = self.current_token
+            self.__advance()
+            rest = self.__expr(precedence + 1)
+            expr_node = self.__math_expr(expr_node, math_rel, rest)
+            precedence = PRECEDENCE.get(self.current_token.tokentype)
+        return expr_node
+
+    def __operand(self):
+        """<operand> ::= ( <expr> ) | <rvalue>"""
         if self.__check_tokentype(token.LPAREN):
             self.__advance()
             expr_node = self.__expr()
             self.__eat(token.RPAREN)
-        else:
-            expr_node = self.__rvalue()
-        mathrels = [token.PLUS, token.MINUS, token.DIVIDE, token.MULTIPLY, token.MODULO]
-        if self.current_token.tokentype in mathrels:
-            complex_expr_node = ast.ComplexExpr()
-            complex_expr_node.first_operand = expr_node
-            complex_expr_node.math_rel = self.current_token
-            self.__advance()
-            complex_expr_node.rest = self.__expr()
-            return complex_expr_node
-        else:
-            simple_expr_node = ast.SimpleExpr()
-            simple_expr_node.term = expr_node
-            return simple_expr_node
+            return expr_node
+        simple_expr_node = ast.SimpleExpr()
+        simple_expr_node.term = self.__rvalue()
+        return simple_expr_node
+
+    def __math_expr(self, first_operand, math_rel, rest):
+        """Joins two operands, flattening left associative chains of
+        operators with the same precedence into an n-ary expression"""
+        precedence = PRECEDENCE[math_rel.tokentype]
+        if isinstance(first_operand, ast.NaryExpr) and PRECEDENCE[first_operand.math_rels[0].tokentype] == precedence:
+            first_operand.math_rels.append(math_rel)
+            first_operand.operands.append(rest)
+            return first_operand
+        if isinstance(first_operand, ast.ComplexExpr) and PRECEDENCE[first_operand.math_rel.tokentype] == precedence:
+            nary_expr_node = ast.NaryExpr()
+            nary_expr_node.operands = [first_operand.first_operand, first_operand.rest, rest]
+            nary_expr_node.math_rels = [first_operand.math_rel, math_rel]
+            return nary_expr_node
+        complex_expr_node = ast.ComplexExpr()
+        complex_expr_node.first_operand = first_operand
+        complex_expr_node.math_rel = math_rel
+        complex_expr_node.rest = rest
+        return complex_expr_node
 
     def __rvalue(self):
-        rvals = [token.STRINGVAL, token.INTVAL, token.BOOLVAL, token.FLOATVAL, token.NIL]
-        # note that this list does not contain token.NEW or token.ID bc of sequence new id
+        # note that SIMPLE_RVALS does not contain token.NEW or token.ID bc of sequence new id
         curr_token = self.current_token
-        if curr_token.tokentype in rvals:
+        if curr_token.tokentype in SIMPLE_RVALS:
             simple_rvalue_node = ast.SimpleRValue()
             simple_rvalue_node.val = self.current_token
             self.__eat(curr_token.tokentype)
@@ -291,8 +340,7 @@ class Parser(object):
 
     def __exprlist(self):
         exprs = []
-        types = [token.STRINGVAL, token.INTVAL, token.BOOLVAL, token.FLOATVAL, token.NIL, token.NEW, token.ID, token.LPAREN]
-        if self.current_token.tokentype in types:
+        if self.current_token.tokentype in EXPR_FIRST:
             exprs.append(self.__expr())
             while self.current_token.tokentype == token.COMMA:
                 self.__advance()
@@ -316,9 +364,8 @@ class Parser(object):
             return self.__bexprt(bexpr_node)
 
     def __bexprt(self, bexpr_node):
-        possible_tokens = [token.EQUAL, token.LESS_THAN, token.GREATER_THAN, token.LESS_THAN_EQUAL, token.GREATER_THAN_EQUAL, token.NOT_EQUAL]
         curr_token = self.current_token
-        if curr_token.tokentype in possible_tokens:
+        if curr_token.tokentype in BOOLRELS:
             bexpr_node.bool_rel = curr_token
             self.__advance()
             bexpr_node.second_expr = self.__expr()
@@ -326,9 +373,8 @@ class Parser(object):
         return self.__bconnct(bexpr_node)
 
     def __bconnct(self, bexpr_node):
-        possible_tokens = [token.AND, token.OR]
         curr_token = self.current_token
-        if curr_token.tokentype in possible_tokens:
+        if curr_token.tokentype in BOOL_CONNECTORS:
             bexpr_node.bool_connector = curr_token
             self.__advance()
             bexpr_node.rest = self.__bexpr()
@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   Prints a MyPL AST back as MyPL source (used to dump the program
+#   before and after optimization). Compound operands and conditions
+#   are parenthesized, so the output shows the tree's grouping.
+#----------------------------------------------------------------------
+import ast
+import token
+import sys
+
+MATH_RELS = {
+    token.PLUS: '+', token.MINUS: '-', token.MULTIPLY: '*',
+    token.DIVIDE: '/', token.MODULO: '%',
+}
+
+BOOL_RELS = {
+    token.EQUAL: '==', token.NOT_EQUAL: '!=', token.LESS_THAN: '<',
+    token.LESS_THAN_EQUAL: '<=', token.GREATER_THAN: '>',
+    token.GREATER_THAN_EQUAL: '>=',
+}
+
+class Printer(ast.Visitor):
+    """Writes a program as indented MyPL source"""
+
+    def __init__(self, output_stream=sys.stdout):
+        self.output_stream = output_stream
+        self.indent = 0
+        self.current_text = ''      # the text of the last expression
+
+    def __line(self, text):
+        self.output_stream.write('    ' * self.indent + text + '\n')
+
+    def __text(self, node):
+        node.accept(self)
+        return self.current_text
+
+    def __operand(self, expr):
+        text = self.__text(expr)
+        if isinstance(expr, (ast.ComplexExpr, ast.NaryExpr)):
+            return '(' + text + ')'
+        return text
+
+    def __block(self, stmt_list):
+        self.indent += 1
+        stmt_list.accept(self)
+        self.indent -= 1
+
+    def visit_stmt_list(self, stmt_list):
+        for stmt in stmt_list.stmts:
+            stmt.accept(self)
+
+    def visit_expr_stmt(self, expr_stmt):
+        self.__line(self.__text(expr_stmt.expr) + ';')
+
+    def visit_var_decl_stmt(self, var_decl):
+        text = 'var ' + var_decl.var_id.lexeme
+        if var_decl.var_type is not None:
+            text += ': ' + var_decl.var_type.lexeme
+        self.__line(text + ' = ' + self.__text(var_decl.var_expr) + ';')
+
+    def visit_assign_stmt(self, assign_stmt):
+        self.__line('set ' + self.__text(assign_stmt.lhs) + ' = ' + self.__text(assign_stmt.rhs) + ';')
+
+    def visit_struct_decl_stmt(self, struct_decl):
+        self.__line('struct ' + struct_decl.struct_id.lexeme)
+        self.indent += 1
+        for var_decl in struct_decl.var_decls:
+            var_decl.accept(self)
+        self.indent -= 1
+        self.__line('end')
+
+    def visit_fun_decl_stmt(self, fun_decl):
+        params = ', '.join(self.__text(param) for param in fun_decl.params)
+        self.__line('fun ' + fun_decl.return_type.lexeme + ' ' + fun_decl.fun_name.lexeme + '(' + params + ')')
+        self.__block(fun_decl.stmt_list)
+        self.__line('end')
+
+    def visit_fun_param(self, fun_param):
+        self.current_text = fun_param.param_name.lexeme + ': ' + fun_param.param_type.lexeme
+
+    def visit_return_stmt(self, return_stmt):
+        if return_stmt.return_expr is None:
+            self.__line('return;')
+        else:
+            self.__line('return ' + self.__text(return_stmt.return_expr) + ';')
+
+    def visit_while_stmt(self, while_stmt):
+        self.__line('while ' + self.__text(while_stmt.bool_expr) + ' do')
+        self.__block(while_stmt.stmt_list)
+        self.__line('end')
+
+    def visit_if_stmt(self, if_stmt):
+        keyword = 'if '
+        for basic_if in [if_stmt.if_part] + if_stmt.elseifs:
+            self.__line(keyword + self.__text(basic_if.bool_expr) + ' then')
+            self.__block(basic_if.stmt_list)
+            keyword = 'elif '
+        if if_stmt.has_else:
+            self.__line('else')
+            self.__block(if_stmt.else_stmts)
+        self.__line('end')
+
+    def visit_simple_expr(self, simple_expr):
+        simple_expr.term.accept(self)
+
+    def visit_complex_expr(self, complex_expr):
+        self.current_text = (self.__operand(complex_expr.first_operand) + ' ' +
+                             MATH_RELS[complex_expr.math_rel.tokentype] + ' ' +
+                             self.__operand(complex_expr.rest))
+
+    def visit_nary_expr(self, nary_expr):
+        text = self.__operand(nary_expr.operands[0])
+        for math_rel, operand in zip(nary_expr.math_rels, nary_expr.operands[1:]):
+            text += ' ' + MATH_RELS[math_rel.tokentype] + ' ' + self.__operand(operand)
+        self.current_text = text
+
+    def visit_bool_expr(self, bool_expr):
+        text = self.__text(bool_expr.first_expr)
+        if isinstance(bool_expr.first_expr, ast.BoolExpr):
+            text = '(' + text + ')'
+        if bool_expr.negated:
+            text = 'not ' + text
+        if bool_expr.bool_rel is not None:
+            text += ' ' + BOOL_RELS[bool_expr.bool_rel.tokentype] + ' ' + self.__text(bool_expr.second_expr)
+        if bool_expr.bool_connector is not None:
+            text += ' ' + bool_expr.bool_connector.lexeme + ' ' + self.__text(bool_expr.rest)
+        self.current_text = text
+
+    def visit_lvalue(self, lval):
+        self.current_text = '.'.join(the_token.lexeme for the_token in lval.path)
+
+    def visit_simple_rvalue(self, simple_rvalue):
+        the_token = simple_rvalue.val
+        if the_token.tokentype == token.STRINGVAL:
+            self.current_text = '"' + the_token.lexeme + '"'
+        else:
+            self.current_text = the_token.lexeme
+
+    def visit_new_rvalue(self, new_rvalue):
+        self.current_text = 'new ' + new_rvalue.struct_type.lexeme
+
+    def visit_call_rvalue(self, call_rvalue):
+        args = ', '.join(self.__text(arg) for arg in call_rvalue.args)
+        self.current_text = call_rvalue.fun.lexeme + '(' + args + ')'
+
+    def visit_id_rvalue(self, id_rvalue):
+        self.current_text = '.'.join(the_token.lexeme for the_token in id_rvalue.path)
+
+
+def source(node):
+    """Returns the MyPL source of an expression or condition"""
+    the_printer = Printer(None)
+    node.accept(the_printer)
+    return the_printer.current_text
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   MyPL program input. readi, readf and reads take their values from
+#   the current Input, which reads its source in large blocks and hands
+#   out lines (or, in token mode, whitespace separated tokens, so
+#   several ints can share a line) from its buffer. The source is
+#   sys.stdin by default, or a file or a string given by an embedder
+#   (from_path, from_text and use). A terminal is read a line at a
+#   time, so prompts still work.
+#----------------------------------------------------------------------
+import io
+import sys
+import runtime
+
+# what each read takes
+LINES, TOKENS = 'lines', 'tokens'
+
+# characters read from the source at a time
+BLOCK_SIZE = 1 << 16
+
+
+class Input(object):
+    """A buffered input channel over a text stream (None for the
+    sys.stdin of the time of the read). A block_size of None reads a
+    line at a time (for a stream shared with the lexer). Reading past
+    the end raises runtime.BuiltinError, which the engines report at
+    the read call."""
+
+    def __init__(self, stream=None, mode=LINES, block_size=BLOCK_SIZE):
+        self.stream = stream
+        self.mode = mode
+        self.block_size = block_size
+        self.lines = []         # the complete lines read ahead
+        self.next_line = 0      # index of the next line to hand out
+        self.partial = ''       # the text after the last newline read
+        self.tokens = []        # the tokens left on the current line
+        self.next_token = 0
+        self.at_end = False
+
+    def __fill(self):
+        """Reads the next block into lines, returns False at the end"""
+        if self.at_end:
+            return False
+        stream = self.stream if self.stream is not None else sys.stdin
+        if self.block_size is None or stream.isatty():
+            block = stream.readline()
+        else:
+            block = stream.read(self.block_size)
+        if not block:
+            self.at_end = True
+            if not self.partial:
+                return False
+            # the last line has no newline
+            self.lines = [self.partial]
+            self.partial = ''
+        else:
+            self.lines = (self.partial + block).split('\n')
+            self.partial = self.lines.pop()
+        self.next_line = 0
+        return True
+
+    def readline(self):
+        """Returns the next line (without its newline)"""
+        while self.next_line >= len(self.lines):
+            if not self.__fill():
+                raise runtime.BuiltinError('end of input')
+        line = self.lines[self.next_line]
+        self.next_line += 1
+        return line
+
+    def read(self):
+        """Returns the text of the next read: a line, or a token in
+        token mode"""
+        if self.mode == LINES:
+            return self.readline()
+        while self.next_token >= len(self.tokens):
+            self.tokens = self.readline().split()
+            self.next_token = 0
+        token = self.tokens[self.next_token]
+        self.next_token += 1
+        return token
+
+
+def from_path(path, mode=LINES):
+    """Returns an Input reading a file"""
+    return Input(open(path, 'r'), mode)
+
+def from_text(text, mode=LINES):
+    """Returns an Input reading a string"""
+    return Input(io.StringIO(text), mode)
+
+
+# the input of the running program
+_current = None
+
+def current():
+    """Returns the current Input (created on first use)"""
+    global _current
+    if _current is None:
+        _current = Input()
+    return _current
+
+def use(channel):
+    """Makes channel (an Input, or None for a default one) the current
+    input, returns the previous"""
+    global _current
+    previous = _current
+    _current = channel
+    return previous
+
+def read():
+    return current().read()
@@ -0,0 +1,109 @@
+# Author: Luke Hartman
+# Description:
+#   A table-driven lexer for MyPL. A single compiled regular expression
+#   splits the source into lexemes and the keyword and symbol tables in
+#   token.py give their token types. It is a drop-in alternative to
+#   lexer.Lexer (same next_token() interface and token stream).
+import re
+import token
+import error
+import lexer
+
+def _excluding(characters):
+    """Returns a character class matching any character but these"""
+    return '[^%s]' % ''.join(re.escape(c) for c in sorted(characters) if c)
+
+# one alternative per lexeme class, tried at the current offset. Words
+# and numbers end at the hand lexer's delimiters (so x-1 is one word):
+# a word starts with any character no other class starts with (! only
+# when no = follows)
+TOKEN_REGEX = re.compile(r'''
+    (?P<skip>(?:\s|\#[^\n]*)+)
+  | (?P<symbol>[=<>!]=|[;,:./<>()%%*+=-])
+  | (?P<number>[0-9]%(number_rest)s*)
+  | (?P<string>"[^"\n]*")
+  | (?P<word>(?:[^\s0-9"\#!;,:./<>()%%*+=-]|!)%(word_rest)s*)
+''' % {'number_rest': _excluding(lexer.NUMBER_DELIMITERS),
+       'word_rest': _excluding(lexer.ID_DELIMITERS)}, re.VERBOSE)
+
+class RegexLexer(object):
+    def __init__(self, input_stream):
+        self.source_map = lexer.SourceMap(lexer.source_path(input_stream))
+        self.buffer = lexer.SourceBuffer(input_stream, self.source_map)
+        # tokens never span lines, so any token starting at or before the
+        # last buffered newline (or anywhere, at EOF) can be matched
+        self.limit = -1
+
+    def __error(self, msg, pos):
+        offset = self.buffer.base + pos
+        line, column = self.source_map.position(offset)
+        raise error.MyPLError(msg, line, column, self.source_map.snippet(offset))
+
+    def __fill(self):
+        """Reads the next chunk of the input into the buffer"""
+        buf = self.buffer
+        if buf.fill():
+            self.limit = buf.text.rfind('\n')
+        else:
+            self.limit = len(buf.text)
+
+    def next_token(self):
+        """ Returns the next token to be parsed"""
+        buf = self.buffer
+        while True:
+            if buf.pos > self.limit and not buf.eof:
+                self.__fill()
+                continue
+            text = buf.text
+            start = buf.pos
+            match = TOKEN_REGEX.match(text, start)
+            if match is None or match.lastgroup != 'skip':
+                break
+            # whitespace and comments
+            if match.end() == len(text) and not buf.eof:
+                # the comment (or run of whitespace) may continue
+                self.__fill()
+                continue
+            buf.pos = match.end()
+        offset = buf.base + start
+        if match is None:
+            if start >= len(text):
+                return token.Token(token.EOS, '', offset, self.source_map)
+            if text[start] == '"':
+                self.__error('invalid string val: cannot have newline in string', start)
+            self.__error('invalid symbol "%s"' % text[start], start)
+        kind = match.lastgroup
+        lexeme = match.group()
+        buf.pos = match.end()
+        if kind == 'word':
+            if lexeme[0] == '_':
+                self.__error("invalid id: cannot start identifier with '_'", start)
+            return token.Token(token.KEYWORDS.get(lexeme, token.ID), lexeme, offset, self.source_map)
+        elif kind == 'symbol':
+            if lexeme == '.' and text[buf.pos:buf.pos + 1].isdigit():
+                self.__error('invalid float value: must start with digit', start)
+            return token.Token(token.SYMBOLS[lexeme], lexeme, offset, self.source_map)
+        elif kind == 'number':
+            return self.__number(lexeme, start)
+        return token.Token(token.STRINGVAL, lexeme[1:-1], offset, self.source_map)
+
+    def __number(self, lexeme, start):
+        """Checks a matched number lexeme (the hand lexer's checks, in
+        its order) and returns its token"""
+        buf = self.buffer
+        # the character after the lexeme ('' at EOF)
+        following = lexeme + buf.text[buf.pos:buf.pos + 1]
+        if not following[1:2].isdigit() and following[1:2] not in lexer.NUMBER_FOLLOWERS:
+            self.__error('do not mix ints/floats with other symbol types', start)
+        if lexeme[0] == '0' and following[1:2].isdigit():
+            self.__error('invalid integer value: starts with 0', start)
+        is_float = False
+        for index in range(1, len(lexeme)):
+            if lexeme[index] == '.':
+                if is_float:
+                    self.__error('invalid float: duplicate periods', start)
+                is_float = True
+                if not following[index + 1:index + 2].isdigit():
+                    self.__error("invalid float: cannot end with '.'", start)
+        tokentype = token.FLOATVAL if is_float else token.INTVAL
+        return token.Token(tokentype, lexeme, buf.base + start, self.source_map)
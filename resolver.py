@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   MyPL variable resolver for the interpreter. Binds every variable
+#   declaration and use (VarDeclStmt, LValue, IDRvalue) to a (depth,
+#   slot) pair: depth 0 is the global frame and depth 1 the frame of
+#   the running function, slot the variable's index in that list. A
+#   block's variables get their own slots in the enclosing frame, so
+#   entering a block allocates nothing, and the slots of a finished
+#   block are reused by the next one. A function's parameters take the
+#   first slots of its frame, and its self calls in tail position are
+#   marked (CallRValue.tail) so the interpreter can run them as loops.
+#   A call of a builtin is bound to its builtin_registry.Builtin. The
+#   fields of a path (tree.left.value) become one attrgetter, a
+#   chain of slot loads on the interpreter's slotted struct objects.
+#   Undefined variables are reported here, before the program runs.
+#----------------------------------------------------------------------
+import ast
+import operator
+import runtime
+import builtin_registry
+
+GLOBAL, LOCAL = 0, 1
+
+
+class Resolver(ast.Visitor):
+    """Resolves the variables of a program in place"""
+
+    def __init__(self):
+        # compile-time scopes {name:(depth, slot)}, innermost last
+        self.scopes = [{}]
+        self.depth = GLOBAL     # the frame new variables go in
+        self.next_slot = [0, 0] # per depth, the first free slot
+        self.sizes = [0, 0]     # per depth, the slots used so far
+        self.function = None    # the FunDeclStmt being resolved
+        self.functions = set()  # the names of the functions declared so far
+        self.returns_value = False  # a return of the function has an expression
+
+    def __error(self, msg, the_token):
+        runtime.raise_error(msg, the_token)
+
+    def resolve(self, stmt_list):
+        """Resolves a program (its top-level statements share the global
+        scope with the ones resolved before)"""
+        for stmt in stmt_list.stmts:
+            stmt.accept(self)
+        return stmt_list
+
+    def resolve_stmt(self, stmt):
+        """Resolves a top-level statement (see Interpreter.run_stream)"""
+        stmt.accept(self)
+        return stmt
+
+    def global_size(self):
+        """Returns the number of global frame slots"""
+        return self.sizes[GLOBAL]
+
+    def __declare(self, the_token):
+        """Gives a variable the next slot of the current frame, returns
+        (depth, slot)"""
+        depth = self.depth
+        slot = self.next_slot[depth]
+        self.next_slot[depth] = slot + 1
+        self.sizes[depth] = max(self.sizes[depth], slot + 1)
+        self.scopes[-1][the_token.lexeme] = (depth, slot)
+        return depth, slot
+
+    def __lookup(self, the_token):
+        name = the_token.lexeme
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        self.__error('undefined variable "%s"' % name, the_token)
+
+    def visit_stmt_list(self, stmt_list):
+        # a block: its slots are free again once it ends
+        self.scopes.append({})
+        first_free = self.next_slot[self.depth]
+        for stmt in stmt_list.stmts:
+            stmt.accept(self)
+        self.next_slot[self.depth] = first_free
+        self.scopes.pop()
+
+    def visit_expr_stmt(self, expr_stmt):
+        expr_stmt.expr.accept(self)
+
+    def visit_var_decl_stmt(self, var_decl):
+        # the initial value may use a variable the declaration hides
+        var_decl.var_expr.accept(self)
+        var_decl.depth, var_decl.slot = self.__declare(var_decl.var_id)
+
+    def visit_assign_stmt(self, assign_stmt):
+        assign_stmt.rhs.accept(self)
+        assign_stmt.lhs.accept(self)
+
+    def visit_lvalue(self, lval):
+        lval.depth, lval.slot = self.__lookup(lval.path[0])
+        # the object whose last field is set
+        if len(lval.path) > 2:
+            lval.fields = self.__fields(lval.path[1:-1])
+
+    def visit_return_stmt(self, return_stmt):
+        if return_stmt.return_expr is not None:
+            self.returns_value = True
+            return_stmt.return_expr.accept(self)
+            # return f(...) in f: the call's result is the function's
+            call_rvalue = self.__self_call(return_stmt.return_expr)
+            if call_rvalue is not None:
+                call_rvalue.tail = True
+
+    def visit_while_stmt(self, while_stmt):
+        while_stmt.bool_expr.accept(self)
+        while_stmt.stmt_list.accept(self)
+
+    def visit_if_stmt(self, if_stmt):
+        for basic_if in [if_stmt.if_part] + if_stmt.elseifs:
+            basic_if.bool_expr.accept(self)
+            basic_if.stmt_list.accept(self)
+        if if_stmt.has_else:
+            if_stmt.else_stmts.accept(self)
+
+    def visit_simple_expr(self, simple_expr):
+        simple_expr.term.accept(self)
+
+    def visit_complex_expr(self, complex_expr):
+        complex_expr.first_operand.accept(self)
+        complex_expr.rest.accept(self)
+
+    def visit_nary_expr(self, nary_expr):
+        for operand in nary_expr.operands:
+            operand.accept(self)
+
+    def visit_bool_expr(self, bool_expr):
+        bool_expr.first_expr.accept(self)
+        if bool_expr.second_expr is not None:
+            bool_expr.second_expr.accept(self)
+        if bool_expr.rest is not None:
+            bool_expr.rest.accept(self)
+
+    def visit_call_rvalue(self, call_rvalue):
+        for arg in call_rvalue.args:
+            arg.accept(self)
+        # a MyPL function hides the builtin of its name
+        name = call_rvalue.fun.lexeme
+        if name not in self.functions and name in builtin_registry.BUILTINS:
+            call_rvalue.builtin = builtin_registry.BUILTINS[name]
+            builtin_registry.check_arity(call_rvalue.builtin, call_rvalue)
+            call_rvalue.text = builtin_registry.print_literal(call_rvalue.builtin, call_rvalue)
+
+    def visit_id_rvalue(self, id_rvalue):
+        id_rvalue.depth, id_rvalue.slot = self.__lookup(id_rvalue.path[0])
+        if len(id_rvalue.path) > 1:
+            id_rvalue.fields = self.__fields(id_rvalue.path[1:])
+
+    def __fields(self, path):
+        """Returns the function loading a path of fields from an object"""
+        return operator.attrgetter('.'.join(runtime.field_name(the_token.lexeme) for the_token in path))
+
+    def visit_simple_rvalue(self, simple_rvalue): pass
+    def visit_new_rvalue(self, new_rvalue): pass
+
+    def visit_struct_decl_stmt(self, struct_decl):
+        # structs are declared at the top level, so the field defaults
+        # (run at each new) see the globals
+        for var_decl in struct_decl.var_decls:
+            var_decl.var_expr.accept(self)
+
+    def visit_fun_decl_stmt(self, fun_decl):
+        # the body sees the globals and its own frame (depth LOCAL)
+        self.depth = LOCAL
+        self.next_slot[LOCAL] = self.sizes[LOCAL] = 0
+        self.function = fun_decl
+        self.functions.add(fun_decl.fun_name.lexeme)
+        self.returns_value = False
+        self.scopes.append({})
+        for param in fun_decl.params:
+            self.__declare(param.param_name)
+        fun_decl.stmt_list.accept(self)
+        self.scopes.pop()
+        fun_decl.frame_size = self.sizes[LOCAL]
+        if not self.returns_value:
+            # every call returns nil, so f(...); as the last statement
+            # returns what the call returns
+            self.__mark_tail_stmts(fun_decl.stmt_list)
+        self.function = None
+        self.depth = GLOBAL
+
+    def __self_call(self, expr):
+        """Returns the CallRValue of an expression that is just a call of
+        the function being resolved, or None"""
+        if type(expr) is ast.SimpleExpr and type(expr.term) is ast.CallRValue:
+            if expr.term.fun.lexeme == self.function.fun_name.lexeme:
+                return expr.term
+        return None
+
+    def __mark_tail_stmts(self, stmt_list):
+        """Marks the self calls that are the last statement of a block
+        ending the function"""
+        if not stmt_list.stmts:
+            return
+        last = stmt_list.stmts[-1]
+        if type(last) is ast.ExprStmt:
+            call_rvalue = self.__self_call(last.expr)
+            if call_rvalue is not None:
+                call_rvalue.tail = True
+        elif type(last) is ast.IfStmt:
+            for basic_if in [last.if_part] + last.elseifs:
+                self.__mark_tail_stmts(basic_if.stmt_list)
+            if last.has_else:
+                self.__mark_tail_stmts(last.else_stmts)
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   Rope strings for the interpreter's + on strings. A Rope is a list
+#   of chunks and their end offsets, shared by the ropes built from it:
+#   a rope is a prefix (its count) of the list, so appending to the
+#   newest rope appends to the list in place and leaves the older ropes
+#   unchanged. set s = s + t in a loop is then linear instead of
+#   quadratic. length and get work on the chunks; comparisons, hashing
+#   and str() (print, the other builtins) join the chunks once.
+#----------------------------------------------------------------------
+import bisect
+
+# results of + shorter than this stay plain strings
+ROPE_MIN = 256
+
+
+class Rope(object):
+    """An immutable string made of chunks (see concat)"""
+    __slots__ = ('chunks', 'ends', 'count', 'length', 'flat')
+
+    def __init__(self, chunks, ends, count, length):
+        self.chunks = chunks    # strings, shared with the other ropes of the list
+        self.ends = ends        # the offset after each chunk
+        self.count = count      # the chunks of this rope
+        self.length = length
+        self.flat = None        # the joined string, once needed
+
+    def append(self, text):
+        """Returns this rope followed by text (a string)"""
+        chunks, ends, count = self.chunks, self.ends, self.count
+        if count != len(chunks):
+            # a newer rope shares the list: copy this one's prefix
+            chunks, ends = chunks[:count], ends[:count]
+        length = self.length + len(text)
+        chunks.append(text)
+        ends.append(length)
+        return Rope(chunks, ends, count + 1, length)
+
+    def extend(self, other):
+        """Returns this rope followed by another"""
+        result = self
+        for chunk in other.chunks[:other.count]:
+            result = result.append(chunk)
+        return result
+
+    def __str__(self):
+        if self.flat is None:
+            chunks = self.chunks
+            self.flat = ''.join(chunks if self.count == len(chunks) else chunks[:self.count])
+        return self.flat
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __getitem__(self, index):
+        if self.flat is not None:
+            return self.flat[index]
+        if not 0 <= index < self.length:
+            raise IndexError('rope index out of range')
+        i = bisect.bisect_right(self.ends, index, 0, self.count)
+        start = self.ends[i - 1] if i else 0
+        return self.chunks[i][index - start]
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __eq__(self, other):
+        if type(other) is Rope:
+            return self.length == other.length and str(self) == str(other)
+        if type(other) is str:
+            return self.length == len(other) and str(self) == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __lt__(self, other):
+        return str(self) < flat(other) if is_string(other) else NotImplemented
+
+    def __le__(self, other):
+        return str(self) <= flat(other) if is_string(other) else NotImplemented
+
+    def __gt__(self, other):
+        return str(self) > flat(other) if is_string(other) else NotImplemented
+
+    def __ge__(self, other):
+        return str(self) >= flat(other) if is_string(other) else NotImplemented
+
+
+def is_string(value):
+    return type(value) is str or type(value) is Rope
+
+def flat(value):
+    """Returns a rope as a string (other values unchanged)"""
+    return str(value) if type(value) is Rope else value
+
+def concat(x, y):
+    """MyPL + with a string operand: the result is a Rope once it is
+    ROPE_MIN long, and a Rope on the left is appended to"""
+    if type(y) is not Rope:
+        y = str(y)
+    if type(x) is Rope:
+        return x.extend(y) if type(y) is Rope else x.append(y)
+    x = str(x)
+    if type(y) is Rope:
+        return Rope([x], [len(x)], 1, len(x)).extend(y)
+    if len(x) + len(y) < ROPE_MIN:
+        return x + y
+    return Rope([x, y], [len(x), len(x) + len(y)], 2, len(x) + len(y))
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   MyPL run-time support shared by the execution engines: literal
+#   decoding, the Python names of MyPL names, the value semantics of
+#   operators and the error reporting of builtins (see
+#   builtin_registry.py).
+#----------------------------------------------------------------------
+import string
+import token
+import error
+
+class BuiltinError(Exception):
+    """Raised by a builtin, reported at its call site"""
+
+def raise_error(msg, the_token):
+    """Raises a MyPLError located at the_token"""
+    raise error.MyPLError(msg, the_token.line, the_token.column, the_token.snippet())
+
+# the characters MyPL names keep in Python names
+NAME_CHARS = frozenset(string.ascii_letters + string.digits)
+
+def python_name(prefix, name):
+    """Returns the Python name of a MyPL name: the prefix, then the
+    name with the characters other than ASCII letters and digits
+    escaped (_ as __, the others as _<hex code>_). Different names (or
+    prefixes) give different Python names, never a keyword."""
+    return prefix + ''.join(c if c in NAME_CHARS else '__' if c == '_' else '_%x_' % ord(c)
+                            for c in name)
+
+def field_name(name):
+    """Returns the Python attribute of a MyPL struct field (the slots
+    of the engines' struct classes must be identifiers)"""
+    return python_name('f_', name)
+
+def literal_value(the_token):
+    """Returns the value of a literal token"""
+    tokentype = the_token.tokentype
+    if tokentype == token.INTVAL:
+        return int(the_token.lexeme)
+    elif tokentype == token.FLOATVAL:
+        return float(the_token.lexeme)
+    elif tokentype == token.BOOLVAL:
+        return the_token.lexeme == 'true'
+    elif tokentype == token.STRINGVAL:
+        return the_token.lexeme
+    return None
+
+def add(x, y):
+    """MyPL +: a string absorbs the other operand"""
+    if type(x) is str or type(y) is str:
+        return str(x) + str(y)
+    return x + y
+
+def divide(x, y):
+    """MyPL /: integer division (truncating) on ints"""
+    if y == 0:
+        raise BuiltinError('division by zero')
+    if type(x) is int and type(y) is int:
+        quotient = abs(x) // abs(y)
+        return quotient if (x < 0) == (y < 0) else -quotient
+    return x / y
+
+def modulo(x, y):
+    """MyPL %: on ints, the remainder of the truncating division (its
+    sign is the dividend's), so (x / y) * y + x % y == x"""
+    if y == 0:
+        raise BuiltinError('division by zero')
+    if type(x) is int and type(y) is int:
+        remainder = abs(x) % abs(y)
+        return remainder if x >= 0 else -remainder
+    return x % y
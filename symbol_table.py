@@ -1,79 +1,82 @@
+class Environment(object):
+    """An environment maps the names declared in one scope to their
+    information and links to the enclosing environment"""
+    __slots__ = ('names', 'parent')
+
+    def __init__(self, parent=None):
+        self.names = {}         # {id_name:info}
+        self.parent = parent    # enclosing Environment (None for the outermost)
+
+
 class SymbolTable(object):
     """A symbol table consists of a stack of environments, where each
-    environment maps a (variable) name to its associated information
+    environment maps a (variable) name to its associated information.
+    The environments are linked to their parents, so the current one
+    is found without searching and a lookup only visits the scopes
+    between a use and its declaration. The env_id of an environment is
+    an opaque handle (the Environment itself) for get/set_env_id.
     """
-    
+
     def __init__(self):
-        self.scopes = []        # list of {id_name:info}
         self.env_id = None      # current environment in use
 
-    def __get_env_index(self):
-        for i, scope in enumerate(self.scopes):
-            if self.env_id == id(scope):
-                return i
-
     def __environment(self, name):
-        # search from last (most recent) to first environment
-        index = self.__get_env_index()
-        for i in range(index, -1, -1):
-            if name in self.scopes[i]:
-                return self.scopes[i]
-    
+        # search from the current (most recent) to the outermost environment
+        env = self.env_id
+        while env is not None:
+            if name in env.names:
+                return env.names
+            env = env.parent
+        return None
+
     def id_exists(self, identifier):
-        return self.__environment(identifier) != None
+        return self.__environment(identifier) is not None
 
     def id_exists_in_env(self, identifier, env_id):
-        for scope in self.scopes:
-            if env_id == id(scope):
-                return identifier in scope
-    
+        return env_id is not None and identifier in env_id.names
+
     def add_id(self, identifier):
         # can't add if no environments
-        if not self.scopes:
+        if self.env_id is None:
             return
-        # add to the most recently added environemt
-        self.scopes[self.__get_env_index()][identifier] = None
-    
+        # add to the most recently added environment
+        self.env_id.names[identifier] = None
+
     def get_info(self, identifier):
-        env = self.__environment(identifier)
-        if env is not None:
-            return env[identifier]
-    
+        env = self.env_id
+        while env is not None:
+            names = env.names
+            if identifier in names:
+                return names[identifier]
+            env = env.parent
+        return None
+
     def set_info(self, identifier, info):
-        env = self.__environment(identifier)
-        if env is not None:
-            env[identifier] = info
-    
+        names = self.__environment(identifier)
+        if names is not None:
+            names[identifier] = info
+
     def push_environment(self):
-        new_scope = {}
-        if len(self.scopes) == 0:
-            self.scopes.append(new_scope)
-        else:
-            index = self.__get_env_index()
-            if index == len(self.scopes) - 1:
-                self.scopes.append(new_scope)
-            else:
-                self.scopes.insert(index + 1, new_scope)
-        self.env_id = id(new_scope)
+        self.env_id = Environment(self.env_id)
 
     def get_env_id(self):
         return self.env_id
 
     def set_env_id(self, env_id):
         self.env_id = env_id
-    
+
     def pop_environment(self):
-        if len(self.scopes) <= 0:
+        if self.env_id is None:
             return
-        index = self.__get_env_index()
-        del self.scopes[index]
-        if index > 0:
-            self.env_id = id(self.scopes[index-1])
-        else:
-            self.env_id = None
-    
+        self.env_id = self.env_id.parent
+
     def __str__(self):
+        scopes = []
+        env = self.env_id
+        while env is not None:
+            scopes.append(env)
+            env = env.parent
         s = ''
-        for i, scope in enumerate(self.scopes):
-            s += ' '*i + str(id(scope)) + ': ' + str(scope) + '\n'
+        for i, scope in enumerate(reversed(scopes)):
+            s += ' '*i + str(id(scope)) + ': ' + str(scope.names) + '\n'
         return s
@@ -3,6 +3,9 @@
 # Assignment: 2
 # Description:
 #   This class defines tokens in MyPL
+import sys
+from array import array
+
 ASSIGN = 'ASSIGN'
 COMMA = 'COMMA'
 COLON = 'COLON'
@@ -49,13 +52,114 @@ FLOATVAL='FLOATVAL'
 STRINGVAL='STRINGVAL'
 ID='ID'
 
+# reserved words (and boolean values) mapped to their token type
+KEYWORDS = {
+    'true': BOOLVAL, 'false': BOOLVAL,
+    'int': INTTYPE, 'float': FLOATTYPE, 'bool': BOOLTYPE,
+    'string': STRINGTYPE, 'struct': STRUCTTYPE,
+    'and': AND, 'or': OR, 'not': NOT,
+    'while': WHILE, 'do': DO, 'if': IF, 'then': THEN, 'else': ELSE,
+    'elif': ELIF, 'end': END, 'fun': FUN, 'var': VAR, 'set': SET,
+    'return': RETURN, 'new': NEW, 'nil': NIL,
+}
+
+# operator and punctuation lexemes mapped to their token type
+SYMBOLS = {
+    '=': ASSIGN, ',': COMMA, ':': COLON, '/': DIVIDE, '.': DOT,
+    '==': EQUAL, '>': GREATER_THAN, '>=': GREATER_THAN_EQUAL,
+    '<': LESS_THAN, '<=': LESS_THAN_EQUAL, '!=': NOT_EQUAL,
+    '(': LPAREN, ')': RPAREN, '-': MINUS, '%': MODULO, '*': MULTIPLY,
+    '+': PLUS, ';': SEMICOLON,
+}
+
+# every token type, indexed by its (one byte) type code
+TOKEN_TYPES = [
+    ASSIGN, COMMA, COLON, DIVIDE, DOT, EQUAL, GREATER_THAN,
+    GREATER_THAN_EQUAL, LESS_THAN, LESS_THAN_EQUAL, NOT_EQUAL, LPAREN,
+    RPAREN, MINUS, MODULO, MULTIPLY, PLUS, SEMICOLON, BOOLTYPE, INTTYPE,
+    FLOATTYPE, STRINGTYPE, STRUCTTYPE, AND, OR, NOT, WHILE, DO, IF, THEN,
+    ELSE, ELIF, END, FUN, VAR, SET, RETURN, NEW, NIL, EOS, BOOLVAL,
+    INTVAL, FLOATVAL, STRINGVAL, ID,
+]
+TYPE_CODES = {tokentype: code for code, tokentype in enumerate(TOKEN_TYPES)}
+
 
 class Token(object):
-    def __init__(self, tokentype, lexeme, line, column):
+    # tokens are kept alive by the AST, so they carry no __dict__ and
+    # their lexemes are interned (repeated ids and keywords share a string).
+    # A token only records its start offset, the line and column are
+    # resolved through the lexer's source map when needed.
+    __slots__ = ('tokentype', 'lexeme', 'offset', 'source_map')
+
+    def __init__(self, tokentype, lexeme, offset, source_map=None):
         self.tokentype = tokentype
-        self.lexeme = lexeme
-        self.line = line
-        self.column = column        
+        self.lexeme = sys.intern(lexeme)
+        self.offset = offset
+        self.source_map = source_map
+
+    @property
+    def line(self):
+        if self.source_map is None:
+            return 0
+        return self.source_map.position(self.offset)[0]
+
+    @property
+    def column(self):
+        if self.source_map is None:
+            return 0
+        return self.source_map.position(self.offset)[1]
+
+    def snippet(self):
+        """Returns the source line of the token with a caret under it"""
+        if self.source_map is None:
+            return None
+        return self.source_map.snippet(self.offset)
+
+    def __reduce__(self):
+        # pickle compactly as a constructor call (cache.py stores the
+        # source map as a reference to the one rebuilt on load)
+        return (Token, (self.tokentype, self.lexeme, self.offset, self.source_map))
 
     def __str__(self):
         return self.tokentype + ' \'' + self.lexeme + '\' ' + str(self.line) + ':' + str(self.column)
+
+
+class TokenStream(object):
+    """A columnar token stream for bulk consumers. Type codes and start
+    offsets are held in array buffers and each lexeme is an index into
+    a table of distinct lexemes.
+    """
+    def __init__(self, source_map=None):
+        self.types = array('B')         # TYPE_CODES value per token
+        self.lexemes = array('i')       # index into lexeme_table per token
+        self.offsets = array('l')       # start offset per token
+        self.lexeme_table = []          # [lexeme]
+        self.lexeme_index = {}          # {lexeme:index into lexeme_table}
+        self.source_map = source_map    # resolves offsets to lines and columns
+
+    @classmethod
+    def from_lexer(cls, lexer):
+        """Reads every token (up to and including EOS) from a lexer"""
+        stream = cls(lexer.source_map)
+        while True:
+            the_token = lexer.next_token()
+            stream.append(the_token)
+            if the_token.tokentype == EOS:
+                return stream
+
+    def append(self, the_token):
+        index = self.lexeme_index.get(the_token.lexeme)
+        if index is None:
+            index = len(self.lexeme_table)
+            self.lexeme_table.append(the_token.lexeme)
+            self.lexeme_index[the_token.lexeme] = index
+        self.types.append(TYPE_CODES[the_token.tokentype])
+        self.lexemes.append(index)
+        self.offsets.append(the_token.offset)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, i):
+        return Token(TOKEN_TYPES[self.types[i]], self.lexeme_table[self.lexemes[i]],
+                     self.offsets[i], self.source_map)
@@ -0,0 +1,377 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   MyPL to Python transpiler. Turns a program into Python source:
+#   structs become slotted classes, functions Python functions and
+#   loops native loops, and CPython's compiler does the rest. A source
+#   map from the generated lines back to MyPL tokens keeps run-time
+#   errors reported at MyPL lines and columns.
+#----------------------------------------------------------------------
+import sys
+import ast
+import token
+import runtime
+import builtin_registry
+import output
+
+# the file name of the generated code (marks its frames in tracebacks)
+FILENAME = '<mypl>'
+
+# delimiters of the marks placed in generated expressions (see
+# Transpiler.__mark); literals are repr()'d so never hold them
+MARK, END_MARK = '\x00', '\x01'
+
+PYTHON_OPS = {
+    token.PLUS: '+', token.MINUS: '-', token.MULTIPLY: '*', token.MODULO: '%',
+    token.EQUAL: '==', token.NOT_EQUAL: '!=', token.LESS_THAN: '<',
+    token.LESS_THAN_EQUAL: '<=', token.GREATER_THAN: '>',
+    token.GREATER_THAN_EQUAL: '>=',
+}
+
+# call depth allowed to MyPL programs
+RECURSION_LIMIT = 100000
+
+# run-time failures of the generated code, as MyPL error messages ({}
+# is the lexeme of the failed token)
+ERROR_MESSAGES = {
+    AttributeError: 'bad path: nil value or unknown field',
+    RecursionError: 'stack overflow',
+    # a call of a function declared later (or never) ran first
+    NameError: 'undefined function "{}"',
+}
+
+
+def nil_checked(builtin):
+    """Wraps a builtin with the nil check of its arguments"""
+    def checked(*args):
+        if None in args:
+            raise runtime.BuiltinError('bad value: should not be nil')
+        return builtin(*args)
+    return checked
+
+
+class Transpiler(ast.Visitor):
+    """Generates the Python source of a MyPL program. The program becomes
+    a function (main) so its variables are fast locals; MyPL functions
+    and structs are nested in it. Every MyPL variable gets a unique
+    Python name, so block scoping needs no run-time support (see
+    runtime.python_name for the names of the others)."""
+
+    def __init__(self):
+        self.lines = []         # generated source lines
+        # the source map: per line, the MyPL token of its statement and
+        # the (column, token) of each part of the line that can fail
+        self.line_tokens = []
+        self.marks = []         # tokens of the marks in pending lines
+        self.indent = 1
+        self.current_expr = None
+        self.current_token = None   # token of the statement being generated
+        # compile-time scopes {MyPL name:Python name}, innermost last;
+        # the ones below scope_base belong to main
+        self.scopes = [{}]
+        self.scope_base = 0
+        self.names = {}         # {MyPL name:number of Python names made}
+        self.outer_assigned = None  # main variables assigned by the current function
+        self.functions = {}     # {MyPL name:parameter count} declared so far
+        self.declared = {}      # the same, of all the program's functions
+        self.structs = {}       # {MyPL name:Python constructor name}
+
+    def __error(self, msg, the_token):
+        runtime.raise_error(msg, the_token)
+
+    def transpile(self, stmt_list):
+        """Returns the Python source of a program and its source map"""
+        # calls of a function declared later (mutual recursion) are
+        # checked against its declaration too
+        for stmt in stmt_list.stmts:
+            if type(stmt) is ast.FunDeclStmt:
+                self.declared.setdefault(stmt.fun_name.lexeme, len(stmt.params))
+        self.__emit('def main():', None, indent=0)
+        stmt_list.accept(self)
+        self.__emit('pass')
+        return '\n'.join(self.lines) + '\n', self.line_tokens
+
+    def __emit(self, line, the_token=False, indent=None):
+        if indent is None:
+            indent = self.indent
+        line = '    ' * indent + line
+        # replace the marks with their columns
+        marks = []
+        start = line.find(MARK)
+        while start != -1:
+            end = line.index(END_MARK, start)
+            marks.append((start, self.marks[int(line[start + 1:end])]))
+            line = line[:start] + line[end + 1:]
+            start = line.find(MARK, start)
+        self.lines.append(line)
+        self.line_tokens.append((self.current_token if the_token is False else the_token, marks))
+
+    def __mark(self, the_token):
+        """Returns a mark locating the generated code that follows it"""
+        self.marks.append(the_token)
+        return '%s%d%s' % (MARK, len(self.marks) - 1, END_MARK)
+
+    def __expr(self, node):
+        node.accept(self)
+        return self.current_expr
+
+    # variables
+
+    def __declare(self, the_token):
+        name = the_token.lexeme
+        count = self.names.get(name, 0)
+        self.names[name] = count + 1
+        # v_x, then v1_x, v2_x...: the count ends at the first _, so
+        # names of different variables never meet
+        variable = runtime.python_name('v%d_' % count if count else 'v_', name)
+        self.scopes[-1][name] = variable
+        return variable
+
+    def __lookup(self, the_token, assigned=False):
+        name = the_token.lexeme
+        for i in range(len(self.scopes) - 1, -1, -1):
+            if name in self.scopes[i]:
+                variable = self.scopes[i][name]
+                if assigned and i < self.scope_base:
+                    self.outer_assigned.add(variable)
+                return variable
+        self.__error('undefined variable "%s"' % name, the_token)
+
+    def __block(self, stmt_list):
+        self.scopes.append({})
+        self.indent += 1
+        start = len(self.lines)
+        for stmt in stmt_list.stmts:
+            stmt.accept(self)
+        if len(self.lines) == start:
+            self.__emit('pass')
+        self.indent -= 1
+        self.scopes.pop()
+
+    # statements
+
+    def visit_stmt_list(self, stmt_list):
+        self.scopes.append({})
+        for stmt in stmt_list.stmts:
+            stmt.accept(self)
+        self.scopes.pop()
+
+    def visit_expr_stmt(self, expr_stmt):
+        self.current_token = ast.first_token(expr_stmt.expr)
+        self.__emit(self.__expr(expr_stmt.expr))
+
+    def visit_var_decl_stmt(self, var_decl):
+        self.current_token = var_decl.var_id
+        expr = self.__expr(var_decl.var_expr)
+        self.__emit('%s = %s' % (self.__declare(var_decl.var_id), expr))
+
+    def visit_assign_stmt(self, assign_stmt):
+        path = assign_stmt.lhs.path
+        self.current_token = path[0]
+        rhs = self.__expr(assign_stmt.rhs)
+        target = self.__lookup(path[0], assigned=len(path) == 1)
+        target = '.'.join([target] + [runtime.field_name(t.lexeme) for t in path[1:]])
+        if len(path) > 1:
+            target = self.__mark(path[0]) + target
+        self.__emit('%s = %s' % (target, rhs))
+
+    def visit_struct_decl_stmt(self, struct_decl):
+        self.current_token = struct_decl.struct_id
+        name = struct_decl.struct_id.lexeme
+        fields = [runtime.field_name(var_decl.var_id.lexeme) for var_decl in struct_decl.var_decls]
+        self.__emit('class %s(object):' % runtime.python_name('S_', name))
+        self.__emit('    __slots__ = %r' % (tuple(fields),))
+        # the constructor evaluates the field initializers in main's scope
+        constructor = runtime.python_name('new_', name)
+        self.structs[name] = constructor
+        self.__emit('def %s():' % constructor)
+        self.__emit('    obj = %s()' % runtime.python_name('S_', name))
+        for field, var_decl in zip(fields, struct_decl.var_decls):
+            self.current_token = var_decl.var_id
+            self.__emit('    obj.%s = %s' % (field, self.__expr(var_decl.var_expr)))
+        self.__emit('    return obj')
+
+    def visit_fun_decl_stmt(self, fun_decl):
+        self.current_token = fun_decl.fun_name
+        self.functions[fun_decl.fun_name.lexeme] = len(fun_decl.params)
+        outer = self.scope_base, self.outer_assigned
+        self.scope_base, self.outer_assigned = len(self.scopes), set()
+        self.scopes.append({})
+        params = [self.__declare(param.param_name) for param in fun_decl.params]
+        self.__emit('def %s(%s):' % (runtime.python_name('fn_', fun_decl.fun_name.lexeme), ', '.join(params)))
+        header = len(self.lines)
+        self.__block(fun_decl.stmt_list)
+        if self.outer_assigned:
+            self.lines.insert(header, '    ' * (self.indent + 1) + 'nonlocal ' + ', '.join(sorted(self.outer_assigned)))
+            self.line_tokens.insert(header, (fun_decl.fun_name, []))
+        self.scopes.pop()
+        self.scope_base, self.outer_assigned = outer
+
+    def visit_return_stmt(self, return_stmt):
+        self.current_token = return_stmt.return_token
+        if return_stmt.return_expr is None or self.outer_assigned is None:
+            # (a top-level return ends the program)
+            if return_stmt.return_expr is not None:
+                self.__emit(self.__expr(return_stmt.return_expr))
+            self.__emit('return')
+        else:
+            self.__emit('return ' + self.__expr(return_stmt.return_expr))
+
+    def visit_while_stmt(self, while_stmt):
+        self.current_token = ast.first_token(while_stmt.bool_expr)
+        self.__emit('while %s:' % self.__expr(while_stmt.bool_expr))
+        self.__block(while_stmt.stmt_list)
+
+    def visit_if_stmt(self, if_stmt):
+        keyword = 'if'
+        for basic_if in [if_stmt.if_part] + if_stmt.elseifs:
+            self.current_token = ast.first_token(basic_if.bool_expr)
+            self.__emit('%s %s:' % (keyword, self.__expr(basic_if.bool_expr)))
+            self.__block(basic_if.stmt_list)
+            keyword = 'elif'
+        if if_stmt.has_else:
+            self.__emit('else:')
+            self.__block(if_stmt.else_stmts)
+
+    # expressions
+
+    def visit_simple_expr(self, simple_expr):
+        simple_expr.term.accept(self)
+
+    def __binary(self, math_rel, first, rest):
+        # + goes through runtime.add: programs aren't type checked, and
+        # a string absorbs the other operand as in the other engines
+        if math_rel.tokentype == token.PLUS:
+            return 'add(%s, %s)' % (first, rest)
+        if math_rel.tokentype == token.DIVIDE:
+            return '%sdivide(%s, %s)' % (self.__mark(math_rel), first, rest)
+        if math_rel.tokentype == token.MODULO:
+            return '%smodulo(%s, %s)' % (self.__mark(math_rel), first, rest)
+        return '(%s %s %s)' % (first, PYTHON_OPS[math_rel.tokentype], rest)
+
+    def visit_complex_expr(self, complex_expr):
+        first = self.__expr(complex_expr.first_operand)
+        rest = self.__expr(complex_expr.rest)
+        self.current_expr = self.__binary(complex_expr.math_rel, first, rest)
+
+    def visit_nary_expr(self, nary_expr):
+        value = self.__expr(nary_expr.operands[0])
+        for math_rel, operand in zip(nary_expr.math_rels, nary_expr.operands[1:]):
+            value = self.__binary(math_rel, value, self.__expr(operand))
+        self.current_expr = value
+
+    def visit_bool_expr(self, bool_expr):
+        value = self.__expr(bool_expr.first_expr)
+        if bool_expr.negated:
+            value = '(not %s)' % value
+        if bool_expr.bool_rel is not None:
+            value = '(%s %s %s)' % (value, PYTHON_OPS[bool_expr.bool_rel.tokentype],
+                                    self.__expr(bool_expr.second_expr))
+        if bool_expr.bool_connector is not None:
+            connector = 'and' if bool_expr.bool_connector.tokentype == token.AND else 'or'
+            value = '(%s %s %s)' % (value, connector, self.__expr(bool_expr.rest))
+        self.current_expr = value
+
+    def visit_simple_rvalue(self, simple_rvalue):
+        self.current_expr = repr(runtime.literal_value(simple_rvalue.val))
+
+    def visit_const_rvalue(self, const_rvalue):
+        self.current_expr = repr(const_rvalue.value)
+
+    def visit_new_rvalue(self, new_rvalue):
+        name = new_rvalue.struct_type.lexeme
+        if name not in self.structs:
+            self.__error('undefined struct "%s"' % name, new_rvalue.struct_type)
+        self.current_expr = self.structs[name] + '()'
+
+    def visit_call_rvalue(self, call_rvalue):
+        fun_token = call_rvalue.fun
+        name = fun_token.lexeme
+        args = ', '.join(self.__expr(arg) for arg in call_rvalue.args)
+        if name in self.functions or (name not in builtin_registry.BUILTINS and self.outer_assigned is not None):
+            # a function declared later (or never) is bound when the
+            # call runs, as in the interpreter
+            arity = self.functions[name] if name in self.functions else self.declared.get(name)
+            if arity is not None and arity != len(call_rvalue.args):
+                self.__error('wrong number of arguments', fun_token)
+            self.current_expr = '%s%s(%s)' % (self.__mark(fun_token), runtime.python_name('fn_', name), args)
+        elif name in builtin_registry.BUILTINS:
+            builtin = builtin_registry.BUILTINS[fun_token.lexeme]
+            builtin_registry.check_arity(builtin, call_rvalue)
+            text = builtin_registry.print_literal(builtin, call_rvalue)
+            if text is not None:
+                # print of a literal, escapes already resolved
+                self.current_expr = 'write(%r)' % text
+            else:
+                self.current_expr = '%s%s(%s)' % (self.__mark(fun_token), runtime.python_name('b_', name), args)
+        else:
+            self.__error('undefined function "%s"' % fun_token.lexeme, fun_token)
+
+    def visit_id_rvalue(self, id_rvalue):
+        path = id_rvalue.path
+        self.current_expr = '.'.join([self.__lookup(path[0])] + [runtime.field_name(t.lexeme) for t in path[1:]])
+        if len(path) > 1:
+            self.current_expr = self.__mark(path[0]) + self.current_expr
+
+
+def transpile(stmt_list):
+    """Returns the Python source of a program and its source map"""
+    return Transpiler().transpile(stmt_list)
+
+
+class PythonEngine(object):
+    """Runs programs as transpiled Python (an execution engine, see
+    mypl.ENGINES)"""
+
+    def __init__(self):
+        self.namespace = {'add': runtime.add, 'divide': runtime.divide,
+                          'modulo': runtime.modulo, 'write': output.write}
+        for name, builtin in builtin_registry.BUILTINS.items():
+            self.namespace[runtime.python_name('b_', name)] = nil_checked(builtin.function)
+
+    def run(self, stmt_list):
+        """Transpiles, compiles and runs a program"""
+        source, source_map = transpile(stmt_list)
+        exec(compile(source, FILENAME, 'exec'), self.namespace)
+        # MyPL calls are Python calls (which don't use the C stack)
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+        try:
+            self.namespace['main']()
+        except tuple(ERROR_MESSAGES) + (runtime.BuiltinError,) as e:
+            the_token = error_token(e.__traceback__, source_map)
+            if the_token is None:
+                raise
+            msg = str(e) if isinstance(e, runtime.BuiltinError) else ERROR_MESSAGES[type(e)].format(the_token.lexeme)
+            runtime.raise_error(msg, the_token)
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def run_stream(self, stmts):
+        """Runs the statements (the generated code needs all of them, so
+        nothing runs before the end of the stream)"""
+        stmt_list = ast.StmtList()
+        stmt_list.stmts = list(stmts)
+        self.run(stmt_list)
+
+
+def error_token(traceback, source_map):
+    """Returns the MyPL token where the innermost generated code in a
+    traceback failed, or None"""
+    failed = None
+    while traceback is not None:
+        if traceback.tb_frame.f_code.co_filename == FILENAME:
+            failed = traceback
+        traceback = traceback.tb_next
+    if failed is None:
+        return None
+    the_token, marks = source_map[failed.tb_lineno - 1]
+    # the column of the failed instruction picks the closest mark before it
+    positions = list(failed.tb_frame.f_code.co_positions())[failed.tb_lasti // 2]
+    column = positions[2]
+    if column is not None:
+        for mark_column, mark_token in marks:
+            if mark_column <= column:
+                the_token = mark_token
+    return the_token
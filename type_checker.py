@@ -8,6 +8,7 @@ import token
 import ast
 import error
 import symbol_table
+import builtin_registry
 
 class TypeChecker(ast.Visitor):
     """A MyPL type checker visitor implementation where struct types
@@ -24,28 +25,13 @@ class TypeChecker(ast.Visitor):
         # set global return type to int
         self.sym_table.add_id('return')
         self.sym_table.set_info('return', token.INTTYPE)
-        # load in built-in function types
-        self.sym_table.add_id('print')
-        self.sym_table.set_info('print', [[token.STRINGTYPE], token.NIL])
-        self.sym_table.add_id('length')
-        self.sym_table.set_info('length', [[token.STRINGTYPE], token.INTTYPE])
-        self.sym_table.add_id('get')
-        self.sym_table.set_info('get', [[token.INTTYPE, token.STRINGTYPE], token.STRINGTYPE])
-        self.sym_table.add_id('reads')
-        self.sym_table.set_info('reads', [[token.NIL], token.STRINGTYPE])
-        self.sym_table.add_id('readi')
-        self.sym_table.set_info('readi', [[token.NIL], token.INTTYPE])
-        self.sym_table.add_id('readf')
-        self.sym_table.set_info('readf', [[token.NIL], token.FLOATTYPE])   
-        self.sym_table.add_id('itos')
-        self.sym_table.set_info('itos', [[token.INTTYPE], token.STRINGTYPE])   
-        self.sym_table.add_id('itof')
-        self.sym_table.set_info('itof', [[token.INTTYPE], token.FLOATTYPE])
-        self.sym_table.add_id('ftos')
-        self.sym_table.set_info('ftos', [[token.FLOATTYPE], token.STRINGTYPE])
+        # load in built-in function types (no parameters is [nil])
+        for name, builtin in builtin_registry.BUILTINS.items():
+            self.sym_table.add_id(name)
+            self.sym_table.set_info(name, [list(builtin.param_types) or [token.NIL], builtin.return_type])
 
     def __error(self, msg, the_token):
-        raise error.MyPLError(msg, the_token.line, the_token.column)
+        raise error.MyPLError(msg, the_token.line, the_token.column, the_token.snippet())
 
     def visit_stmt_list(self, stmt_list):
         # add new block (scope)
@@ -125,29 +111,41 @@ class TypeChecker(ast.Visitor):
         ltype = self.current_type
         complex_expr.rest.accept(self)
         rtype = self.current_type
+        self.__math_type(complex_expr.math_rel, ltype, rtype)
+
+    def visit_nary_expr(self, nary_expr):
+        operands = nary_expr.operands
+        operands[0].accept(self)
+        for i, math_rel in enumerate(nary_expr.math_rels):
+            ltype = self.current_type
+            operands[i + 1].accept(self)
+            self.__math_type(math_rel, ltype, self.current_type)
+
+    def __math_type(self, math_rel, ltype, rtype):
+        """Sets current_type to the type of ltype math_rel rtype"""
         if ltype == rtype:
             # type inference rule 2
-            if complex_expr.math_rel.tokentype == token.PLUS:
+            if math_rel.tokentype == token.PLUS:
                 if ltype in [token.STRINGVAL, token.INTVAL, token.FLOATVAL]:
                     self.current_type = ltype
                 else:
-                    self.__error('cannot evaluate expression on these types', complex_expr.math_rel)
+                    self.__error('cannot evaluate expression on these types', math_rel)
 
             # type inference rules 3,4,5
-            elif complex_expr.math_rel.tokentype in [token.MINUS, token.MULTIPLY,   token.DIVIDE]:
+            elif math_rel.tokentype in [token.MINUS, token.MULTIPLY,   token.DIVIDE]:
                 if ltype in [token.INTVAL, token.FLOATVAL]:
                     self.current_type = ltype
                 else:
-                    self.__error('cannot evaluate expression on these types',   complex_expr.math_rel)
+                    self.__error('cannot evaluate expression on these types',   math_rel)
 
             # type inference rule 6
-            elif complex_expr.math_rel.tokentype == token.MODULO:
+            elif math_rel.tokentype == token.MODULO:
                 if ltype == token.INTVAL:
                     self.current_type = ltype
                 else:
-                    self.__error('cannot evaluate expression on these types',   complex_expr.math_rel)
+                    self.__error('cannot evaluate expression on these types',   math_rel)
         else:
-            self.__error('complex expr type error', complex_expr.math_rel)
+            self.__error('complex expr type error', math_rel)
 
     def visit_bool_expr(self, bool_expr):
         bool_expr.first_expr.accept(self)
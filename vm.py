@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+#
+# Author: Luke Hartman
+# Description:
+#   MyPL stack machine. Runs the bytecode from bytecode.py: a single
+#   dispatch loop over the instruction list, with an explicit stack of
+#   call frames (MyPL calls don't nest Python calls).
+#----------------------------------------------------------------------
+import error
+import bytecode
+from bytecode import (
+    LOAD_CONST, LOAD_LOCAL, STORE_LOCAL, LOAD_GLOBAL, STORE_GLOBAL,
+    LOAD_FIELD, STORE_FIELD, INIT_FIELD, NEW, ADD, SUB, MUL, DIV, MOD,
+    EQ, NE, LT, LE, GT, GE, NOT, JUMP, JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP,
+    JUMP_IF_TRUE_OR_POP, CALL, CALL_BUILTIN, RETURN, POP, DECLARE, CHECK_CALL,
+)
+from runtime import BuiltinError, divide, modulo
+
+class VM(object):
+    """A MyPL virtual machine (an execution engine, see mypl.ENGINES)"""
+
+    def __init__(self):
+        self.compiler = bytecode.Compiler()
+        self.globals = []
+
+    def __error(self, msg, code, pc):
+        the_token = code.tokens[pc]
+        raise error.MyPLError(msg, the_token.line, the_token.column, the_token.snippet())
+
+    def run(self, stmt_list):
+        """Compiles and runs a program"""
+        self.execute(self.compiler.compile(stmt_list))
+
+    def run_stream(self, stmts):
+        """Compiles and runs top-level statements as they arrive (see
+        Interpreter.run_stream)"""
+        program = self.compiler.program
+        for stmt in stmts:
+            start = self.compiler.compile_stmt(stmt)
+            # stop at a return, unless it is the one ending the program
+            if self.execute(program, start) != len(program.ops):
+                return
+
+    def execute(self, program, pc=0):
+        """Runs the program from pc until it returns, returns the pc
+        after its return instruction"""
+        globals_ = self.globals
+        globals_.extend([None] * (program.nlocals - len(globals_)))
+        code = program
+        ops = code.ops
+        consts = code.consts
+        locals_ = globals_
+        frames = []             # [(code, ops, consts, pc, locals)] of the callers
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        try:
+            while True:
+                op = ops[pc]
+                arg = ops[pc + 1]
+                pc += 2
+                if op == LOAD_LOCAL:
+                    push(locals_[arg])
+                elif op == LOAD_CONST:
+                    push(consts[arg])
+                elif op == STORE_LOCAL:
+                    locals_[arg] = pop()
+                elif op == JUMP_IF_FALSE:
+                    if not pop():
+                        pc = arg
+                elif op == ADD:
+                    y = pop()
+                    x = stack[-1]
+                    # strings absorb the other operand (as in the interpreter)
+                    if type(x) is str or type(y) is str:
+                        stack[-1] = str(x) + str(y)
+                    else:
+                        stack[-1] = x + y
+                elif op == JUMP:
+                    pc = arg
+                elif op == LT:
+                    y = pop()
+                    stack[-1] = stack[-1] < y
+                elif op == SUB:
+                    y = pop()
+                    stack[-1] = stack[-1] - y
+                elif op == MUL:
+                    y = pop()
+                    stack[-1] = stack[-1] * y
+                elif op == MOD:
+                    y = pop()
+                    stack[-1] = modulo(stack[-1], y)
+                elif op == EQ:
+                    y = pop()
+                    stack[-1] = stack[-1] == y
+                elif op == CALL_BUILTIN:
+                    builtin, count = consts[arg]
+                    if count:
+                        args = stack[-count:]
+                        del stack[-count:]
+                        if None in args:
+                            self.__error('bad value: should not be nil', code, pc - 2)
+                        push(builtin(*args))
+                    else:
+                        push(builtin())
+                elif op == POP:
+                    pop()
+                elif op == LOAD_GLOBAL:
+                    push(globals_[arg])
+                elif op == STORE_GLOBAL:
+                    globals_[arg] = pop()
+                elif op == LOAD_FIELD:
+                    stack[-1] = getattr(stack[-1], consts[arg])
+                elif op == CALL:
+                    callee = consts[arg].code
+                    count = callee.nparams
+                    if count:
+                        new_locals = stack[-count:]
+                        del stack[-count:]
+                    else:
+                        new_locals = []
+                    if callee.nlocals > count:
+                        new_locals.extend([None] * (callee.nlocals - count))
+                    frames.append((code, ops, consts, pc, locals_))
+                    code = callee
+                    ops = code.ops
+                    consts = code.consts
+                    locals_ = new_locals
+                    pc = 0
+                elif op == RETURN:
+                    # the return value stays on the stack for the caller
+                    if not frames:
+                        return pc
+                    code, ops, consts, pc, locals_ = frames.pop()
+                elif op == LE:
+                    y = pop()
+                    stack[-1] = stack[-1] <= y
+                elif op == GT:
+                    y = pop()
+                    stack[-1] = stack[-1] > y
+                elif op == GE:
+                    y = pop()
+                    stack[-1] = stack[-1] >= y
+                elif op == NE:
+                    y = pop()
+                    stack[-1] = stack[-1] != y
+                elif op == DIV:
+                    y = pop()
+                    stack[-1] = divide(stack[-1], y)
+                elif op == NOT:
+                    stack[-1] = not stack[-1]
+                elif op == JUMP_IF_FALSE_OR_POP:
+                    if stack[-1]:
+                        pop()
+                    else:
+                        pc = arg
+                elif op == JUMP_IF_TRUE_OR_POP:
+                    if stack[-1]:
+                        pc = arg
+                    else:
+                        pop()
+                elif op == STORE_FIELD:
+                    obj = pop()
+                    setattr(obj, consts[arg], pop())
+                elif op == INIT_FIELD:
+                    value = pop()
+                    setattr(stack[-1], consts[arg], value)
+                elif op == NEW:
+                    push(consts[arg]())
+                elif op == CHECK_CALL:
+                    function, count = consts[arg]
+                    if not function.declared:
+                        self.__error('undefined function "%s"' % function.name, code, pc - 2)
+                    if count != function.arity:
+                        self.__error('wrong number of arguments', code, pc - 2)
+                elif op == DECLARE:
+                    consts[arg].declared = True
+                else:
+                    raise ValueError('bad opcode %d at %d' % (op, pc - 2))
+        except AttributeError:
+            self.__error('bad path: nil value or unknown field', code, pc - 2)
+        except BuiltinError as e:
+            self.__error(str(e), code, pc - 2)